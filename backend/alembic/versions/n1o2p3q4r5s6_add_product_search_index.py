@@ -0,0 +1,110 @@
+"""add_product_search_index
+
+Revision ID: n1o2p3q4r5s6
+Revises: 68197b075a41
+Create Date: 2026-10-17 10:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'n1o2p3q4r5s6'
+down_revision: Union[str, None] = '68197b075a41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add precomputed search columns (name_lower, search_tokens, search_vector) to products"""
+    op.execute('CREATE EXTENSION IF NOT EXISTS "pg_trgm"')
+    # Конфигурация FTS, которую использует routers/search.py
+    op.execute(
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'russian_simple') THEN
+                CREATE TEXT SEARCH CONFIGURATION russian_simple (COPY = simple);
+            END IF;
+        END
+        $$;
+        """
+    )
+
+    op.add_column('products', sa.Column('name_lower', sa.String(255), nullable=True))
+    op.add_column('products', sa.Column('search_tokens', postgresql.ARRAY(sa.Text()), nullable=True))
+
+    # Старый триггер заполнял search_vector конфигурацией 'russian' по четырём колонкам,
+    # поиск его не использовал. Теперь search_vector поддерживает импорт CSV.
+    op.execute("DROP TRIGGER IF EXISTS tsvectorupdate_products ON products")
+    op.execute("DROP FUNCTION IF EXISTS products_search_vector_update()")
+
+    # Первичное заполнение — то же правило, что services.search_index.normalize_search_text
+    op.execute(
+        r"""
+        UPDATE products
+        SET name_lower = btrim(regexp_replace(replace(lower(name), 'ё', 'е'), '\s+', ' ', 'g'))
+        """
+    )
+    op.execute(
+        """
+        UPDATE products
+        SET
+            search_tokens = ARRAY(
+                SELECT DISTINCT t
+                FROM unnest(regexp_split_to_array(name_lower, '[^[:alnum:]_]+')) AS t
+                WHERE t <> ''
+            ),
+            search_vector = to_tsvector('russian_simple', name_lower)
+        """
+    )
+
+    op.create_index(
+        'idx_product_name_lower_trgm',
+        'products',
+        ['name_lower'],
+        postgresql_using='gin',
+        postgresql_ops={'name_lower': 'gin_trgm_ops'},
+    )
+    op.create_index(
+        'idx_product_name_lower_pattern',
+        'products',
+        ['name_lower'],
+        postgresql_ops={'name_lower': 'text_pattern_ops'},
+    )
+    op.create_index(
+        'idx_product_search_tokens', 'products', ['search_tokens'], postgresql_using='gin'
+    )
+
+
+def downgrade() -> None:
+    """Remove precomputed search columns and restore the legacy search_vector trigger"""
+    op.drop_index('idx_product_search_tokens', table_name='products')
+    op.drop_index('idx_product_name_lower_pattern', table_name='products')
+    op.drop_index('idx_product_name_lower_trgm', table_name='products')
+    op.drop_column('products', 'search_tokens')
+    op.drop_column('products', 'name_lower')
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION products_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector :=
+                setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A') ||
+                setweight(to_tsvector('russian', coalesce(NEW.manufacturer, '')), 'B') ||
+                setweight(to_tsvector('russian', coalesce(NEW.form, '')), 'C') ||
+                setweight(to_tsvector('russian', coalesce(NEW.distributor, '')), 'D');
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER tsvectorupdate_products BEFORE INSERT OR UPDATE
+        ON products FOR EACH ROW EXECUTE FUNCTION products_search_vector_update();
+        """
+    )
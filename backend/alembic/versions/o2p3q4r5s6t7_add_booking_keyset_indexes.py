@@ -0,0 +1,36 @@
+"""add_booking_keyset_indexes
+
+Revision ID: o2p3q4r5s6t7
+Revises: n1o2p3q4r5s6
+Create Date: 2026-10-17 12:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'o2p3q4r5s6t7'
+down_revision: Union[str, None] = 'n1o2p3q4r5s6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Composite (created_at, uuid) indexes for keyset pagination of booking orders"""
+    op.create_index(
+        'idx_booking_created_uuid', 'booking_orders', ['created_at', 'uuid']
+    )
+    op.create_index(
+        'idx_booking_pharmacy_created_uuid',
+        'booking_orders',
+        ['pharmacy_id', 'created_at', 'uuid'],
+    )
+    # Покрывается idx_booking_created_uuid
+    op.drop_index('idx_booking_created', table_name='booking_orders')
+
+
+def downgrade() -> None:
+    op.create_index('idx_booking_created', 'booking_orders', ['created_at'])
+    op.drop_index('idx_booking_pharmacy_created_uuid', table_name='booking_orders')
+    op.drop_index('idx_booking_created_uuid', table_name='booking_orders')
@@ -0,0 +1,108 @@
+"""add_product_groups
+
+Revision ID: p3q4r5s6t7u8
+Revises: o2p3q4r5s6t7
+Create Date: 2026-10-17 14:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'p3q4r5s6t7u8'
+down_revision: Union[str, None] = 'o2p3q4r5s6t7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add product_groups aggregate table (per city and global) for search combinations"""
+    op.create_table(
+        'product_groups',
+        sa.Column('scope', sa.String(255), nullable=False),
+        sa.Column('name', sa.String(255), nullable=False),
+        sa.Column('form', sa.String(255), nullable=False),
+        sa.Column('manufacturer', sa.String(255), nullable=False),
+        sa.Column('country', sa.String(255), nullable=False),
+        sa.Column('name_lower', sa.String(255), nullable=True),
+        sa.Column('search_tokens', postgresql.ARRAY(sa.Text()), nullable=True),
+        sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True),
+        sa.Column('product_count', sa.Integer(), nullable=False),
+        sa.Column('quantity_sum', sa.Numeric(14, 3), nullable=False),
+        sa.Column('min_price', sa.Numeric(12, 2), nullable=True),
+        sa.Column('max_price', sa.Numeric(12, 2), nullable=True),
+        sa.Column('pharmacy_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('scope', 'name', 'form', 'manufacturer', 'country'),
+    )
+
+    # Первичное заполнение — тот же агрегат, что services.product_groups
+    op.execute(
+        """
+        INSERT INTO product_groups (
+            scope, name, form, manufacturer, country,
+            name_lower, search_tokens, search_vector,
+            product_count, quantity_sum, min_price, max_price, pharmacy_count
+        )
+        SELECT
+            a.scope, a.name, a.form, a.manufacturer, a.country,
+            a.name_lower,
+            ARRAY(
+                SELECT DISTINCT t
+                FROM unnest(regexp_split_to_array(a.name_lower, '[^[:alnum:]_]+')) AS t
+                WHERE t <> ''
+            ),
+            to_tsvector('russian_simple', coalesce(a.name_lower, '')),
+            a.product_count, a.quantity_sum, a.min_price, a.max_price, a.pharmacy_count
+        FROM (
+            SELECT
+                CASE WHEN GROUPING(coalesce(ph.city, '')) = 1 THEN '*'
+                     ELSE coalesce(ph.city, '') END AS scope,
+                p.name, p.form, p.manufacturer, p.country,
+                min(p.name_lower) AS name_lower,
+                count(*) AS product_count,
+                sum(p.quantity) AS quantity_sum,
+                min(p.price) AS min_price,
+                max(p.price) AS max_price,
+                count(DISTINCT p.pharmacy_id) AS pharmacy_count
+            FROM products p
+            JOIN pharmacies ph ON ph.uuid = p.pharmacy_id
+            GROUP BY GROUPING SETS (
+                (coalesce(ph.city, ''), p.name, p.form, p.manufacturer, p.country),
+                (p.name, p.form, p.manufacturer, p.country)
+            )
+        ) AS a
+        """
+    )
+
+    op.create_index(
+        'idx_product_group_name_lower_trgm',
+        'product_groups',
+        ['name_lower'],
+        postgresql_using='gin',
+        postgresql_ops={'name_lower': 'gin_trgm_ops'},
+    )
+    op.create_index(
+        'idx_product_group_name_lower_pattern',
+        'product_groups',
+        ['name_lower'],
+        postgresql_ops={'name_lower': 'text_pattern_ops'},
+    )
+    op.create_index(
+        'idx_product_group_search_vector',
+        'product_groups',
+        ['search_vector'],
+        postgresql_using='gin',
+    )
+    op.create_index(
+        'idx_product_group_search_tokens',
+        'product_groups',
+        ['search_tokens'],
+        postgresql_using='gin',
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('product_groups')
@@ -0,0 +1,27 @@
+"""add_product_payload_hash
+
+Revision ID: q4r5s6t7u8v9
+Revises: p3q4r5s6t7u8
+Create Date: 2026-10-17 15:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'q4r5s6t7u8v9'
+down_revision: Union[str, None] = 'p3q4r5s6t7u8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add payload_hash to products for skipping unchanged rows on CSV import"""
+    # Без backfill: строки с NULL перезапишутся (и получат хэш) при следующем импорте
+    op.add_column('products', sa.Column('payload_hash', sa.String(32), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('products', 'payload_hash')
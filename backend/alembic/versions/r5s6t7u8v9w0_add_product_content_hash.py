@@ -0,0 +1,42 @@
+"""add_product_content_hash
+
+Revision ID: r5s6t7u8v9w0
+Revises: q4r5s6t7u8v9
+Create Date: 2026-10-17 16:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'r5s6t7u8v9w0'
+down_revision: Union[str, None] = 'q4r5s6t7u8v9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add persisted content_hash to products for CSV import matching"""
+    op.add_column('products', sa.Column('content_hash', sa.String(32), nullable=True))
+
+    # Копия tasks_increment.CONTENT_HASH_SQL на момент миграции
+    # (совпадение сверяет tests/test_csv_import.py)
+    op.execute(
+        """
+        UPDATE products p SET content_hash = md5(concat_ws('|', p.name, p.form, p.serial,
+            to_char(p.expiry_date, 'YYYY-MM-DD'), p.manufacturer, p.country))
+        """
+    )
+
+    op.create_index(
+        'idx_product_pharmacy_content_hash',
+        'products',
+        ['pharmacy_id', 'content_hash'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_product_pharmacy_content_hash', table_name='products')
+    op.drop_column('products', 'content_hash')
@@ -0,0 +1,29 @@
+"""add_qa_questions_user_status_index
+
+Revision ID: s6t7u8v9w0x1
+Revises: r5s6t7u8v9w0
+Create Date: 2026-10-18 10:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 's6t7u8v9w0x1'
+down_revision: Union[str, None] = 'r5s6t7u8v9w0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Index for per-user consultation stats and listings"""
+    op.create_index(
+        'idx_qa_questions_user_status',
+        'qa_questions',
+        ['user_id', 'status'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_qa_questions_user_status', table_name='qa_questions')
@@ -0,0 +1,160 @@
+"""partition_audit_logs
+
+Revision ID: t7u8v9w0x1y2
+Revises: s6t7u8v9w0x1
+Create Date: 2026-10-19 10:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 't7u8v9w0x1y2'
+down_revision: Union[str, None] = 's6t7u8v9w0x1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+AUDIT_INDEXES = {
+    'idx_audit_user_id': ['user_id'],
+    'idx_audit_action': ['action'],
+    'idx_audit_resource': ['resource_type', 'resource_id'],
+    'idx_audit_created_at': ['created_at'],
+}
+
+# Создаёт месячную партицию audit_logs_YYYY_MM, если её нет. Строки этого
+# месяца, попавшие в audit_logs_default, переносятся в новую партицию.
+ENSURE_PARTITION_FUNCTION = """
+CREATE OR REPLACE FUNCTION ensure_audit_log_partition(p_month date)
+RETURNS void AS $$
+DECLARE
+    start_ts timestamp := date_trunc('month', p_month);
+    end_ts timestamp := date_trunc('month', p_month) + interval '1 month';
+    part text := 'audit_logs_' || to_char(p_month, 'YYYY_MM');
+BEGIN
+    IF to_regclass(part) IS NOT NULL THEN
+        RETURN;
+    END IF;
+    EXECUTE format(
+        'CREATE TABLE %I (LIKE audit_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+        part
+    );
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM audit_logs_default '
+        'WHERE created_at >= %L AND created_at < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        start_ts, end_ts, part
+    );
+    EXECUTE format(
+        'ALTER TABLE audit_logs ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        part, start_ts, end_ts
+    );
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def _create_audit_indexes(table: str) -> None:
+    for name, columns in AUDIT_INDEXES.items():
+        op.create_index(name, table, columns)
+
+
+def _drop_audit_indexes(table: str) -> None:
+    for name in AUDIT_INDEXES:
+        op.drop_index(name, table_name=table)
+
+
+def upgrade() -> None:
+    """Monthly range partitions for audit_logs and a daily rollup for stats"""
+    op.rename_table('audit_logs', 'audit_logs_legacy')
+    _drop_audit_indexes('audit_logs_legacy')
+
+    # Ключ партиционирования обязан входить в первичный ключ
+    op.create_table(
+        'audit_logs',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('user_type', sa.String(20), nullable=False),
+        sa.Column('action', sa.String(50), nullable=False),
+        sa.Column('resource_type', sa.String(50), nullable=False),
+        sa.Column('resource_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('ip_address', sa.String(45), nullable=True),
+        sa.Column('user_agent', sa.String(500), nullable=True),
+        sa.Column('request_method', sa.String(10), nullable=True),
+        sa.Column('endpoint', sa.String(255), nullable=True),
+        sa.Column('status_code', sa.String(3), nullable=True),
+        sa.Column('success', sa.Boolean, default=True),
+        sa.Column('details', postgresql.JSON(astext_type=sa.Text()), nullable=True),
+        sa.Column('created_at', sa.DateTime, nullable=False),
+        sa.PrimaryKeyConstraint('id', 'created_at'),
+        postgresql_partition_by='RANGE (created_at)',
+    )
+    _create_audit_indexes('audit_logs')
+    # Страховка: строки за месяц без партиции не теряются
+    op.execute('CREATE TABLE audit_logs_default PARTITION OF audit_logs DEFAULT')
+    op.execute(ENSURE_PARTITION_FUNCTION)
+    op.execute(
+        """
+        SELECT ensure_audit_log_partition(month::date)
+        FROM generate_series(
+            date_trunc('month', coalesce((SELECT min(created_at) FROM audit_logs_legacy), now())),
+            date_trunc('month', now()) + interval '2 months',
+            interval '1 month'
+        ) AS month
+        """
+    )
+    op.execute('INSERT INTO audit_logs SELECT * FROM audit_logs_legacy')
+    op.drop_table('audit_logs_legacy')
+
+    op.create_table(
+        'audit_log_daily_stats',
+        sa.Column('id', sa.BigInteger, sa.Identity(), primary_key=True),
+        sa.Column('day', sa.Date, nullable=False),
+        sa.Column('action', sa.String(50), nullable=False),
+        sa.Column('resource_type', sa.String(50), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('user_type', sa.String(20), nullable=False),
+        sa.Column('events', sa.BigInteger, nullable=False),
+    )
+    op.create_index('idx_audit_daily_stats_day', 'audit_log_daily_stats', ['day'])
+    op.execute(
+        """
+        INSERT INTO audit_log_daily_stats (day, action, resource_type, user_id, user_type, events)
+        SELECT created_at::date, action, resource_type, user_id, user_type, count(*)
+        FROM audit_logs
+        WHERE created_at < date_trunc('day', now())
+        GROUP BY 1, 2, 3, 4, 5
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_audit_daily_stats_day', table_name='audit_log_daily_stats')
+    op.drop_table('audit_log_daily_stats')
+
+    op.rename_table('audit_logs', 'audit_logs_partitioned')
+    _drop_audit_indexes('audit_logs_partitioned')
+    op.create_table(
+        'audit_logs',
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('user_type', sa.String(20), nullable=False),
+        sa.Column('action', sa.String(50), nullable=False),
+        sa.Column('resource_type', sa.String(50), nullable=False),
+        sa.Column('resource_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('ip_address', sa.String(45), nullable=True),
+        sa.Column('user_agent', sa.String(500), nullable=True),
+        sa.Column('request_method', sa.String(10), nullable=True),
+        sa.Column('endpoint', sa.String(255), nullable=True),
+        sa.Column('status_code', sa.String(3), nullable=True),
+        sa.Column('success', sa.Boolean, default=True),
+        sa.Column('details', postgresql.JSON(astext_type=sa.Text()), nullable=True),
+        sa.Column('created_at', sa.DateTime, nullable=False),
+    )
+    op.execute('INSERT INTO audit_logs SELECT * FROM audit_logs_partitioned')
+    # Партиции удаляются вместе с родительской таблицей
+    op.drop_table('audit_logs_partitioned')
+    op.execute('DROP FUNCTION IF EXISTS ensure_audit_log_partition(date)')
+    _create_audit_indexes('audit_logs')
@@ -5,5 +5,11 @@ set -e
 
 echo "✅ Skipping Alembic migrations (handled by backend service)"
 
+# Prometheus multiprocess: файлы метрик прошлого запуска не должны попасть в сумму
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 # Запускаем основную команду (переданную через CMD)
 exec "$@"
@@ -11,10 +11,11 @@ import logging
 from db.qa_models import User, Question, Pharmacist
 from utils.time_utils import get_utc_now_naive
 from bot.services.notification_service import notify_pharmacists_about_new_question
-from routers.pharmacist_dashboard import ws_manager, create_message_data
+from routers.pharmacist_dashboard import create_message_data, publish_to_redis
 from bot.handlers.qa_states import UserQAStates, QAStates
 from bot.handlers.registration import RegistrationStates
 from bot.services.dialog_service import DialogService
+from services.identity_cache import ensure_loaded
 from bot.keyboards.qa_keyboard import make_user_dialog_keyboard_with_end
 
 logger = logging.getLogger(__name__)
@@ -72,6 +73,7 @@ async def send_user_message_to_pharmacist(
             await message.answer("❌ Фармацевт не найден для этого диалога.")
             return False
 
+        await ensure_loaded(db, user, "first_name", "last_name")
         user_name = user.first_name or "Пользователь"
         if user.last_name:
             user_name = f"{user.first_name} {user.last_name}"
@@ -142,9 +144,12 @@ async def send_user_message_to_pharmacist(
         # WebSocket broadcast to pharmacist WebView
         try:
             message_data = create_message_data(new_message)
-            await ws_manager.broadcast_message_update(
-                question_id=str(question.uuid),
-                message_data=message_data,
+            await publish_to_redis(
+                {
+                    "type": "message_update",
+                    "question_id": str(question.uuid),
+                    "message_data": message_data,
+                }
             )
             logger.info(f"WebSocket broadcast sent for user message to {question.uuid}")
         except Exception as e:
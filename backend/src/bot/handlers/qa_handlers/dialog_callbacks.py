@@ -15,6 +15,7 @@ from db.qa_models import User, Pharmacist, Question, Answer
 from bot.handlers.qa_states import QAStates
 from bot.keyboards.qa_keyboard import make_pharmacist_dialog_keyboard
 from bot.services.dialog_service import DialogService
+from services.identity_cache import ensure_loaded
 from bot.services.assignment_service import QuestionAssignmentService
 
 logger = logging.getLogger(__name__)
@@ -112,6 +113,7 @@ async def view_dialog_callback(
         messages = await DialogService.get_dialog_history(question.uuid, db, limit=5)
 
         if is_pharmacist:
+            await ensure_loaded(db, question.user, "first_name", "last_name")
             user_info = f"{question.user.first_name or 'Пользователь'}"
             if question.user.last_name:
                 user_info = f"{question.user.first_name} {question.user.last_name}"
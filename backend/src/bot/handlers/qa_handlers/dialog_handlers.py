@@ -96,7 +96,6 @@ async def handle_pharmacist_text_in_dialog(
         # WebSocket broadcast to pharmacist dashboard
         try:
             from routers.pharmacist_dashboard import (
-                ws_manager,
                 publish_to_redis,
                 create_message_data,
             )
@@ -106,7 +105,6 @@ async def handle_pharmacist_text_in_dialog(
                 "question_id": str(question.uuid),
                 "message_data": message_data,
             }
-            await ws_manager.broadcast_message_update(**ws_msg_data)
             await publish_to_redis({"type": "message_update", **ws_msg_data})
             logger.info(
                 f"WebSocket broadcast sent for Telegram answer to {question.uuid}"
@@ -278,7 +276,6 @@ async def process_answer_text(
         # WebSocket broadcast to pharmacist dashboard
         try:
             from routers.pharmacist_dashboard import (
-                ws_manager,
                 publish_to_redis,
                 create_message_data,
             )
@@ -288,7 +285,6 @@ async def process_answer_text(
                 "question_id": str(question.uuid),
                 "message_data": message_data,
             }
-            await ws_manager.broadcast_message_update(**ws_msg_data)
             await publish_to_redis({"type": "message_update", **ws_msg_data})
             logger.info(
                 f"WebSocket broadcast sent for Telegram answer to {question.uuid}"
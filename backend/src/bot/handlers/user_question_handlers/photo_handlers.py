@@ -21,6 +21,7 @@ from sqlalchemy.orm import selectinload
 from db.qa_models import User, Question, Answer, Pharmacist
 from bot.handlers.qa_states import UserQAStates
 from bot.services.dialog_service import DialogService
+from services.identity_cache import ensure_loaded
 from utils.time_utils import get_utc_now_naive
 
 logger = logging.getLogger(__name__)
@@ -406,6 +407,7 @@ async def finish_photo_upload(
         )
         pharmacist = result.scalar_one_or_none()
 
+        await ensure_loaded(db, user, "first_name", "last_name")
         user_name = user.first_name or "Пользователь"
         if user.last_name:
             user_name = f"{user.first_name} {user.last_name}"
@@ -527,6 +529,7 @@ async def confirm_send_photos_callback(
         )
         pharmacist = result.scalar_one_or_none()
 
+        await ensure_loaded(db, user, "first_name", "last_name")
         user_name = user.first_name or "Пользователь"
         if user.last_name:
             user_name = f"{user.first_name} {user.last_name}"
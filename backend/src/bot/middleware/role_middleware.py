@@ -1,12 +1,13 @@
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery, Update, Poll
-from typing import Callable, Dict, Any, Awaitable, Union, Optional
+from typing import Callable, Dict, Any, Awaitable, Union, Optional, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 import logging
 
 from db.qa_models import Pharmacist, User
+from services.identity_cache import load_identity, store_identity
 from services.user_service import get_or_create_user
 
 logger = logging.getLogger(__name__)
@@ -15,18 +16,35 @@ logger = logging.getLogger(__name__)
 async def get_pharmacist_by_telegram_id(
     telegram_id: int, db: AsyncSession
 ) -> Optional[Pharmacist]:
+    result = await db.execute(
+        select(Pharmacist)
+        .join(User, Pharmacist.user_id == User.uuid)
+        .options(selectinload(Pharmacist.user))
+        .where(User.telegram_id == telegram_id)
+        .where(Pharmacist.is_active == True)
+    )
+    return result.scalars().one_or_none()
+
+
+async def resolve_identity(
+    telegram_id: int, db: AsyncSession
+) -> Tuple[Optional[User], Optional[Pharmacist]]:
+    """Пользователь и активный фармацевт: из кэша без запросов, иначе из БД."""
+    identity = await load_identity(db, telegram_id)
+    if identity is not None:
+        return identity
+
+    user = await get_or_create_user(db, telegram_id=telegram_id)
+    if not user:
+        return None, None
     try:
-        result = await db.execute(
-            select(Pharmacist)
-            .join(User, Pharmacist.user_id == User.uuid)
-            .options(selectinload(Pharmacist.user))
-            .where(User.telegram_id == telegram_id)
-            .where(Pharmacist.is_active == True)
-        )
-        return result.scalars().one_or_none()
+        pharmacist = await get_pharmacist_by_telegram_id(telegram_id, db)
     except Exception:
+        # Ошибку не кэшируем: следующий апдейт снова пойдёт в БД
         logger.exception("Error getting pharmacist by telegram_id %s", telegram_id)
-        return None
+        return user, None
+    await store_identity(telegram_id, user, pharmacist)
+    return user, pharmacist
 
 
 class RoleMiddleware(BaseMiddleware):
@@ -89,8 +107,7 @@ class RoleMiddleware(BaseMiddleware):
         logger.debug(f"RoleMiddleware processing user {user_id}")
 
         try:
-            user = await get_or_create_user(db, telegram_id=user_id)
-            pharmacist = await get_pharmacist_by_telegram_id(user_id, db)
+            user, pharmacist = await resolve_identity(user_id, db)
         except Exception as e:
             logger.error(
                 f"Error in role middleware user processing for {user_id}: {e}",
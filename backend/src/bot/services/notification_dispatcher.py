@@ -0,0 +1,295 @@
+"""Фоновая отправка уведомлений фармацевтам в Telegram.
+
+Раньше notify_* вызывали bot.send_message по очереди для каждого
+фармацевта прямо в запросе/хендлере: время ответа росло с числом
+сотрудников, а 429 от Telegram обрывал цикл. Теперь они только кладут
+сообщения в очередь процесса и сразу возвращаются, а отправляют их
+NOTIFY_CONCURRENCY фоновых задач:
+
+- общий token bucket — не больше TELEGRAM_NOTIFY_RATE сообщений в секунду
+  (лимит Telegram ~30/с на бота; счётчик на процесс, в проде один worker);
+- не чаще одного сообщения в чат раз в TELEGRAM_NOTIFY_CHAT_INTERVAL секунд;
+- 429 (TelegramRetryAfter) приостанавливает всю отправку на retry_after и
+  повторяет сообщение; сетевые ошибки и 5xx повторяются с backoff, не больше
+  NOTIFY_MAX_ATTEMPTS попыток; 400/403 (бот заблокирован) не повторяются;
+- один текст на много чатов хранится один раз, а повтор того же текста в
+  чат, куда он ещё не ушёл, отбрасывается.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from aiogram.exceptions import (
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from prometheus_client import Counter, Gauge, Histogram
+
+from bot.core import bot_manager
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_NOTIFY_RATE = float(os.getenv("TELEGRAM_NOTIFY_RATE", "25"))
+TELEGRAM_NOTIFY_CHAT_INTERVAL = float(os.getenv("TELEGRAM_NOTIFY_CHAT_INTERVAL", "1.0"))
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "8"))
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "10000"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+NOTIFY_SHUTDOWN_TIMEOUT = float(os.getenv("NOTIFY_SHUTDOWN_TIMEOUT", "8"))
+
+NOTIFICATIONS = Counter(
+    "telegram_notifications_total",
+    "Telegram notifications by outcome "
+    "(queued, deduplicated, sent, retried, rate_limited, failed, dropped)",
+    ["outcome"],
+)
+NOTIFY_QUEUE_DEPTH = Gauge(
+    "telegram_notification_queue_depth", "Telegram notifications waiting to be sent"
+)
+NOTIFY_SEND_SECONDS = Histogram(
+    "telegram_notification_send_seconds",
+    "Duration of a single Telegram sendMessage call",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+NOTIFY_LATENCY_SECONDS = Histogram(
+    "telegram_notification_latency_seconds",
+    "Time from enqueue to delivery of a Telegram notification",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+
+
+class TokenBucket:
+    """Лимит rate событий в секунду с запасом burst; pause — для 429."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Notification:
+    """Один текст (и клавиатура) для любого числа чатов."""
+
+    __slots__ = ("text", "options", "enqueued_at")
+
+    def __init__(self, text: str, options: dict):
+        self.text = text
+        self.options = options
+        self.enqueued_at = time.monotonic()
+
+
+# (chat_id, уведомление, номер попытки)
+Job = Tuple[int, Notification, int]
+
+
+async def send_telegram_message(chat_id: int, text: str, **options):
+    bot = bot_manager.bot
+    if not bot:
+        bot, _ = await bot_manager.initialize()
+        if not bot:
+            raise RuntimeError("Bot not initialized for notifications")
+    await bot.send_message(chat_id=chat_id, text=text, **options)
+
+
+class NotificationDispatcher:
+    """Очередь уведомлений процесса и задачи, отправляющие их в Telegram."""
+
+    def __init__(
+        self,
+        send=send_telegram_message,
+        rate: float = TELEGRAM_NOTIFY_RATE,
+        chat_interval: float = TELEGRAM_NOTIFY_CHAT_INTERVAL,
+        concurrency: int = NOTIFY_CONCURRENCY,
+        queue_size: int = NOTIFY_QUEUE_SIZE,
+        max_attempts: int = NOTIFY_MAX_ATTEMPTS,
+    ):
+        self.send = send
+        self.bucket = TokenBucket(rate)
+        self.chat_interval = chat_interval
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_attempts = max_attempts
+        self.queue: asyncio.Queue = asyncio.Queue()
+        # Сообщения в очереди и отложенные (ждут слота чата или повтора)
+        self.depth = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._pending: Set[Tuple[int, str]] = set()
+        self._chat_next: Dict[int, float] = {}
+        self._workers: list = []
+
+    @property
+    def running(self) -> bool:
+        return any(not worker.done() for worker in self._workers)
+
+    def start(self):
+        if self.running:
+            return
+        self._workers = [
+            asyncio.create_task(self._work()) for _ in range(self.concurrency)
+        ]
+        logger.info(f"Notification dispatcher started ({self.concurrency} senders)")
+
+    async def stop(self):
+        """Досылает очередь; не успели за NOTIFY_SHUTDOWN_TIMEOUT — остаток теряется."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), NOTIFY_SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"Notification dispatcher stopped with {self.depth} unsent")
+            NOTIFICATIONS.labels(outcome="dropped").inc(self.depth)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Notification dispatcher stopped")
+
+    async def notify(
+        self,
+        chat_ids: Iterable[int],
+        text: str,
+        reply_markup=None,
+        parse_mode: Optional[str] = None,
+    ) -> int:
+        """Ставит text в очередь для chat_ids; возвращает число принятых чатов."""
+        options = {}
+        if reply_markup is not None:
+            options["reply_markup"] = reply_markup
+        if parse_mode is not None:
+            options["parse_mode"] = parse_mode
+        notification = Notification(text, options)
+
+        jobs = []
+        for chat_id in dict.fromkeys(chat_ids):
+            key = (chat_id, text)
+            if key in self._pending:
+                NOTIFICATIONS.labels(outcome="deduplicated").inc()
+                continue
+            if self.depth + len(jobs) >= self.queue_size:
+                logger.warning(f"Notification queue full, dropping message to {chat_id}")
+                NOTIFICATIONS.labels(outcome="dropped").inc()
+                continue
+            jobs.append((chat_id, notification, 1))
+        if not jobs:
+            return 0
+
+        NOTIFICATIONS.labels(outcome="queued").inc(len(jobs))
+        for chat_id, _, _ in jobs:
+            self._pending.add((chat_id, text))
+        self._track(len(jobs))
+        if not self.running:
+            # Диспетчер не запущен (скрипты, тесты) — отправляем сразу
+            for job in jobs:
+                await self._deliver(job)
+            return len(jobs)
+        for job in jobs:
+            self._submit(job)
+        return len(jobs)
+
+    def _track(self, delta: int):
+        self.depth += delta
+        NOTIFY_QUEUE_DEPTH.set(self.depth)
+        if self.depth:
+            self._idle.clear()
+        else:
+            self._idle.set()
+
+    def _reserve_chat(self, chat_id: int, not_before: float) -> float:
+        """Занимает ближайший слот чата; возвращает задержку до него."""
+        now = time.monotonic()
+        if len(self._chat_next) > self.queue_size:
+            self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+        slot = max(now + not_before, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = slot + self.chat_interval
+        return slot - now
+
+    def _submit(self, job: Job, not_before: float = 0.0):
+        delay = self._reserve_chat(job[0], not_before)
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self.queue.put_nowait, job)
+        else:
+            self.queue.put_nowait(job)
+
+    def _done(self, job: Job, outcome: str):
+        chat_id, notification, _ = job
+        self._pending.discard((chat_id, notification.text))
+        NOTIFICATIONS.labels(outcome=outcome).inc()
+        self._track(-1)
+
+    def _retry(self, job: Job, delay: float, outcome: str):
+        chat_id, notification, attempt = job
+        if attempt >= self.max_attempts or not self.running:
+            logger.error(f"Giving up on notification to {chat_id} after {attempt} attempts")
+            self._done(job, "failed")
+            return
+        NOTIFICATIONS.labels(outcome=outcome).inc()
+        self._submit((chat_id, notification, attempt + 1), delay)
+
+    async def _deliver(self, job: Job):
+        chat_id, notification, attempt = job
+        await self.bucket.acquire()
+        started = time.monotonic()
+        try:
+            await self.send(chat_id, notification.text, **notification.options)
+        except TelegramRetryAfter as e:
+            logger.warning(f"Telegram rate limit hit, pausing sends for {e.retry_after}s")
+            self.bucket.pause(e.retry_after)
+            self._retry(job, e.retry_after, "rate_limited")
+            return
+        except (TelegramNetworkError, TelegramServerError) as e:
+            logger.warning(f"Notification to {chat_id} failed (attempt {attempt}): {e}")
+            self._retry(job, 2 ** (attempt - 1), "retried")
+            return
+        except Exception as e:
+            logger.error(f"Failed to notify pharmacist {chat_id}: {e}")
+            self._done(job, "failed")
+            return
+        finished = time.monotonic()
+        NOTIFY_SEND_SECONDS.observe(finished - started)
+        NOTIFY_LATENCY_SECONDS.observe(finished - notification.enqueued_at)
+        self._done(job, "sent")
+
+    async def _work(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._deliver(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Notification sender error: {e}", exc_info=True)
+                self._done(job, "failed")
+
+
+notification_dispatcher = NotificationDispatcher()
+
+
+def start_notification_dispatcher():
+    """Start the Telegram notification senders"""
+    notification_dispatcher.start()
+
+
+async def stop_notification_dispatcher():
+    """Send queued notifications and stop the senders"""
+    await notification_dispatcher.stop()
@@ -2,26 +2,29 @@ import logging
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_
 from sqlalchemy.orm import selectinload
-from bot.core import bot_manager
 from db.qa_models import Pharmacist, User, Question
 from bot.keyboards.qa_keyboard import make_question_keyboard
 from bot.services.assignment_service import QuestionAssignmentService
 from bot.services.dialog_service import DialogService
+from bot.services.notification_dispatcher import notification_dispatcher
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 logger = logging.getLogger(__name__)
 
 
+def split_chats_by_status(pharmacists):
+    """telegram_id онлайн и офлайн фармацевтов (без привязки к Telegram — пропускаются)"""
+    online, offline = [], []
+    for pharmacist in pharmacists:
+        if pharmacist.user and pharmacist.user.telegram_id:
+            chats = online if pharmacist.is_online else offline
+            chats.append(pharmacist.user.telegram_id)
+    return online, offline
+
+
 async def notify_pharmacists_about_new_question(question, db: AsyncSession):
-    """Уведомление фармацевтов о новом вопросе"""
+    """Уведомление фармацевтов о новом вопросе (ставится в очередь отправки)"""
     try:
-        if not bot_manager.bot:
-            bot, _ = await bot_manager.initialize()
-            if not bot:
-                logger.error("Bot not initialized for notifications")
-                return
-        bot = bot_manager.bot
-
         # Проверяем, нужно ли уведомлять всех
         if await QuestionAssignmentService.should_notify_all_pharmacists(
             question.uuid, db
@@ -49,36 +52,22 @@ async def notify_pharmacists_about_new_question(question, db: AsyncSession):
             question.text[:150] + "..." if len(question.text) > 150 else question.text
         )
 
-        for pharmacist in pharmacists:
-            try:
-                if pharmacist.user and pharmacist.user.telegram_id:
-                    # Разные сообщения в зависимости от статуса
-                    if pharmacist.is_online:
-                        message_text = (
-                            f"🔔 НОВЫЙ ВОПРОС!\n\n"
-                            f"❓ Вопрос: {question_preview}\n\n"
-                            f"💡 Статус: Вы в онлайн - можете ответить сразу!"
-                        )
-                        reply_markup = make_question_keyboard(question.uuid)
-                    else:
-                        message_text = (
-                            f"📥 Новый вопрос ожидает ответа\n\n"
-                            f"❓ Вопрос: {question_preview}\n\n"
-                            f"💡 Статус: Вы в офлайн"
-                        )
-                        reply_markup = None
-
-                    await bot.send_message(
-                        chat_id=pharmacist.user.telegram_id,
-                        text=message_text,
-                        reply_markup=reply_markup,
-                    )
-                    logger.info(
-                        f"Notification sent to pharmacist {pharmacist.user.telegram_id}"
-                    )
-
-            except Exception as e:
-                logger.error(f"Failed to notify pharmacist: {e}")
+        # Разные сообщения в зависимости от статуса; один текст на всех адресатов
+        online, offline = split_chats_by_status(pharmacists)
+        queued = await notification_dispatcher.notify(
+            online,
+            f"🔔 НОВЫЙ ВОПРОС!\n\n"
+            f"❓ Вопрос: {question_preview}\n\n"
+            f"💡 Статус: Вы в онлайн - можете ответить сразу!",
+            reply_markup=make_question_keyboard(question.uuid),
+        )
+        queued += await notification_dispatcher.notify(
+            offline,
+            f"📥 Новый вопрос ожидает ответа\n\n"
+            f"❓ Вопрос: {question_preview}\n\n"
+            f"💡 Статус: Вы в офлайн",
+        )
+        logger.info(f"New question notification queued for {queued} pharmacists")
 
     except Exception as e:
         logger.error(f"Error in notify_pharmacists_about_new_question: {e}")
@@ -89,13 +78,6 @@ async def notify_about_clarification(
 ):
     """Уведомление об уточнении - ИСПРАВЛЕННАЯ ВЕРСИЯ"""
     try:
-        if not bot_manager.bot:
-            bot, _ = await bot_manager.initialize()
-            if not bot:
-                logger.error("Bot not initialized for notifications")
-                return
-        bot = bot_manager.bot
-
         # ✅ ВАЖНО: Добавляем уточнение в историю диалога
         await DialogService.add_message(
             db=db,
@@ -139,41 +121,35 @@ async def notify_about_clarification(
             original_question.uuid, db, limit=10  # Показываем последние 10 сообщений
         )
 
-        for pharmacist in pharmacists_to_notify:
-            if pharmacist.user and pharmacist.user.telegram_id:
-                message_text = (
-                    f"🔍 УТОЧНЕНИЕ К ВОПРОСУ!\n\n"
-                    f"❓ Исходный вопрос: {original_question.text[:200]}...\n\n"
-                    f"💬 Уточнение пользователя: {clarification_text[:200]}...\n\n"
-                    f"📋 История диалога:\n"
-                    f"{history_text}"
-                )
-
-                if pharmacist.is_online:
-                    message_text += "\n💡 Статус: Вы в онлайн - можете ответить сразу!"
-                    reply_markup = InlineKeyboardMarkup(
-                        inline_keyboard=[
-                            [
-                                InlineKeyboardButton(
-                                    text="💬 Ответить на уточнение",
-                                    callback_data=f"answer_{original_question.uuid}",
-                                )
-                            ]
-                        ]
-                    )
-                else:
-                    message_text += "\n💡 Статус: Вы в офлайн"
-                    reply_markup = None
-
-                await bot.send_message(
-                    chat_id=pharmacist.user.telegram_id,
-                    text=message_text,
-                    parse_mode="HTML",
-                    reply_markup=reply_markup,
-                )
-                logger.info(
-                    f"Clarification notification sent to pharmacist {pharmacist.user.telegram_id}"
-                )
+        message_text = (
+            f"🔍 УТОЧНЕНИЕ К ВОПРОСУ!\n\n"
+            f"❓ Исходный вопрос: {original_question.text[:200]}...\n\n"
+            f"💬 Уточнение пользователя: {clarification_text[:200]}...\n\n"
+            f"📋 История диалога:\n"
+            f"{history_text}"
+        )
+        online, offline = split_chats_by_status(pharmacists_to_notify)
+        queued = await notification_dispatcher.notify(
+            online,
+            message_text + "\n💡 Статус: Вы в онлайн - можете ответить сразу!",
+            parse_mode="HTML",
+            reply_markup=InlineKeyboardMarkup(
+                inline_keyboard=[
+                    [
+                        InlineKeyboardButton(
+                            text="💬 Ответить на уточнение",
+                            callback_data=f"answer_{original_question.uuid}",
+                        )
+                    ]
+                ]
+            ),
+        )
+        queued += await notification_dispatcher.notify(
+            offline,
+            message_text + "\n💡 Статус: Вы в офлайн",
+            parse_mode="HTML",
+        )
+        logger.info(f"Clarification notification queued for {queued} pharmacists")
 
     except Exception as e:
         logger.error(f"Error in notify_about_clarification: {e}", exc_info=True)
@@ -0,0 +1,233 @@
+"""Фоновая обработка обновлений Telegram из webhook.
+
+Раньше telegram_webhook выполнял dp.feed_update прямо в запросе: Telegram
+ждал все запросы к БД и исходящие сообщения хендлеров, а медленный хендлер
+приводил к таймауту webhook и повторной доставке. В режиме
+TELEGRAM_WEBHOOK_MODE=queue (по умолчанию) webhook только проверяет и
+разбирает обновление, кладёт его в очередь процесса и сразу отвечает 200.
+
+- Порядок внутри чата сохраняется: у каждого chat_id своя очередь, и
+  одновременно обрабатывается не больше одного его обновления; разные чаты
+  обрабатываются параллельно TELEGRAM_UPDATE_WORKERS задачами.
+- Повторно доставленные update_id отбрасываются: ключ
+  telegram:update:{update_id} ставится в Redis через SET NX с TTL
+  TELEGRAM_UPDATE_DEDUP_TTL. Redis недоступен — обновление обрабатывается
+  (лучше повтор, чем потеря).
+- Очередь заполнена (TELEGRAM_UPDATE_QUEUE_SIZE) — webhook отвечает 503, и
+  Telegram доставит обновление позже.
+- Обновление уже подтверждено Telegram, поэтому недоработанное за
+  TELEGRAM_UPDATE_SHUTDOWN_TIMEOUT при остановке теряется: его update_id
+  пишутся в лог и считаются в telegram_updates_total{outcome="dropped"}.
+
+TELEGRAM_WEBHOOK_MODE=inline возвращает прежнюю обработку в запросе.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Dict, Hashable, List, Optional, Set
+
+from aiogram.types import Update
+from prometheus_client import Counter, Gauge, Histogram
+
+from auth.session_manager import get_redis_client
+from bot.core import bot_manager
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_WEBHOOK_MODE = os.getenv("TELEGRAM_WEBHOOK_MODE", "queue")
+TELEGRAM_UPDATE_WORKERS = int(os.getenv("TELEGRAM_UPDATE_WORKERS", "16"))
+TELEGRAM_UPDATE_QUEUE_SIZE = int(os.getenv("TELEGRAM_UPDATE_QUEUE_SIZE", "10000"))
+# Telegram хранит неподтверждённые обновления до суток
+TELEGRAM_UPDATE_DEDUP_TTL = int(os.getenv("TELEGRAM_UPDATE_DEDUP_TTL", "86400"))
+# Вместе с AUDIT_SHUTDOWN_TIMEOUT и NOTIFY_SHUTDOWN_TIMEOUT (12 + 5 + 8 с) —
+# меньше --graceful-timeout 30 у gunicorn (Dockerfile)
+TELEGRAM_UPDATE_SHUTDOWN_TIMEOUT = float(os.getenv("TELEGRAM_UPDATE_SHUTDOWN_TIMEOUT", "12"))
+
+UPDATES = Counter(
+    "telegram_updates_total",
+    "Telegram webhook updates by outcome "
+    "(queued, duplicate, rejected, processed, failed, dropped)",
+    ["outcome"],
+)
+UPDATE_QUEUE_DEPTH = Gauge(
+    "telegram_update_queue_depth", "Telegram updates waiting or being processed"
+)
+UPDATE_QUEUE_LAG = Histogram(
+    "telegram_update_queue_lag_seconds",
+    "Time from webhook ack to the start of update processing",
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+UPDATE_PROCESSING_SECONDS = Histogram(
+    "telegram_update_processing_seconds",
+    "dp.feed_update duration for a queued update",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+
+def update_chat_id(update: Update) -> Optional[int]:
+    """chat_id, в порядке которого обрабатывается обновление."""
+    try:
+        event = update.event
+    except Exception:
+        return None
+    chat = getattr(event, "chat", None)
+    if chat is None:
+        # callback_query: чат сообщения с кнопкой
+        chat = getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    return user.id if user else None
+
+
+async def is_duplicate_update(update_id: int) -> bool:
+    """True, если update_id уже принимался (повторная доставка Telegram)."""
+    try:
+        redis_client = await get_redis_client()
+        first = await redis_client.set(
+            f"telegram:update:{update_id}", 1, nx=True, ex=TELEGRAM_UPDATE_DEDUP_TTL
+        )
+        return not first
+    except Exception as e:
+        logger.warning(f"Update dedup check failed, processing anyway: {e}")
+        return False
+
+
+async def feed_update(update: Update):
+    bot = bot_manager.get_bot()
+    dp = bot_manager.get_dp()
+    if not bot or not dp:
+        bot, dp = await bot_manager.initialize()
+        if not bot or not dp:
+            raise RuntimeError("Bot service not ready")
+    await dp.feed_update(bot, update)
+
+
+class UpdateQueue:
+    """Очереди обновлений по chat_id и пул задач, обрабатывающих их."""
+
+    def __init__(
+        self,
+        process=feed_update,
+        workers: int = TELEGRAM_UPDATE_WORKERS,
+        queue_size: int = TELEGRAM_UPDATE_QUEUE_SIZE,
+    ):
+        self.process = process
+        self.workers = workers
+        self.queue_size = queue_size
+        # chat_id -> (обновление, время приёма); ключ есть, пока у чата есть работа
+        self._chats: Dict[Hashable, deque] = {}
+        # Чаты с необработанными обновлениями и без обновления в работе
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self.depth = 0
+        # update_id обновлений, которые сейчас обрабатываются
+        self._in_flight: Set[int] = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks: list = []
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self):
+        if self.running:
+            return
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        logger.info(f"Telegram update queue started ({self.workers} workers)")
+
+    async def stop(self):
+        """Дорабатывает очередь; не успели за таймаут — остаток теряется."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), TELEGRAM_UPDATE_SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            dropped = self.unprocessed()
+            UPDATES.labels(outcome="dropped").inc(len(dropped))
+            logger.error(
+                f"Telegram update queue stopped with {len(dropped)} unprocessed, "
+                f"update_ids lost: {dropped}"
+            )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Telegram update queue stopped")
+
+    def unprocessed(self) -> List[int]:
+        """update_id принятых, но не обработанных до конца обновлений."""
+        waiting = [update.update_id for items in self._chats.values() for update, _ in items]
+        return sorted(self._in_flight.union(waiting))
+
+    @property
+    def full(self) -> bool:
+        return self.depth >= self.queue_size
+
+    def submit(self, update: Update):
+        """Кладёт обновление в очередь его чата (без ожидания обработки)."""
+        key = update_chat_id(update)
+        if key is None:
+            # Обновление без чата не нужно упорядочивать
+            key = ("update", update.update_id)
+        item = (update, time.monotonic())
+        self._track(1)
+        UPDATES.labels(outcome="queued").inc()
+        chat_queue = self._chats.get(key)
+        if chat_queue is not None:
+            chat_queue.append(item)
+            return
+        self._chats[key] = deque([item])
+        self._ready.put_nowait(key)
+
+    def _track(self, delta: int):
+        self.depth += delta
+        UPDATE_QUEUE_DEPTH.set(self.depth)
+        if self.depth:
+            self._idle.clear()
+        else:
+            self._idle.set()
+
+    async def _work(self):
+        while True:
+            key = await self._ready.get()
+            chat_queue = self._chats[key]
+            update, accepted_at = chat_queue.popleft()
+            self._in_flight.add(update.update_id)
+            started = time.monotonic()
+            UPDATE_QUEUE_LAG.observe(started - accepted_at)
+            try:
+                await self.process(update)
+                UPDATES.labels(outcome="processed").inc()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                UPDATES.labels(outcome="failed").inc()
+                logger.error(
+                    f"❌ Error processing update {update.update_id}: {e}", exc_info=True
+                )
+            finally:
+                UPDATE_PROCESSING_SECONDS.observe(time.monotonic() - started)
+                self._in_flight.discard(update.update_id)
+                self._track(-1)
+                # Следующее обновление чата — только после текущего
+                if chat_queue:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+
+
+update_queue = UpdateQueue()
+
+
+def start_update_queue():
+    """Start the Telegram update workers (queue webhook mode only)"""
+    if TELEGRAM_WEBHOOK_MODE == "queue":
+        update_queue.start()
+
+
+async def stop_update_queue():
+    """Process queued updates and stop the workers"""
+    await update_queue.stop()
@@ -1,6 +1,6 @@
 # db/__init__.py
 from .base import Base
-from .models import Pharmacy, Product
+from .models import Pharmacy, Product, ProductGroup
 from .booking_models import BookingOrder, PharmacyAPIConfig, SyncLog
 from .qa_models import User, Pharmacist, Question, Answer
 
@@ -12,6 +12,7 @@ __all__ = [
     'Base',
     'Pharmacy',
     'Product',
+    'ProductGroup',
     'BookingOrder',
     'PharmacyAPIConfig',
     'SyncLog',
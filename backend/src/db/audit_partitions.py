@@ -0,0 +1,64 @@
+"""SQL месячных партиций audit_logs (audit_logs_YYYY_MM и audit_logs_default).
+
+Единственное определение в приложении: им пользуются after_create у
+AuditLog (таблица из create_all, без миграций) и tasks/audit_maintenance.py.
+Миграция t7u8v9w0x1y2 хранит свою замороженную копию функции; при
+обслуживании функция пересоздаётся отсюда, так что правка здесь доходит
+и до баз, созданных миграциями.
+"""
+
+# Сколько месяцев вперёд держать готовые партиции
+AUDIT_PARTITIONS_AHEAD = 2
+
+DEFAULT_PARTITION_SQL = (
+    "CREATE TABLE IF NOT EXISTS audit_logs_default PARTITION OF audit_logs DEFAULT"
+)
+
+# Создаёт партицию месяца p_month и переносит в неё строки этого месяца,
+# попавшие в audit_logs_default
+ENSURE_PARTITION_FUNCTION_SQL = """
+    CREATE OR REPLACE FUNCTION ensure_audit_log_partition(p_month date)
+    RETURNS void AS $$
+    DECLARE
+        start_ts timestamp := date_trunc('month', p_month);
+        end_ts timestamp := date_trunc('month', p_month) + interval '1 month';
+        part text := 'audit_logs_' || to_char(p_month, 'YYYY_MM');
+    BEGIN
+        IF to_regclass(part) IS NOT NULL THEN
+            RETURN;
+        END IF;
+        EXECUTE format(
+            'CREATE TABLE %I (LIKE audit_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+            part
+        );
+        EXECUTE format(
+            'WITH moved AS (DELETE FROM audit_logs_default '
+            'WHERE created_at >= %L AND created_at < %L RETURNING *) '
+            'INSERT INTO %I SELECT * FROM moved',
+            start_ts, end_ts, part
+        );
+        EXECUTE format(
+            'ALTER TABLE audit_logs ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+            part, start_ts, end_ts
+        );
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+# Партиции текущего месяца и AUDIT_PARTITIONS_AHEAD следующих
+INITIAL_PARTITIONS_SQL = f"""
+    SELECT ensure_audit_log_partition(month::date)
+    FROM generate_series(
+        date_trunc('month', now()),
+        date_trunc('month', now()) + interval '{AUDIT_PARTITIONS_AHEAD} months',
+        interval '1 month'
+    ) AS month
+"""
+
+# Для таблицы из create_all: без партиций любая вставка падает
+# с "no partition of relation found for row"
+AUDIT_LOG_PARTITIONS_DDL = (
+    DEFAULT_PARTITION_SQL,
+    ENSURE_PARTITION_FUNCTION_SQL,
+    INITIAL_PARTITIONS_SQL,
+)
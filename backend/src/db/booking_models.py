@@ -84,7 +84,9 @@ class BookingOrder(Base):
     __table_args__ = (
         Index('idx_booking_status', 'status'),
         Index('idx_booking_pharmacy', 'pharmacy_id'),
-        Index('idx_booking_created', 'created_at'),
+        # Keyset-пагинация списков заказов: (created_at, uuid) DESC
+        Index('idx_booking_created_uuid', 'created_at', 'uuid'),
+        Index('idx_booking_pharmacy_created_uuid', 'pharmacy_id', 'created_at', 'uuid'),
         Index('idx_booking_product_id', 'product_id'),
         CheckConstraint('quantity > 0', name='ck_booking_quantity_positive'),
     )
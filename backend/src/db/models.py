@@ -1,21 +1,27 @@
 # db/models.py
 import uuid
 from sqlalchemy import (
+    BigInteger,
     Column,
+    DDL,
     String,
     Date,
+    Identity,
     ForeignKey,
     Numeric,
     DateTime,
     UniqueConstraint,
     Index,
     Boolean,
+    Integer,
     Text,
     JSON,
+    event,
 )
-from sqlalchemy.dialects.postgresql import UUID, TSVECTOR
-from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR, ARRAY
+from sqlalchemy.orm import relationship, deferred
 
+from .audit_partitions import AUDIT_LOG_PARTITIONS_DDL
 from .base import Base
 
 
@@ -48,16 +54,40 @@ class AuditLog(Base):
     details = Column(JSON, nullable=True)  # Дополнительная информация о действии
     
     # Временные метки
-    created_at = Column(DateTime, nullable=False, index=True)
+    # Ключ месячных партиций (audit_logs_YYYY_MM), поэтому входит в PK
+    created_at = Column(DateTime, primary_key=True, nullable=False, index=True)
 
     __table_args__ = (
         Index("idx_audit_user_id", "user_id"),
         Index("idx_audit_action", "action"),
         Index("idx_audit_resource", "resource_type", "resource_id"),
         Index("idx_audit_created_at", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
 
 
+# Партиции для audit_logs, созданной через create_all (миграции не применялись)
+for _statement in AUDIT_LOG_PARTITIONS_DDL:
+    # DDL подставляет параметры через %, литеральный % экранируется
+    event.listen(AuditLog.__table__, "after_create", DDL(_statement.replace("%", "%%")))
+del _statement
+
+
+class AuditLogDailyStats(Base):
+    """Суточные счётчики audit_logs (действие × ресурс × пользователь)"""
+    __tablename__ = "audit_log_daily_stats"
+
+    id = Column(BigInteger, Identity(), primary_key=True)
+    day = Column(Date, nullable=False)
+    action = Column(String(50), nullable=False)
+    resource_type = Column(String(50), nullable=False)
+    user_id = Column(UUID(as_uuid=True), nullable=True)
+    user_type = Column(String(20), nullable=False)
+    events = Column(BigInteger, nullable=False)
+
+    __table_args__ = (Index("idx_audit_daily_stats_day", "day"),)
+
+
 class Pharmacy(Base):
     __tablename__ = "pharmacies"
 
@@ -116,7 +146,18 @@ class Product(Base):
     is_removed = Column(Boolean, default=False, nullable=False)
     removed_at = Column(DateTime, nullable=True)
 
-    search_vector = Column(TSVECTOR, nullable=True)
+    # Поисковый индекс: заполняется импортом CSV (services/search_index.py).
+    # deferred — колонки нужны только в WHERE/ORDER BY, в ORM-объекты не загружаются
+    name_lower = deferred(Column(String(255), nullable=True))
+    search_tokens = deferred(Column(ARRAY(Text), nullable=True))
+    search_vector = deferred(Column(TSVECTOR, nullable=True))
+
+    # Хэш ключевых полей (name, form, serial, expiry_date, manufacturer,
+    # country) — по нему импорт CSV сопоставляет строки файла с товарами
+    content_hash = deferred(Column(String(32), nullable=True))
+    # Хэш неключевых полей (цена, остаток, ...) — импорт CSV пропускает
+    # строки, у которых он не изменился (tasks/tasks_increment.py)
+    payload_hash = deferred(Column(String(32), nullable=True))
 
     pharmacy = relationship("Pharmacy", back_populates="products", lazy="select")
 
@@ -127,4 +168,63 @@ class Product(Base):
         Index("idx_product_form", "form"),
         Index("idx_product_price", "price"),
         Index("idx_product_is_removed", "is_removed"),  # Добавить индекс
+        Index(
+            "idx_product_name_lower_trgm",
+            "name_lower",
+            postgresql_using="gin",
+            postgresql_ops={"name_lower": "gin_trgm_ops"},
+        ),
+        Index(
+            "idx_product_name_lower_pattern",
+            "name_lower",
+            postgresql_ops={"name_lower": "text_pattern_ops"},
+        ),
+        Index("idx_product_search_tokens", "search_tokens", postgresql_using="gin"),
+        Index("idx_product_pharmacy_content_hash", "pharmacy_id", "content_hash"),
+    )
+
+
+class ProductGroup(Base):
+    """Агрегаты групп товаров для available_combinations (services/product_groups.py).
+
+    scope — город аптек (pharmacies.city) или "*" для всех аптек.
+    """
+
+    __tablename__ = "product_groups"
+
+    scope = Column(String(255), primary_key=True)
+    name = Column(String(255), primary_key=True)
+    form = Column(String(255), primary_key=True)
+    manufacturer = Column(String(255), primary_key=True)
+    country = Column(String(255), primary_key=True)
+
+    # Те же поисковые колонки, что у Product — уровни поиска строятся одинаково
+    name_lower = Column(String(255), nullable=True)
+    search_tokens = Column(ARRAY(Text), nullable=True)
+    search_vector = Column(TSVECTOR, nullable=True)
+
+    product_count = Column(Integer, nullable=False)
+    quantity_sum = Column(Numeric(14, 3), nullable=False)
+    min_price = Column(Numeric(12, 2), nullable=True)
+    max_price = Column(Numeric(12, 2), nullable=True)
+    pharmacy_count = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index(
+            "idx_product_group_name_lower_trgm",
+            "name_lower",
+            postgresql_using="gin",
+            postgresql_ops={"name_lower": "gin_trgm_ops"},
+        ),
+        Index(
+            "idx_product_group_name_lower_pattern",
+            "name_lower",
+            postgresql_ops={"name_lower": "text_pattern_ops"},
+        ),
+        Index(
+            "idx_product_group_search_vector", "search_vector", postgresql_using="gin"
+        ),
+        Index(
+            "idx_product_group_search_tokens", "search_tokens", postgresql_using="gin"
+        ),
     )
@@ -158,6 +158,8 @@ class Question(Base):
         "DialogMessage", back_populates="question", order_by="DialogMessage.created_at"
     )
 
+    __table_args__ = (Index("idx_qa_questions_user_status", "user_id", "status"),)
+
 
 class Answer(Base):
     __tablename__ = "qa_answers"
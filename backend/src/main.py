@@ -113,6 +113,26 @@ async def lifespan(app: FastAPI):
 
     start_redis_listener()
 
+    # In-memory индекс подсказок /search/suggest (загрузка + обновления из Redis)
+    from services.suggest_index import start_suggest_index
+
+    start_suggest_index()
+
+    # Фоновая пакетная запись audit_logs (AuditLoggingMiddleware)
+    from services.audit_writer import start_audit_writer
+
+    start_audit_writer()
+
+    # Фоновая отправка уведомлений фармацевтам в Telegram (лимиты Bot API)
+    from bot.services.notification_dispatcher import start_notification_dispatcher
+
+    start_notification_dispatcher()
+
+    # Обработка обновлений webhook в фоне, по порядку внутри каждого чата
+    from bot.services.update_queue import start_update_queue
+
+    start_update_queue()
+
     # Каждый worker инициализирует своего бота (необходимо для обработки webhook)
     # Middleware и роутеры настраиваются внутри bot_manager.initialize()
     bot, dp = await bot_manager.initialize()
@@ -219,6 +239,23 @@ async def lifespan(app: FastAPI):
 
     yield
 
+    from services.suggest_index import stop_suggest_index
+
+    stop_suggest_index()
+
+    # Обновления из очереди ещё пишут в БД и шлют уведомления — дорабатываем первыми
+    from bot.services.update_queue import stop_update_queue
+
+    await stop_update_queue()
+
+    from services.audit_writer import stop_audit_writer
+
+    await stop_audit_writer()
+
+    from bot.services.notification_dispatcher import stop_notification_dispatcher
+
+    await stop_notification_dispatcher()
+
     # Завершение работы бота (каждый worker закрывает своего бота)
     bot = bot_manager.get_bot()
     if bot:
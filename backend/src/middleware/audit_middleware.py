@@ -8,8 +8,7 @@ from typing import Callable, Optional
 from fastapi import Request, Response
 from starlette.middleware.base import BaseHTTPMiddleware
 from datetime import datetime
-from db.database import get_async_sessionmaker
-from db.models import AuditLog
+from services.audit_writer import audit_event, audit_writer
 import uuid
 
 logger = logging.getLogger(__name__)
@@ -28,7 +27,7 @@ class AuditLoggingMiddleware(BaseHTTPMiddleware):
     """
     Middleware для логирования всех запросов к endpoints с персональными данными.
     
-    Записывает в БД:
+    Записывает в БД (пакетами, через services.audit_writer):
     - Кто выполнил действие (user_id, user_type)
     - Какое действие (action, endpoint)
     - К каким данным обращались (resource_type, resource_id)
@@ -160,35 +159,28 @@ class AuditLoggingMiddleware(BaseHTTPMiddleware):
         success: bool = True,
         details: Optional[dict] = None,
     ):
-        """Записывает событие аудита в БД"""
+        """Ставит событие аудита в очередь фоновой записи (services.audit_writer)"""
         try:
-            sessionmaker = get_async_sessionmaker()
-            async with sessionmaker() as db:
-                audit_log = AuditLog(
-                    id=uuid.uuid4(),
+            await audit_writer.enqueue(
+                audit_event(
                     user_id=user_id,
                     user_type=user_type,
                     action=action,
                     resource_type=resource_type,
                     resource_id=resource_id,
                     ip_address=ip_address,
-                    user_agent=user_agent[:500],  # Ограничиваем длину
+                    user_agent=user_agent,
                     request_method=request_method,
-                    endpoint=endpoint[:255],  # Ограничиваем длину
+                    endpoint=endpoint,
                     status_code=status_code,
                     success=success,
                     details=details,
-                    created_at=datetime.utcnow(),
-                )
-                
-                db.add(audit_log)
-                await db.commit()
-                
-                logger.debug(
-                    f"Audit log created: {user_type} {action} {resource_type} "
-                    f"(status={status_code}, success={success})"
                 )
-                
+            )
+            logger.debug(
+                f"Audit event queued: {user_type} {action} {resource_type} "
+                f"(status={status_code}, success={success})"
+            )
         except Exception as e:
-            logger.error(f"Failed to create audit log: {str(e)}", exc_info=True)
+            logger.error(f"Failed to queue audit event: {str(e)}", exc_info=True)
             # Не прерываем основной поток из-за ошибки логирования
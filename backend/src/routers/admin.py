@@ -2,17 +2,19 @@
 Admin endpoints для управления системой и просмотра audit logs.
 Требует ADMIN_API_KEY для доступа.
 """
+from collections import Counter
 from typing import Optional, List
-from datetime import datetime, timedelta
+from datetime import date, datetime, time, timedelta
 from fastapi import APIRouter, Depends, HTTPException, Query, Header
-from sqlalchemy import select, func, desc
+from sqlalchemy import select, func, desc, union_all
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, Field
 import uuid
 
 from db.database import get_db
-from db.models import AuditLog
+from db.models import AuditLog, AuditLogDailyStats
 from utils.auth import verify_admin_api_key
+from utils.time_utils import get_utc_now
 
 router = APIRouter(
     prefix="/api/admin",
@@ -126,6 +128,28 @@ async def get_audit_logs(
     )
 
 
+def audit_stats_query(date_from: date, live_from: date):
+    """Счётчики (действие, ресурс, пользователь) за период с date_from.
+
+    Закрытые дни до live_from берутся из audit_log_daily_stats, остаток
+    периода (сегодня и ещё не свёрнутые дни) — из партиций audit_logs.
+    """
+    group_columns = ("action", "resource_type", "user_id", "user_type")
+    rollup = select(
+        *(getattr(AuditLogDailyStats, name) for name in group_columns),
+        AuditLogDailyStats.events.label("events"),
+    ).where(AuditLogDailyStats.day >= date_from, AuditLogDailyStats.day < live_from)
+    live_columns = [getattr(AuditLog, name) for name in group_columns]
+    live = (
+        select(*live_columns, func.count().label("events"))
+        .where(AuditLog.created_at >= datetime.combine(live_from, time.min))
+        .group_by(*live_columns)
+    )
+    counts = union_all(rollup, live).subquery()
+    columns = [counts.c[name] for name in group_columns]
+    return select(*columns, func.sum(counts.c.events).label("events")).group_by(*columns)
+
+
 @router.get("/audit-logs/stats")
 async def get_audit_stats(
     days: int = Query(7, ge=1, le=365, description="Количество дней для статистики"),
@@ -133,7 +157,7 @@ async def get_audit_stats(
     _: bool = Depends(verify_admin_api_key),
 ):
     """
-    Статистика по audit logs за последние N дней.
+    Статистика по audit logs за последние N дней (включая сегодняшний).
     
     Возвращает:
     - Общее количество событий
@@ -141,56 +165,47 @@ async def get_audit_stats(
     - Распределение по типам ресурсов
     - Топ-10 пользователей по активности
     """
-    date_from = datetime.utcnow() - timedelta(days=days)
-    
-    # Общее количество
-    total_query = select(func.count()).select_from(AuditLog).where(
-        AuditLog.created_at >= date_from
-    )
-    result = await db.execute(total_query)
-    total = result.scalar() or 0
-    
-    # По действиям
-    action_query = (
-        select(AuditLog.action, func.count())
-        .where(AuditLog.created_at >= date_from)
-        .group_by(AuditLog.action)
-    )
-    result = await db.execute(action_query)
-    by_action = [{"action": row[0], "count": row[1]} for row in result.all()]
-    
-    # По типам ресурсов
-    resource_query = (
-        select(AuditLog.resource_type, func.count())
-        .where(AuditLog.created_at >= date_from)
-        .group_by(AuditLog.resource_type)
-    )
-    result = await db.execute(resource_query)
-    by_resource = [{"resource_type": row[0], "count": row[1]} for row in result.all()]
-    
-    # Топ-10 пользователей
-    user_query = (
-        select(AuditLog.user_id, AuditLog.user_type, func.count())
-        .where(AuditLog.created_at >= date_from)
-        .group_by(AuditLog.user_id, AuditLog.user_type)
-        .order_by(desc(func.count()))
-        .limit(10)
-    )
-    result = await db.execute(user_query)
-    top_users = [
-        {
-            "user_id": str(row[0]) if row[0] else None,
-            "user_type": row[1],
-            "count": row[2],
-        }
-        for row in result.all()
-    ]
-    
+    # Граница свёрнутых/живых дней — в UTC, как в rollup_days
+    today = get_utc_now().date()
+    date_from = today - timedelta(days=days - 1)
+
+    # Последний свёрнутый день (tasks/audit_maintenance.py)
+    result = await db.execute(select(func.max(AuditLogDailyStats.day)))
+    rolled_until = result.scalar()
+    live_from = date_from
+    if rolled_until is not None:
+        live_from = max(date_from, rolled_until + timedelta(days=1))
+
+    result = await db.execute(audit_stats_query(date_from, live_from))
+
+    total = 0
+    by_action = Counter()
+    by_resource = Counter()
+    by_user = Counter()
+    for row in result.all():
+        events = int(row.events)
+        total += events
+        by_action[row.action] += events
+        by_resource[row.resource_type] += events
+        by_user[(row.user_id, row.user_type)] += events
+
     return {
         "period_days": days,
-        "date_from": date_from,
+        "date_from": datetime.combine(date_from, time.min),
         "total_events": total,
-        "by_action": by_action,
-        "by_resource": by_resource,
-        "top_users": top_users,
+        "by_action": [
+            {"action": action, "count": count} for action, count in by_action.items()
+        ],
+        "by_resource": [
+            {"resource_type": resource_type, "count": count}
+            for resource_type, count in by_resource.items()
+        ],
+        "top_users": [
+            {
+                "user_id": str(user_id) if user_id else None,
+                "user_type": user_type,
+                "count": count,
+            }
+            for (user_id, user_type), count in by_user.most_common(10)
+        ],
     }
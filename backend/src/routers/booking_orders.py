@@ -6,7 +6,7 @@ import os
 from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Request, Header
+from fastapi import APIRouter, Depends, HTTPException, Request, Header, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, delete, text
 from sqlalchemy.orm import selectinload
@@ -24,6 +24,14 @@ from db.booking_schemas import (
     BulkDeleteOrdersRequest,
 )
 from auth.security import get_api_key
+from services.pagination import (
+    MAX_ORDERS_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+    InvalidCursorError,
+    apply_orders_keyset,
+    orders_page_size,
+    split_orders_page,
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -115,22 +123,34 @@ async def create_booking_order(
 @router.get("/orders", response_model=List[BookingOrderResponse])
 async def get_orders(
     request: Request,
+    response: Response,
     pharmacy_id: Optional[uuid.UUID] = None,
     status: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_ORDERS_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
     db: AsyncSession = Depends(get_db),
     api_key: str = Depends(get_api_key),
 ):
-    """Получение списка заказов с фильтрацией (требуется API Key)"""
+    """Получение списка заказов с фильтрацией (требуется API Key)
+
+    Без limit/cursor возвращаются все заказы. С ними — страница по keyset
+    (created_at, uuid); курсор следующей страницы — в заголовке X-Next-Cursor.
+    """
     try:
+        page_size = orders_page_size(cursor, limit)
         query = select(BookingOrder).options(selectinload(BookingOrder.pharmacy))
         if pharmacy_id:
             query = query.where(BookingOrder.pharmacy_id == pharmacy_id)
         if status:
             query = query.where(BookingOrder.status == status)
-        query = query.order_by(BookingOrder.created_at.desc())
+        query = apply_orders_keyset(query, cursor, page_size)
 
         result = await db.execute(query)
-        orders = result.scalars().unique().all()
+        orders, next_cursor = split_orders_page(
+            result.scalars().unique().all(), page_size
+        )
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
 
         response_orders = []
         for order in orders:
@@ -160,6 +180,8 @@ async def get_orders(
 
         return response_orders
 
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception("Error fetching orders")
         raise HTTPException(status_code=500, detail="Error fetching orders")
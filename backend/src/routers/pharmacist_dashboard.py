@@ -10,23 +10,24 @@ from fastapi import (
     Body,
 )
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_
+from sqlalchemy import select, func
 from sqlalchemy.orm import selectinload
-from typing import List, Optional, Set, Dict
+from typing import List, Optional
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
 
 from db.database import get_db, async_session_maker
 from db.qa_models import Question, User, Pharmacist, DialogMessage
 from auth.session_auth import get_current_pharmacist_session as get_current_pharmacist
 from auth.session_manager import get_pharmacist_by_session
+from services.question_stats import get_question_stats
+from services.ws_pubsub import WebSocketEventBus
+from services.ws_registry import WebSocketConnectionManager
 from pydantic import BaseModel, Field
 from utils.time_utils import get_utc_now_naive
 import asyncio
-import json
 import redis.asyncio as aioredis
-from auth.session_manager import get_redis_client
 
 logger = logging.getLogger(__name__)
 
@@ -53,137 +54,6 @@ router = APIRouter(
 )
 
 
-class WebSocketConnectionManager:
-    """Manage WebSocket connections for pharmacist dashboard"""
-
-    def __init__(self):
-        self.active_connections: Set[WebSocket] = set()
-        self.user_connections: Dict[str, Set[WebSocket]] = (
-            {}
-        )  # question_id -> set of WebSockets
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.add(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.discard(websocket)
-        # Also remove from user_connections
-        for qid in list(self.user_connections.keys()):
-            self.user_connections[qid].discard(websocket)
-            if not self.user_connections[qid]:
-                del self.user_connections[qid]
-
-    async def connect_user(self, websocket: WebSocket, question_id: str):
-        """Connect a user WebSocket for a specific consultation"""
-        await websocket.accept()
-        self.active_connections.add(websocket)
-        if question_id not in self.user_connections:
-            self.user_connections[question_id] = set()
-        self.user_connections[question_id].add(websocket)
-
-    def disconnect_user(self, websocket: WebSocket, question_id: str = None):
-        self.active_connections.discard(websocket)
-        if question_id and question_id in self.user_connections:
-            self.user_connections[question_id].discard(websocket)
-            if not self.user_connections[question_id]:
-                del self.user_connections[question_id]
-        else:
-            # Try to find in all user_connections
-            for qid in list(self.user_connections.keys()):
-                self.user_connections[qid].discard(websocket)
-                if not self.user_connections[qid]:
-                    del self.user_connections[qid]
-
-    async def broadcast(self, message: dict):
-        """Send message to all connected pharmacists (not users)"""
-        disconnected = set()
-        for connection in self.active_connections:
-            if connection in self._all_user_websockets():
-                continue
-            try:
-                await connection.send_json(message)
-            except Exception:
-                disconnected.add(connection)
-        for conn in disconnected:
-            self.active_connections.discard(conn)
-
-    def _all_user_websockets(self) -> Set[WebSocket]:
-        """Get all user WebSockets across all consultations"""
-        result = set()
-        for sockets in self.user_connections.values():
-            result.update(sockets)
-        return result
-
-    async def broadcast_to_consultation(self, question_id: str, message: dict):
-        """Send message to all WebSockets subscribed to a specific consultation"""
-        disconnected = set()
-        # Send to user connections for this question
-        if question_id in self.user_connections:
-            for conn in self.user_connections[question_id]:
-                try:
-                    await conn.send_json(message)
-                except Exception:
-                    disconnected.add(conn)
-            for conn in disconnected:
-                self.user_connections[question_id].discard(conn)
-                self.active_connections.discard(conn)
-                if not self.user_connections[question_id]:
-                    del self.user_connections[question_id]
-
-    async def broadcast_new_question(self, question_data: dict):
-        """Broadcast new question notification to all connected pharmacists"""
-        await self.broadcast({"type": "new_question", "data": question_data})
-
-    async def broadcast_message_update(self, question_id: str, message_data: dict):
-        """
-        Broadcast a new message in consultation to pharmacists and subscribed users.
-        Attempts delivery to both channels and logs failures.
-        """
-        pharmacist_errors = 0
-        disconnected = set()
-
-        for connection in self.active_connections:
-            if connection in self._all_user_websockets():
-                continue
-            try:
-                await connection.send_json(
-                    {
-                        "type": "message_update",
-                        "question_id": question_id,
-                        "data": message_data,
-                    }
-                )
-            except Exception as e:
-                pharmacist_errors += 1
-                disconnected.add(connection)
-                logger.warning(f"Failed to send to pharmacist WebSocket: {e}")
-
-        for conn in disconnected:
-            self.active_connections.discard(conn)
-
-        if pharmacist_errors > 0:
-            logger.warning(
-                f"Failed to deliver to {pharmacist_errors} pharmacist WebSocket(s)"
-            )
-
-        try:
-            await self.broadcast_to_consultation(
-                question_id,
-                {
-                    "type": "message_update",
-                    "question_id": question_id,
-                    "data": message_data,
-                },
-            )
-        except Exception as e:
-            logger.error(
-                f"Failed to broadcast to user WebSocket for question {question_id}: {e}",
-                exc_info=True,
-            )
-            raise
-
-
 # Retry helper for WebSocket broadcasts with exponential backoff
 async def broadcast_with_retry(ws_manager, method_name, *args, max_retries=3, **kwargs):
     """Call a WebSocket broadcast method with exponential backoff retry"""
@@ -204,111 +74,29 @@ async def broadcast_with_retry(ws_manager, method_name, *args, max_retries=3, **
             await asyncio.sleep(wait_time)
 
 
-# Redis Pub/Sub channel for cross-worker WebSocket sync
-REDIS_WS_CHANNEL = "ws:pharmacist:events"
+# Global WebSocket manager instance
+ws_manager = WebSocketConnectionManager()
+# Redis Pub/Sub по топикам: подписки worker'а следуют за открытыми сокетами
+ws_event_bus = WebSocketEventBus(ws_manager)
 
 
 async def publish_to_redis(message: dict):
     """
-    Publish event to Redis Pub/Sub channel for cross-worker sync.
+    Publish event to Redis Streams + Pub/Sub: доставка сокетам всех workers,
+    включая текущий, и replay при переподключении.
     Возвращает True при успехе, False при ошибке.
     """
-    try:
-        r = await get_redis_client()
-        await r.publish(REDIS_WS_CHANNEL, json.dumps(message, default=str))
-        logger.info(f"✅ Redis published: {message.get('type', 'unknown')}")
-        return True
-    except Exception as e:
-        logger.error(f"❌ Redis publish failed: {e}", exc_info=True)
-        return False
-
-
-async def redis_ws_listener():
-    """
-    Background task: listen to Redis Pub/Sub and broadcast locally.
-    Улучшенная версия с retry логикой и детальным логированием.
-    """
-    while True:
-        try:
-            r = await get_redis_client()
-            pubsub = r.pubsub()
-            await pubsub.subscribe(REDIS_WS_CHANNEL)
-            logger.info("✅ Redis WS listener subscribed to channel")
-            async for msg in pubsub.listen():
-                if msg["type"] == "message":
-                    try:
-                        data = json.loads(msg["data"])
-                        event_type = data.get("type", "")
-                        logger.info(f"📨 Redis received event: {event_type}")
-
-                        if event_type == "message_update":
-                            question_id = data.get("question_id", "")
-                            message_data = data.get("message_data", {})
-                            if not question_id or not message_data:
-                                logger.error(f"Invalid message_update data: {data}")
-                                continue
-                            await ws_manager.broadcast_message_update(
-                                question_id,
-                                message_data,
-                            )
-                        elif event_type == "new_question":
-                            question_data = data.get("question_data", {})
-                            if not question_data:
-                                logger.error(f"Invalid new_question data: {data}")
-                                continue
-                            await ws_manager.broadcast_new_question(question_data)
-                        elif event_type == "question_assigned":
-                            await ws_manager.broadcast(data)
-                        elif event_type == "user_completion":
-                            question_id = data.get("question_id", "")
-                            if not question_id:
-                                logger.error(f"Invalid user_completion data: {data}")
-                                continue
-                            await ws_manager.broadcast_to_consultation(
-                                question_id,
-                                {
-                                    "type": "question_completed",
-                                    "question_id": question_id,
-                                    "completed_by": data.get("completed_by", ""),
-                                    "status": "completed",
-                                },
-                            )
-                        else:
-                            await ws_manager.broadcast(data)
-                    except json.JSONDecodeError as e:
-                        logger.error(f"❌ Redis WS JSON decode error: {e}")
-                    except Exception as e:
-                        logger.error(
-                            f"❌ Redis WS message processing error: {e}", exc_info=True
-                        )
-                        await asyncio.sleep(0.1)
-        except Exception as e:
-            logger.error(
-                f"Redis WS listener error: {e}, restarting in 5s", exc_info=True
-            )
-            await asyncio.sleep(5)
-
-
-# Global WebSocket manager instance
-ws_manager = WebSocketConnectionManager()
-# Global reference for the listener task
-_redis_listener_task = None
+    return await ws_event_bus.publish(message)
 
 
 def start_redis_listener():
     """Start the Redis Pub/Sub listener background task"""
-    global _redis_listener_task
-    if _redis_listener_task is None or _redis_listener_task.done():
-        _redis_listener_task = asyncio.create_task(redis_ws_listener())
-        logger.info("Redis WS listener task started")
+    ws_event_bus.start()
 
 
 def stop_redis_listener():
     """Stop the Redis Pub/Sub listener background task"""
-    global _redis_listener_task
-    if _redis_listener_task and not _redis_listener_task.done():
-        _redis_listener_task.cancel()
-        logger.info("Redis WS listener task stopped")
+    ws_event_bus.stop()
 
 
 # Pydantic Schemas
@@ -344,16 +132,57 @@ class ConsultationStats(BaseModel):
 
 
 # Helper functions
-async def get_questions_query(status_filter: Optional[str] = None):
-    """Build base query for questions with filters"""
-    query = select(Question).options(
-        selectinload(Question.user), selectinload(Question.dialog_messages)
-    )
+def questions_page_query(status_filter: Optional[str], page: int, limit: int):
+    """Страница вопросов для дашборда одним запросом.
 
+    CTE страницы отдаёт вопросы и общее их число (``count(*) OVER ()`` до
+    LIMIT); автор присоединяется и сообщения считаются группировкой
+    qa_dialog_messages только для вопросов страницы — сами сообщения в ORM
+    не загружаются.
+    """
+    page_query = select(
+        Question.uuid,
+        Question.text,
+        Question.status,
+        Question.created_at,
+        Question.user_id,
+        func.count().over().label("total"),
+    )
     if status_filter:
-        query = query.where(Question.status == status_filter)
+        page_query = page_query.where(Question.status == status_filter)
+    page_rows = (
+        page_query.order_by(Question.created_at.desc())
+        .offset((page - 1) * limit)
+        .limit(limit)
+        .cte("page")
+    )
 
-    return query.order_by(Question.created_at.desc())
+    message_counts = (
+        select(
+            DialogMessage.question_id,
+            func.count().label("message_count"),
+        )
+        .where(DialogMessage.question_id.in_(select(page_rows.c.uuid)))
+        .group_by(DialogMessage.question_id)
+        .subquery("message_counts")
+    )
+
+    return (
+        select(
+            page_rows.c.uuid,
+            page_rows.c.text,
+            page_rows.c.status,
+            page_rows.c.created_at,
+            page_rows.c.total,
+            User.first_name,
+            User.last_name,
+            User.telegram_id,
+            func.coalesce(message_counts.c.message_count, 0).label("message_count"),
+        )
+        .join(User, User.uuid == page_rows.c.user_id)
+        .outerjoin(message_counts, message_counts.c.question_id == page_rows.c.uuid)
+        .order_by(page_rows.c.created_at.desc())
+    )
 
 
 # Routes
@@ -377,36 +206,33 @@ async def get_questions(
     }
     db_status = db_status_map.get(status, status) if status else None
 
-    # Get total count
-    count_query = select(func.count()).select_from(Question)
-    if db_status:
-        count_query = count_query.where(Question.status == db_status)
-
-    total_result = await db.execute(count_query)
-    total = total_result.scalar() or 0
-
-    # Get paginated questions
-    query = await get_questions_query(db_status)
-    query = query.offset((page - 1) * limit).limit(limit)
+    result = await db.execute(questions_page_query(db_status, page, limit))
+    rows = result.all()
 
-    result = await db.execute(query)
-    questions = result.scalars().all()
+    if rows:
+        total = rows[0].total
+    else:
+        # Страница за пределами списка — итог окна недоступен, считаем отдельно
+        count_query = select(func.count()).select_from(Question)
+        if db_status:
+            count_query = count_query.where(Question.status == db_status)
+        total = (await db.execute(count_query)).scalar() or 0
 
     # Convert to response format
     questions_data = []
-    for q in questions:
-        user_name = f"{q.user.first_name or ''} {q.user.last_name or ''}".strip()
+    for row in rows:
+        user_name = f"{row.first_name or ''} {row.last_name or ''}".strip()
         if not user_name:
-            user_name = f"User {q.user.telegram_id}"
+            user_name = f"User {row.telegram_id}"
 
         questions_data.append(
             QuestionResponse(
-                uuid=str(q.uuid),
-                text=str(q.text),
-                status=str(q.status),
-                created_at=q.created_at,
+                uuid=str(row.uuid),
+                text=str(row.text),
+                status=str(row.status),
+                created_at=row.created_at,
                 user_name=user_name,
-                message_count=len(q.dialog_messages),
+                message_count=row.message_count,
             )
         )
 
@@ -525,29 +351,18 @@ async def answer_question(
         "message_data": message_data,
     }
 
-    broadcast_success = False
-    redis_success = False
-
+    # Через Redis событие доходит до сокетов всех workers; без Redis —
+    # только до сокетов этого worker'а
     try:
-        await ws_manager.broadcast_message_update(**ws_msg_data)
-        broadcast_success = True
-        logger.info(f"WebSocket broadcast sent for answer to {question_id}")
+        if await publish_to_redis({"type": "message_update", **ws_msg_data}):
+            logger.info(f"WebSocket broadcast sent for answer to {question_id}")
+        else:
+            logger.critical(
+                f"Redis publish failed for answer to {question_id}, "
+                f"delivered to local WebSockets only"
+            )
     except Exception as e:
         logger.error(f"WebSocket broadcast failed for answer: {e}", exc_info=True)
-        # Критическая ошибка - пользователь может не получить сообщение
-
-    # Publish to Redis for cross-worker sync
-    try:
-        redis_success = await publish_to_redis(
-            {"type": "message_update", **ws_msg_data}
-        )
-    except Exception as e:
-        logger.error(f"Redis publish failed for answer: {e}", exc_info=True)
-
-    # Если оба канала failed - это критическая ситуация
-    if not broadcast_success and not redis_success:
-        logger.critical(f"Both WebSocket and Redis failed for answer to {question_id}")
-        # Можно добавить уведомление администратору
 
     # 2. Telegram notification to user (if user has telegram_id)
     try:
@@ -647,28 +462,10 @@ async def complete_question(
         "completed_by": str(pharmacist.uuid),
         "status": "completed",
     }
-    try:
-        await ws_manager.broadcast(complete_data)
-        logger.info(f"Completion broadcast sent to pharmacists for {question_id}")
-    except Exception as e:
-        logger.warning(
-            f"Completion broadcast to pharmacists failed (non-critical): {e}"
-        )
-
-    # Send completion event to user's WebSocket
-    try:
-        await ws_manager.broadcast_to_consultation(
-            str(question.uuid),
-            complete_data,
-        )
-        logger.info(f"Completion event sent to user WebSocket for {question_id}")
-    except Exception as e:
-        logger.warning(f"Completion broadcast to user failed (non-critical): {e}")
-
     await publish_to_redis(complete_data)
 
-    # Publish user_completion event for cross-worker sync to user websockets
-    await publish_to_redis({"type": "user_completion", **complete_data})
+    # Completion event for the user's WebSocket (consultation channel)
+    await publish_to_redis({**complete_data, "type": "user_completion"})
 
     logger.info(f"Pharmacist {pharmacist.uuid} completed question {question_id}")
 
@@ -707,12 +504,6 @@ async def assign_question(
         "question_id": question_id,
         "assigned_to": str(pharmacist.uuid),
     }
-    try:
-        await ws_manager.broadcast(assign_data)
-        logger.info(f"Assignment broadcast sent for {question_id}")
-    except Exception as e:
-        logger.warning(f"Assignment broadcast failed (non-critical): {e}")
-    # Publish to Redis for cross-worker sync
     await publish_to_redis(assign_data)
 
     return {"message": "Question assigned successfully"}
@@ -737,42 +528,12 @@ async def get_consultation_stats(
     pharmacist: Pharmacist = Depends(get_current_pharmacist),
 ):
     """Get consultation statistics"""
-
-    pending_result = await db.execute(
-        select(func.count()).where(Question.status == "pending")
-    )
-    pending_count = pending_result.scalar() or 0
-
-    in_progress_result = await db.execute(
-        select(func.count()).where(Question.status == "in_progress")
-    )
-    in_progress_count = in_progress_result.scalar() or 0
-
-    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    completed_result = await db.execute(
-        select(func.count()).where(
-            and_(Question.status == "completed", Question.created_at >= today_start)
-        )
-    )
-    completed_today = completed_result.scalar() or 0
-
-    week_ago = datetime.utcnow() - timedelta(days=7)
-    avg_time_result = await db.execute(
-        select(func.avg(Question.answered_at - Question.created_at)).where(
-            and_(
-                Question.status.in_(["answered", "completed"]),
-                Question.created_at >= week_ago,
-            )
-        )
-    )
-    avg_time = avg_time_result.scalar()
-    avg_response_time = (avg_time.total_seconds() / 60) if avg_time else 0
-
+    stats = await get_question_stats(db)
     return ConsultationStats(
-        pending_count=pending_count,
-        in_progress_count=in_progress_count,
-        completed_today=completed_today,
-        avg_response_time_minutes=round(avg_response_time, 2),
+        pending_count=stats.pending,
+        in_progress_count=stats.in_progress,
+        completed_today=stats.completed_today,
+        avg_response_time_minutes=stats.avg_response_time_minutes,
     )
 
 
@@ -920,11 +681,6 @@ async def send_message(
             "created_at": msg.created_at.isoformat(),
         },
     }
-    try:
-        await ws_manager.broadcast_message_update(**ws_msg_data)
-    except Exception as ws_err:
-        logger.warning(f"WebSocket broadcast failed (non-critical): {ws_err}")
-    # Publish to Redis for cross-worker sync
     await publish_to_redis({"type": "message_update", **ws_msg_data})
 
     await db.commit()
@@ -978,12 +734,16 @@ async def send_message(
 async def websocket_endpoint(
     websocket: WebSocket,
     token: Optional[str] = None,
+    last_event_id: Optional[str] = None,
 ):
     """WebSocket connection for real-time consultation updates.
 
     Authentication: accepts session token via query parameter `token`.
     If token is invalid or missing, connection is still accepted for
     backward compatibility, but client should provide token for full access.
+
+    Reconnect: `last_event_id` — event_id последнего полученного события;
+    сервер досылает пропущенные события (см. services.ws_pubsub).
     """
     # Authenticate via query parameter token
     authenticated = False
@@ -1004,11 +764,12 @@ async def websocket_endpoint(
     if not authenticated:
         logger.info("WebSocket connecting without authentication (limited mode)")
 
-    await ws_manager.connect(websocket)
+    await ws_manager.connect(websocket, replay=True)
     logger.info(
         f"Pharmacist WebSocket connected (auth={authenticated}). "
         f"Total: {len(ws_manager.active_connections)}"
     )
+    await ws_event_bus.replay(websocket, last_event_id)
     try:
         while True:
             data = await websocket.receive_text()
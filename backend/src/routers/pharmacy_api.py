@@ -5,7 +5,7 @@ import logging
 from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
@@ -17,6 +17,14 @@ from db.booking_schemas import (
     BookingOrderResponse,
     PharmacyAPIConfigCreate,
 )
+from services.pagination import (
+    MAX_ORDERS_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+    InvalidCursorError,
+    apply_orders_keyset,
+    orders_page_size,
+    split_orders_page,
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -194,12 +202,19 @@ async def update_pharmacy_config(request: Request, db: AsyncSession = Depends(ge
 )
 async def get_pharmacy_orders(
     pharmacy_id: uuid.UUID,
+    response: Response,
     status: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_ORDERS_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
     request: Request = None,
     db: AsyncSession = Depends(get_db),
 ):
-    """Получение заказов конкретной аптеки с аутентификацией"""
+    """Получение заказов конкретной аптеки с аутентификацией
+
+    Поддерживает keyset-пагинацию (limit/cursor), как и GET /orders.
+    """
     try:
+        page_size = orders_page_size(cursor, limit)
         auth_header = request.headers.get("Authorization") if request else None
         token = None
         if auth_header and auth_header.lower().startswith("bearer "):
@@ -249,10 +264,14 @@ async def get_pharmacy_orders(
         )
         if status:
             query = query.where(BookingOrder.status == status)
-        query = query.order_by(BookingOrder.created_at.desc())
+        query = apply_orders_keyset(query, cursor, page_size)
 
         result = await db.execute(query)
-        orders = result.scalars().unique().all()
+        orders, next_cursor = split_orders_page(
+            result.scalars().unique().all(), page_size
+        )
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
 
         response_orders = []
         for order in orders:
@@ -288,6 +307,8 @@ async def get_pharmacy_orders(
 
     except HTTPException:
         raise
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception(f"Error fetching orders for pharmacy {pharmacy_id}")
         raise HTTPException(status_code=500, detail="Error fetching orders")
@@ -25,6 +25,7 @@ from auth.auth import (
 )
 from auth.security import get_api_key
 from services.user_service import get_or_create_user
+from services.question_stats import get_question_stats
 import logging
 from sqlalchemy.orm import selectinload  # ДОБАВИТЬ
 
@@ -129,31 +130,14 @@ async def create_question(
                 notify_pharmacists_about_new_question,
             )
 
-            asyncio.create_task(notify_pharmacists_about_new_question(new_question, db))
+            # Только выборка адресатов: отправка идёт в notification_dispatcher
+            await notify_pharmacists_about_new_question(new_question, db)
         except Exception as e:
             logger.warning(
                 f"Failed to send Telegram notification for new question: {e}"
             )
 
-        # WebSocket broadcast to pharmacist dashboard
-        try:
-            from routers.pharmacist_dashboard import ws_manager
-
-            await ws_manager.broadcast_new_question(
-                {
-                    "uuid": str(new_question.uuid),
-                    "text": new_question.text,
-                    "status": new_question.status,
-                    "created_at": new_question.created_at.isoformat(),
-                    "user_name": f"{user.first_name or ''} {user.last_name or ''}".strip()
-                    or f"User {user.telegram_id}",
-                    "message_count": 0,
-                }
-            )
-        except Exception as ws_err:
-            logger.warning(f"WebSocket broadcast failed for new question: {ws_err}")
-
-        # Redis Pub/Sub для cross-worker sync
+        # WebSocket: дашборд фармацевтов на всех workers (Redis Streams + Pub/Sub)
         try:
             from routers.pharmacist_dashboard import publish_to_redis
 
@@ -389,26 +373,12 @@ async def get_questions_stats(
 ):
     """Статистика по вопросам"""
     try:
-        # Общее количество вопросов
-        total_result = await db.execute(select(Question))
-        total = total_result.scalars().all()
-
-        # Вопросы по статусам
-        pending_result = await db.execute(
-            select(Question).where(Question.status == "pending")
-        )
-        pending = pending_result.scalars().all()
-
-        answered_result = await db.execute(
-            select(Question).where(Question.status == "answered")
-        )
-        answered = answered_result.scalars().all()
-
+        stats = await get_question_stats(db)
         return {
-            "total": len(total),
-            "pending": len(pending),
-            "answered": len(answered),
-            "answer_rate": len(answered) / len(total) if total else 0,
+            "total": stats.total,
+            "pending": stats.pending,
+            "answered": stats.answered,
+            "answer_rate": stats.answer_rate,
         }
 
     except Exception as e:
@@ -519,30 +489,14 @@ async def create_consultation(
                 notify_pharmacists_about_new_question,
             )
 
-            asyncio.create_task(notify_pharmacists_about_new_question(new_question, db))
+            # Только выборка адресатов: отправка идёт в notification_dispatcher
+            await notify_pharmacists_about_new_question(new_question, db)
         except Exception as e:
             logger.warning(
                 f"Failed to send Telegram notification for consultation: {e}"
             )
 
-        # WebSocket broadcast to pharmacist dashboard
-        try:
-            from routers.pharmacist_dashboard import ws_manager
-
-            await ws_manager.broadcast_new_question(
-                {
-                    "uuid": str(new_question.uuid),
-                    "text": new_question.text,
-                    "status": new_question.status,
-                    "created_at": new_question.created_at.isoformat(),
-                    "user_name": f"{current_user.first_name or 'Пользователь'} {current_user.last_name or ''}".strip(),
-                    "message_count": 0,
-                }
-            )
-        except Exception as ws_err:
-            logger.warning(f"WebSocket broadcast failed for consultation: {ws_err}")
-
-        # Redis Pub/Sub для cross-worker sync
+        # WebSocket: дашборд фармацевтов на всех workers (Redis Streams + Pub/Sub)
         try:
             from routers.pharmacist_dashboard import publish_to_redis
 
@@ -668,41 +622,12 @@ async def get_consultation_stats(
             detail="Требуется авторизация.",
         )
     try:
-        # Total count
-        total_result = await db.execute(
-            select(Question).where(Question.user_id == current_user.uuid)
-        )
-        total = total_result.scalars().all()
-
-        # Pending count
-        pending_result = await db.execute(
-            select(Question).where(
-                Question.user_id == current_user.uuid, Question.status == "pending"
-            )
-        )
-        pending = pending_result.scalars().all()
-
-        # Answered count
-        answered_result = await db.execute(
-            select(Question).where(
-                Question.user_id == current_user.uuid, Question.status == "answered"
-            )
-        )
-        answered = answered_result.scalars().all()
-
-        # Completed count
-        completed_result = await db.execute(
-            select(Question).where(
-                Question.user_id == current_user.uuid, Question.status == "completed"
-            )
-        )
-        completed = completed_result.scalars().all()
-
+        stats = await get_question_stats(db, current_user.uuid)
         return ConsultationStats(
-            total_count=len(total),
-            pending_count=len(pending),
-            answered_count=len(answered),
-            completed_count=len(completed),
+            total_count=stats.total,
+            pending_count=stats.pending,
+            answered_count=stats.answered,
+            completed_count=stats.completed,
         )
 
     except Exception as e:
@@ -877,12 +802,15 @@ async def send_consultation_message(
 
         # 1. WebSocket broadcast to pharmacist dashboard
         try:
-            from routers.pharmacist_dashboard import ws_manager, create_message_data
+            from routers.pharmacist_dashboard import publish_to_redis, create_message_data
 
             message_data = create_message_data(new_message)
-            await ws_manager.broadcast_message_update(
-                question_id=consultation_id,
-                message_data=message_data,
+            await publish_to_redis(
+                {
+                    "type": "message_update",
+                    "question_id": consultation_id,
+                    "message_data": message_data,
+                }
             )
             logger.info(
                 f"WebSocket broadcast sent for user message in {consultation_id}"
@@ -1030,30 +958,14 @@ async def create_public_question(
                 notify_pharmacists_about_new_question,
             )
 
-            asyncio.create_task(notify_pharmacists_about_new_question(new_question, db))
+            # Только выборка адресатов: отправка идёт в notification_dispatcher
+            await notify_pharmacists_about_new_question(new_question, db)
         except Exception as e:
             logger.warning(
                 f"Failed to send Telegram notification for public question: {e}"
             )
 
-        # Broadcast to pharmacist dashboard via WebSocket
-        try:
-            from routers.pharmacist_dashboard import ws_manager
-
-            await ws_manager.broadcast_new_question(
-                {
-                    "uuid": str(new_question.uuid),
-                    "text": new_question.text,
-                    "status": new_question.status,
-                    "created_at": new_question.created_at.isoformat(),
-                    "user_name": "Гость",
-                    "message_count": 0,
-                }
-            )
-        except Exception as ws_err:
-            logger.warning(f"WebSocket broadcast failed (non-critical): {ws_err}")
-
-        # Redis Pub/Sub для cross-worker sync
+        # WebSocket: дашборд фармацевтов на всех workers (Redis Streams + Pub/Sub)
         try:
             from routers.pharmacist_dashboard import publish_to_redis
 
@@ -1236,17 +1148,20 @@ async def send_public_question_message(
 
         # Broadcast via WebSocket to pharmacist dashboard
         try:
-            from routers.pharmacist_dashboard import ws_manager
+            from routers.pharmacist_dashboard import publish_to_redis
 
-            await ws_manager.broadcast_message_update(
-                question_id=question_id,
-                message_data={
-                    "uuid": str(new_message.uuid),
+            await publish_to_redis(
+                {
+                    "type": "message_update",
                     "question_id": question_id,
-                    "sender_type": "user",
-                    "text": new_message.text,
-                    "created_at": new_message.created_at.isoformat(),
-                },
+                    "message_data": {
+                        "uuid": str(new_message.uuid),
+                        "question_id": question_id,
+                        "sender_type": "user",
+                        "text": new_message.text,
+                        "created_at": new_message.created_at.isoformat(),
+                    },
+                }
             )
         except Exception as ws_err:
             logger.warning(f"WebSocket broadcast failed (non-critical): {ws_err}")
@@ -1261,30 +1176,21 @@ async def send_public_question_message(
             pharmacists = ph_result.scalars().all()
 
             if pharmacists:
-                from bot.core import bot_manager
                 from bot.keyboards.qa_keyboard import make_question_keyboard
-
-                if bot_manager.bot:
-                    bot = bot_manager.bot
-                    for pharmacist in pharmacists:
-                        if pharmacist.user and pharmacist.user.telegram_id:
-                            try:
-                                await bot.send_message(
-                                    chat_id=pharmacist.user.telegram_id,
-                                    text=(
-                                        f"💬 <b>Новое сообщение от пользователя</b>\n\n"
-                                        f"{message.text}\n\n"
-                                    ),
-                                    parse_mode="HTML",
-                                    reply_markup=make_question_keyboard(question_id),
-                                )
-                            except Exception as tg_err:
-                                logger.warning(
-                                    f"Telegram notification to pharmacist {pharmacist.user.telegram_id} failed: {tg_err}"
-                                )
-                            logger.info(
-                                f"Telegram notification sent to pharmacist {pharmacist.user.telegram_id}"
-                            )
+                from bot.services.notification_dispatcher import notification_dispatcher
+
+                queued = await notification_dispatcher.notify(
+                    [
+                        pharmacist.user.telegram_id
+                        for pharmacist in pharmacists
+                        if pharmacist.user and pharmacist.user.telegram_id
+                    ],
+                    f"💬 <b>Новое сообщение от пользователя</b>\n\n"
+                    f"{message.text}\n\n",
+                    parse_mode="HTML",
+                    reply_markup=make_question_keyboard(question_id),
+                )
+                logger.info(f"Telegram notification queued for {queued} pharmacists")
         except Exception as tg_err:
             logger.warning(
                 f"Telegram notification to pharmacists failed (non-critical): {tg_err}"
@@ -5,6 +5,7 @@ import os
 import json
 
 from bot.core import bot_manager
+from bot.services.update_queue import UPDATES, is_duplicate_update, update_queue
 
 
 from fastapi import Depends, status
@@ -55,12 +56,15 @@ async def telegram_webhook(request: Request):
                 logger.warning("Invalid secret token")
                 return {"status": "error", "detail": "Unauthorized"}
 
+        # В режиме очереди bot и dp берёт фоновый обработчик (feed_update)
+        queued = update_queue.running
+
         # ✅ Используем уже инициализированные bot и dp
         bot = bot_manager.get_bot()
         dp = bot_manager.get_dp()
 
         # Авто-реинициализация после /qa/drop (если bot/dp были сброшены)
-        if not bot or not dp:
+        if not queued and (not bot or not dp):
             logger.warning(
                 "Bot or dispatcher not initialized, attempting auto-reinitialization..."
             )
@@ -98,6 +102,19 @@ async def telegram_webhook(request: Request):
                 f"📨 Webhook: Update id={update.update_id}, type={update.event_type}"
             )
 
+        if queued:
+            # Очередь переполнена — не-2xx, Telegram доставит обновление повторно
+            if update_queue.full:
+                UPDATES.labels(outcome="rejected").inc()
+                logger.warning(f"Update queue full, rejecting update {update.update_id}")
+                raise HTTPException(status_code=503, detail="Update queue is full")
+            if await is_duplicate_update(update.update_id):
+                UPDATES.labels(outcome="duplicate").inc()
+                logger.info(f"Update {update.update_id} already received, skipping")
+                return {"status": "ok"}
+            update_queue.submit(update)
+            return {"status": "ok"}
+
         # Обработка обновления
         try:
             result = await dp.feed_update(bot, update)
@@ -115,6 +132,8 @@ async def telegram_webhook(request: Request):
 
         return {"status": "ok"}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Webhook processing error: {str(e)}", exc_info=True)
         return {"status": "error", "detail": str(e)}
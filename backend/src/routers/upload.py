@@ -1,6 +1,9 @@
 # upload.py - обновленная версия
+import asyncio
+import hashlib
 import os
 import re
+from typing import Tuple
 from fastapi import APIRouter, UploadFile, File, HTTPException, status, Depends, Request
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 import secrets
@@ -10,6 +13,7 @@ import logging
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from tasks.tasks_increment import process_csv_incremental
+from tasks.import_preview import apply_csv_import_preview, preview_csv_import
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -20,10 +24,15 @@ CORRECT_USERNAME = os.getenv("CORRECT_USERNAME")
 CORRECT_PASSWORD = os.getenv("CORRECT_PASSWORD")
 
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_DIR = "/app/uploaded_csv"  # volume, общий с celery worker
+# Файлы dry-run: <сеть>_<номер>_<sha256>.csv, по одному на аптеку
+PREVIEW_DIR = os.path.join(UPLOAD_DIR, "previews")
 ALLOWED_EXTENSIONS = {".csv"}
 
 # Safe pattern: only alphanumeric, hyphens, underscores allowed
 SAFE_NAME_PATTERN = re.compile(r"^[a-zA-Z0-9_-]+$")
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
 
 
 def authenticate_pharmacy(credentials: HTTPBasicCredentials = Depends(security)):
@@ -50,6 +59,63 @@ def authenticate_pharmacy(credentials: HTTPBasicCredentials = Depends(security))
     return credentials.username
 
 
+def validate_pharmacy_path(pharmacy_name: str, pharmacy_number: str):
+    # Sanitize path parameters — prevent path traversal
+    if not SAFE_NAME_PATTERN.match(pharmacy_name):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pharmacy name. Only letters, numbers, hyphens, and underscores allowed.",
+        )
+    if not SAFE_NAME_PATTERN.match(pharmacy_number):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pharmacy number. Only letters, numbers, hyphens, and underscores allowed.",
+        )
+
+
+def preview_file_path(pharmacy_name: str, pharmacy_number: str, digest: str) -> str:
+    return os.path.join(PREVIEW_DIR, f"{pharmacy_name}_{pharmacy_number}_{digest}.csv")
+
+
+def remove_stale_previews(pharmacy_name: str, pharmacy_number: str, keep: str):
+    """Удаляет файлы прошлых dry-run аптеки, кроме keep."""
+    pattern = re.compile(
+        rf"^{re.escape(pharmacy_name)}_{re.escape(pharmacy_number)}_[0-9a-f]{{64}}\.csv$"
+    )
+    for name in os.listdir(PREVIEW_DIR):
+        path = os.path.join(PREVIEW_DIR, name)
+        if pattern.match(name) and path != keep:
+            os.remove(path)
+
+
+async def save_upload(file: UploadFile, file_path: str) -> Tuple[int, str]:
+    """Сохраняет загрузку частями; возвращает (размер, sha256 содержимого).
+
+    Файл пишется во временный и атомарно подменяет старый: worker, читающий
+    предыдущую загрузку, дочитает свою версию.
+    """
+    tmp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+    file_size = 0
+    digest = hashlib.sha256()
+    try:
+        with open(tmp_path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                file_size += len(chunk)
+                # Проверка размера
+                if file_size > MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Файл слишком большой. Максимум: {MAX_FILE_SIZE // (1024*1024)}MB",
+                    )
+                digest.update(chunk)
+                f.write(chunk)
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return file_size, digest.hexdigest()
+
+
 @router.post("/upload/{pharmacy_name}/{pharmacy_number}/")
 @limiter.limit("5/minute")
 async def upload_file(
@@ -58,25 +124,17 @@ async def upload_file(
     pharmacy_number: str,
     file: UploadFile = File(...),
     district: str | None = None,
+    dry_run: bool = False,
     username: str = Depends(authenticate_pharmacy),
 ):
     """Загрузка CSV файла аптеки. Максимум 50MB, только CSV.
 
     Параметры:
     - district: район аптеки (напр. 'Фрунзенский р-н') — извлекается из адреса tabletka.by
+    - dry_run: только посчитать изменения (задача preview_csv_import); diff
+      сохраняется и применяется вызовом /upload/.../apply/{digest}/
     """
-
-    # Sanitize path parameters — prevent path traversal
-    if not SAFE_NAME_PATTERN.match(pharmacy_name):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid pharmacy name. Only letters, numbers, hyphens, and underscores allowed.",
-        )
-    if not SAFE_NAME_PATTERN.match(pharmacy_number):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid pharmacy number. Only letters, numbers, hyphens, and underscores allowed.",
-        )
+    validate_pharmacy_path(pharmacy_name, pharmacy_number)
 
     # Проверка расширения файла (MIME type при upload часто application/octet-stream)
     filename = file.filename or ""
@@ -92,63 +150,60 @@ async def upload_file(
             f"Starting upload for pharmacy: {pharmacy_name}, number: {pharmacy_number}, user: {username}"
         )
 
-        # Читаем файл как байты
-        file_bytes = await file.read()
-
-        # Проверка размера
-        if len(file_bytes) > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail=f"Файл слишком большой. Максимум: {MAX_FILE_SIZE // (1024*1024)}MB",
-            )
-
-        logger.info(
-            f"File: {file.filename}, size: {len(file_bytes)} bytes ({len(file_bytes) / 1024:.1f} KB)"
-        )
-
         # Сохраняем в /app/uploaded_csv (смонтированный volume)
-        save_dir = "/app/uploaded_csv"
-        os.makedirs(save_dir, exist_ok=True)
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
         file_name = f"{pharmacy_name}_{pharmacy_number}.csv"
-        file_path = os.path.join(save_dir, file_name)
+        file_path = os.path.join(UPLOAD_DIR, file_name)
 
-        # Double-check: ensure file_path is within save_dir (defense in depth)
-        if not file_path.startswith(save_dir + os.sep):
+        # Double-check: ensure file_path is within UPLOAD_DIR (defense in depth)
+        if not file_path.startswith(UPLOAD_DIR + os.sep):
             logger.critical(f"Path traversal attempt blocked: {file_path}")
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Invalid file path",
             )
 
-        # Просто перезаписываем файл
-        with open(file_path, "wb") as f:
-            f.write(file_bytes)
+        if dry_run:
+            os.makedirs(PREVIEW_DIR, exist_ok=True)
+            # Имя по sha256 известно только после записи
+            file_path = preview_file_path(pharmacy_name, pharmacy_number, uuid.uuid4().hex)
+
+        file_size, digest = await save_upload(file, file_path)
 
-        # Пробуем разные кодировки
-        content = None
-        encodings_to_try = ["utf-8", "windows-1251", "cp1251", "iso-8859-5"]
+        logger.info(
+            f"File: {file.filename}, size: {file_size} bytes ({file_size / 1024:.1f} KB), "
+            f"sha256: {digest}"
+        )
 
-        for encoding in encodings_to_try:
+        if dry_run:
+            preview_path = preview_file_path(pharmacy_name, pharmacy_number, digest)
+            os.replace(file_path, preview_path)
+            remove_stale_previews(pharmacy_name, pharmacy_number, keep=preview_path)
             try:
-                content = file_bytes.decode(encoding)
-                logger.info(f"Successfully decoded file with encoding: {encoding}")
-                break
-            except UnicodeDecodeError:
-                continue
-
-        # Если ни одна кодировка не подошла, используем utf-8 с заменой ошибок
-        if content is None:
-            logger.warning(
-                "Could not decode file with any encoding, using utf-8 with error replacement"
-            )
-            content = file_bytes.decode("utf-8", errors="replace")
+                task = preview_csv_import.delay(
+                    preview_path, pharmacy_name, pharmacy_number, digest
+                )
+                logger.info(f"Celery preview task created: {task.id}")
+            except Exception as celery_error:
+                logger.error(
+                    f"Failed to enqueue Celery task: {celery_error}", exc_info=True
+                )
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="CSV processing service unavailable. Please try again later.",
+                )
+            return {
+                "status": "success",
+                "task_id": task.id,
+                "digest": digest,
+                "message": "Import preview started",
+            }
 
         # Запускаем задачу Celery
-        from tasks.tasks_increment import process_csv_incremental
-
         try:
+            # Кодировку определяет worker при чтении файла
             task = process_csv_incremental.delay(
-                content, pharmacy_name, pharmacy_number, district
+                file_path, pharmacy_name, pharmacy_number, district
             )
             logger.info(f"Celery task created: {task.id} (district={district})")
         except Exception as celery_error:
@@ -174,3 +229,72 @@ async def upload_file(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing file: {type(e).__name__}",
         )
+
+
+@router.post("/upload/{pharmacy_name}/{pharmacy_number}/apply/{digest}/")
+@limiter.limit("5/minute")
+async def apply_upload_preview(
+    request: Request,
+    pharmacy_name: str,
+    pharmacy_number: str,
+    digest: str,
+    district: str | None = None,
+    username: str = Depends(authenticate_pharmacy),
+):
+    """Применяет dry-run загрузки (digest — sha256 из ответа dry_run=true).
+
+    Worker применяет сохранённый diff без повторного разбора; если товары
+    аптеки изменились после preview или diff истёк, файл импортируется заново.
+    """
+    validate_pharmacy_path(pharmacy_name, pharmacy_number)
+    if not DIGEST_PATTERN.match(digest):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid digest"
+        )
+
+    file_path = preview_file_path(pharmacy_name, pharmacy_number, digest)
+    if not os.path.exists(file_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Preview not found. Upload the file with dry_run=true first.",
+        )
+
+    try:
+        task = apply_csv_import_preview.delay(
+            file_path, pharmacy_name, pharmacy_number, digest, district
+        )
+        logger.info(f"Celery apply task created: {task.id} (user={username})")
+    except Exception as celery_error:
+        logger.error(f"Failed to enqueue Celery task: {celery_error}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="CSV processing service unavailable. Please try again later.",
+        )
+
+    return {
+        "status": "success",
+        "task_id": task.id,
+        "digest": digest,
+        "message": "Import preview apply started",
+    }
+
+
+@router.get("/upload/tasks/{task_id}/")
+async def get_upload_task(
+    task_id: str, username: str = Depends(authenticate_pharmacy)
+):
+    """Состояние задачи загрузки; для dry-run в result — сводка изменений."""
+    from celery.result import AsyncResult
+
+    from tasks.celery_app import celery
+
+    def read_result():
+        result = AsyncResult(task_id, app=celery)
+        if result.successful():
+            return result.state, result.result
+        if result.failed():
+            return result.state, {"error": str(result.result)}
+        return result.state, None
+
+    state, result = await asyncio.to_thread(read_result)
+    return {"task_id": task_id, "state": state, "result": result}
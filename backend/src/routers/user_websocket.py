@@ -1,9 +1,10 @@
 """WebSocket endpoints for user chat widget (separate from pharmacist dashboard)"""
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from typing import Optional
 import logging
 
-from routers.pharmacist_dashboard import ws_manager
+from routers.pharmacist_dashboard import ws_event_bus, ws_manager
 
 logger = logging.getLogger(__name__)
 
@@ -14,18 +15,20 @@ router = APIRouter(prefix="/ws", tags=["User WebSocket"])
 async def user_chat_websocket(
     websocket: WebSocket,
     consultation_id: str,
+    last_event_id: Optional[str] = None,
 ):
     """
     WebSocket connection for user chat widget.
     Subscribes to real-time updates for a specific consultation.
 
-    Endpoint: /api/ws/chat/{consultation_id}
+    Endpoint: /api/ws/chat/{consultation_id}?last_event_id=...
     Used by: ChatContext.jsx (frontend user widget)
     """
-    await ws_manager.connect_user(websocket, consultation_id)
+    await ws_manager.connect_user(websocket, consultation_id, replay=True)
     logger.info(
         f"User WebSocket connected for consultation {consultation_id}. Total: {len(ws_manager.active_connections)}"
     )
+    await ws_event_bus.replay(websocket, last_event_id)
     try:
         while True:
             data = await websocket.receive_text()
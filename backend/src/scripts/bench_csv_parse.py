@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Бенчмарк разбора CSV аптеки (без БД): чтение файла, нормализация, хэши.
+
+Генерирует синтетический файл (как scripts.bench_csv_import) и замеряет
+iter_csv_file_lines + process_csv_data_with_hashes — этап, который
+выполняется до обращения к Postgres.
+
+    python -m scripts.bench_csv_parse --rows 100000 --runs 3
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+from scripts.bench_csv_import import make_file
+
+
+def main(rows: int, runs: int):
+    from tasks.tasks_increment import iter_csv_file_lines, process_csv_data_with_hashes
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = make_file(directory, range(rows))
+        size_mb = os.path.getsize(file_path) / 1024 / 1024
+
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            products, _, errors = process_csv_data_with_hashes(
+                iter_csv_file_lines(file_path), uuid.uuid4()
+            )
+            timings.append(time.perf_counter() - started)
+
+    best = min(timings)
+    print(
+        f"{rows} rows ({size_mb:.1f} MB): best {best:.2f}s, "
+        f"median {statistics.median(timings):.2f}s — {rows / best:.0f} rows/s "
+        f"({len(products)} products, {len(errors)} errors)"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    main(args.rows, args.runs)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Бенчмарк рассылки WebSocket-событий дашборда фармацевта.
+
+Сравнивает broadcast на ``--pharmacists`` сокетов при ``--users`` открытых
+чатах пользователей:
+
+- legacy   — как было: последовательный ``await send_json`` каждому
+  фармацевту и пересборка множества сокетов пользователей на каждой
+  итерации (O(фармацевты × пользователи));
+- registry — services.ws_registry: индекс фармацевтов, одна сериализация и
+  очереди соединений с отдельными writer-задачами.
+
+Доля ``--slow`` сокетов отвечает с задержкой ``--slow-delay-ms`` мс. Для
+registry отдельно замеряется возврат из broadcast и доставка всем быстрым
+клиентам. БД и Redis не нужны.
+
+    python -m scripts.bench_ws_broadcast --pharmacists 5000 --users 1000 --slow 0.01
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from services.ws_registry import WebSocketConnectionManager
+
+
+class SimulatedWebSocket:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.received = 0
+        self.delivered = None
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message: dict):
+        await self.send_text(json.dumps(message))
+
+    async def send_text(self, text: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        else:
+            await asyncio.sleep(0)
+        self.received += 1
+        if self.delivered is not None and not self.delivered.done():
+            self.delivered.set_result(None)
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+async def legacy_broadcast(active_connections, user_connections, message: dict):
+    """Прежний WebSocketConnectionManager.broadcast."""
+    for connection in active_connections:
+        all_user_sockets = set()
+        for sockets in user_connections.values():
+            all_user_sockets.update(sockets)
+        if connection in all_user_sockets:
+            continue
+        await connection.send_json(message)
+
+
+def make_sockets(pharmacists: int, users: int, slow: float, slow_delay: float):
+    slow_count = int(pharmacists * slow)
+    pharmacist_sockets = [
+        SimulatedWebSocket(slow_delay if i < slow_count else 0.0) for i in range(pharmacists)
+    ]
+    user_sockets = {f"q{i}": [SimulatedWebSocket()] for i in range(users)}
+    return pharmacist_sockets, user_sockets
+
+
+async def run_legacy(args, message: dict) -> list:
+    pharmacist_sockets, user_sockets = make_sockets(
+        args.pharmacists, args.users, args.slow, args.slow_delay
+    )
+    active = set(pharmacist_sockets)
+    for sockets in user_sockets.values():
+        active.update(sockets)
+    user_connections = {qid: set(sockets) for qid, sockets in user_sockets.items()}
+
+    timings = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        await legacy_broadcast(active, user_connections, message)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+async def run_registry(args, message: dict):
+    pharmacist_sockets, user_sockets = make_sockets(
+        args.pharmacists, args.users, args.slow, args.slow_delay
+    )
+    manager = WebSocketConnectionManager(queue_size=args.runs + 1)
+    for websocket in pharmacist_sockets:
+        await manager.connect(websocket)
+    for qid, sockets in user_sockets.items():
+        for websocket in sockets:
+            await manager.connect_user(websocket, qid)
+
+    fast = [ws for ws in pharmacist_sockets if not ws.delay]
+    call_timings, delivery_timings = [], []
+    for _ in range(args.runs):
+        loop = asyncio.get_running_loop()
+        for websocket in fast:
+            websocket.delivered = loop.create_future()
+        started = time.perf_counter()
+        await manager.broadcast(message)
+        call_timings.append((time.perf_counter() - started) * 1000)
+        await asyncio.gather(*(websocket.delivered for websocket in fast))
+        delivery_timings.append((time.perf_counter() - started) * 1000)
+
+    for websocket in list(manager.active_connections):
+        manager.disconnect(websocket)
+    return call_timings, delivery_timings
+
+
+def summary(timings: list) -> str:
+    p95 = statistics.quantiles(timings, n=100)[94] if len(timings) > 1 else timings[0]
+    return f"p50={statistics.median(timings):9.2f} ms  p95={p95:9.2f} ms"
+
+
+async def main(args):
+    message = {"type": "new_question", "data": {"uuid": "bench", "text": "x" * 200}}
+    print(
+        f"{args.pharmacists} pharmacist sockets, {args.users} user sockets, "
+        f"{args.slow:.0%} slow ({args.slow_delay * 1000:.0f} ms)"
+    )
+    legacy = await run_legacy(args, message)
+    print(f"legacy   broadcast:          {summary(legacy)}")
+    call, delivery = await run_registry(args, message)
+    print(f"registry broadcast call:     {summary(call)}")
+    print(f"registry fast delivery:      {summary(delivery)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pharmacists", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--slow", type=float, default=0.01)
+    parser.add_argument("--slow-delay-ms", type=float, default=50)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    args.slow_delay = args.slow_delay_ms / 1000
+    asyncio.run(main(args))
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Проверка согласованности product_groups с таблицей products.
+
+Пересчитывает агрегаты групп из products и сравнивает с product_groups.
+Код выхода 1 — найдены расхождения; ``--fix`` пересобирает таблицу целиком.
+
+    python -m scripts.check_product_groups
+    python -m scripts.check_product_groups --fix
+"""
+import argparse
+import asyncio
+import logging
+import sys
+
+from db.database import get_async_connection
+from services.product_groups import find_product_group_drift, rebuild_product_groups
+
+
+async def main(fix: bool, sample: int) -> int:
+    conn = await get_async_connection()
+    try:
+        report = await find_product_group_drift(conn, sample=sample)
+        print(
+            f"missing={report['missing']} extra={report['extra']} "
+            f"mismatched={report['mismatched']}"
+        )
+        for row in report["examples"]:
+            print(
+                f"  {row['kind']:10s} [{row['scope']}] {row['name']} | {row['form']}"
+                f" | {row['manufacturer']} | {row['country']}"
+            )
+
+        drift = report["missing"] + report["extra"] + report["mismatched"]
+        if drift and fix:
+            rows = await rebuild_product_groups(conn)
+            print(f"product_groups rebuilt: {rows} rows")
+            return 0
+        return 1 if drift else 0
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fix", action="store_true", help="пересобрать таблицу")
+    parser.add_argument("--sample", type=int, default=20)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.fix, args.sample)))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Пакетный импорт CSV нескольких аптек (process_csv_batch_async).
+
+Имя файла — как у routers/upload.py: ``<сеть>_<номер аптеки>.csv``. Без
+аргументов импортируются все CSV из /app/uploaded_csv. Печатает время этапов
+по каждой аптеке (см. tasks/import_metrics.py) и общую скорость.
+
+    python -m scripts.import_csv_batch --concurrency 4
+    python -m scripts.import_csv_batch /data/novamedika_12.csv /data/ekliniya_3.csv
+    python -m scripts.import_csv_batch --celery   # поставить задачу в очередь
+"""
+import argparse
+import asyncio
+import glob
+import logging
+import os
+import sys
+
+UPLOAD_DIR = "/app/uploaded_csv"
+
+
+def describe_file(file_path: str) -> dict:
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    pharmacy_name, _, pharmacy_number = stem.partition("_")
+    if not pharmacy_number:
+        raise ValueError(f"Expected <chain>_<number>.csv, got {file_path}")
+    return {
+        "file_path": os.path.abspath(file_path),
+        "pharmacy_name": pharmacy_name,
+        "pharmacy_number": pharmacy_number,
+    }
+
+
+def print_report(report: dict):
+    for result in sorted(report["results"], key=lambda r: r["seconds"], reverse=True):
+        if result["status"] != "success":
+            print(f"{result['pharmacy_number']:>10s}  ERROR  {result['error']}")
+            continue
+        timings = result["timings"]
+        print(
+            f"{result['pharmacy_number']:>10s}  {result['processed_rows']:7d} rows  "
+            f"{result['seconds']:7.2f}s  decode={timings['decode']:.2f}s "
+            f"parse={timings['parse']:.2f}s lock_wait={timings['lock_wait']:.2f}s "
+            f"load_existing={timings['load_existing']:.2f}s apply={timings['apply']:.2f}s  "
+            f"{result['stats']}"
+        )
+    print(
+        f"{report['pharmacies']} pharmacies ({report['failed']} failed), "
+        f"{report['processed_rows']} rows in {report['seconds']:.2f}s — "
+        f"{report['rows_per_second']:.0f} rows/s"
+    )
+
+
+def main(paths: list, concurrency: int, use_celery: bool) -> int:
+    from tasks.tasks_increment import (
+        CSV_BATCH_CONCURRENCY,
+        process_csv_batch,
+        process_csv_batch_async,
+    )
+
+    concurrency = concurrency or CSV_BATCH_CONCURRENCY
+
+    files = [describe_file(path) for path in paths or sorted(glob.glob(f"{UPLOAD_DIR}/*.csv"))]
+    if not files:
+        sys.exit("No CSV files to import")
+
+    if use_celery:
+        task = process_csv_batch.delay(files, concurrency)
+        print(f"Celery task created: {task.id} ({len(files)} pharmacies)")
+        return 0
+
+    report = asyncio.run(process_csv_batch_async(files, concurrency))
+    print_report(report)
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*")
+    parser.add_argument("--concurrency", type=int)
+    parser.add_argument("--celery", action="store_true")
+    args = parser.parse_args()
+    sys.exit(main(args.paths, args.concurrency, args.celery))
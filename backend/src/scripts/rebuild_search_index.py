@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""Пересборка поискового индекса товаров (name_lower, search_tokens, search_vector).
+
+Запуск в контейнере backend (PYTHONPATH=/app/src):
+
+    python -m scripts.rebuild_search_index
+    python -m scripts.rebuild_search_index --only-missing --batch-size 10000
+"""
+import argparse
+import asyncio
+import logging
+
+from db.database import get_async_connection
+from services.search_index import rebuild_search_index
+
+
+async def main(batch_size: int, only_missing: bool):
+    conn = await get_async_connection()
+    try:
+        total = await rebuild_search_index(
+            conn, batch_size=batch_size, only_missing=only_missing
+        )
+        print(f"Search index rebuilt: {total} rows")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument(
+        "--only-missing",
+        action="store_true",
+        help="обновить только строки с пустым name_lower",
+    )
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.only_missing))
@@ -0,0 +1,346 @@
+"""Асинхронная пакетная запись audit_logs.
+
+Раньше AuditLoggingMiddleware открывал сессию и коммитил одну строку
+AuditLog прямо в запросе. Теперь запрос только кладёт событие в
+ограниченную очередь процесса, а фоновая задача пишет события пачками —
+одним многострочным INSERT каждые AUDIT_FLUSH_INTERVAL_MS мс или по
+AUDIT_BATCH_SIZE событий.
+
+Полнота аудита — требование ОАЦ, поэтому события не теряются молча:
+
+- очередь заполнена — запрос ждёт место до AUDIT_ENQUEUE_TIMEOUT
+  (back-pressure), затем событие откладывается в память и уходит на диск
+  пачкой (фоновой задачей или запросом, набравшим AUDIT_BATCH_SIZE);
+- БД недоступна — пачка дописывается в JSONL-файл в AUDIT_SPILL_DIR
+  (с fsync) и позже переигрывается любым воркером; повторная вставка
+  безопасна (ON CONFLICT DO NOTHING по id);
+- остановка приложения — очередь дописывается до конца.
+
+Счётчик ``audit_events_total{outcome="dropped"}`` растёт, только если не
+удалось даже записать файл.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy.dialects.postgresql import insert
+
+from db.database import get_async_sessionmaker
+from db.models import AuditLog
+from utils.time_utils import get_utc_now_naive
+
+logger = logging.getLogger(__name__)
+
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = int(os.getenv("AUDIT_FLUSH_INTERVAL_MS", "200")) / 1000
+AUDIT_ENQUEUE_TIMEOUT = float(os.getenv("AUDIT_ENQUEUE_TIMEOUT", "0.05"))
+AUDIT_SHUTDOWN_TIMEOUT = float(os.getenv("AUDIT_SHUTDOWN_TIMEOUT", "5"))
+AUDIT_SPILL_DIR = os.getenv("AUDIT_SPILL_DIR", "/app/audit_spill")
+AUDIT_REPLAY_INTERVAL = 30
+# Файл, захваченный упавшим воркером, возвращается в очередь переигрывания
+AUDIT_REPLAY_STALE = 600
+
+AUDIT_EVENTS = Counter(
+    "audit_events_total",
+    "Audit events by outcome (written, spilled, replayed, dropped)",
+    ["outcome"],
+)
+AUDIT_QUEUE_FULL = Counter(
+    "audit_queue_full_total", "Audit events that waited for room in a full queue"
+)
+AUDIT_QUEUE_DEPTH = Gauge("audit_queue_depth", "Audit events waiting to be written")
+AUDIT_FLUSH_SECONDS = Histogram(
+    "audit_flush_duration_seconds",
+    "Audit batch insert duration",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+AUDIT_BATCH_ROWS = Histogram(
+    "audit_flush_batch_rows",
+    "Audit events per batch insert",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+
+_UUID_FIELDS = ("id", "user_id", "resource_id")
+_STOP = object()
+
+
+def _uuid_or_none(value) -> Optional[str]:
+    if value is None:
+        return None
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return None
+
+
+def audit_event(
+    user_id=None,
+    user_type: str = "anonymous",
+    action: str = "unknown",
+    resource_type: str = "unknown",
+    resource_id=None,
+    ip_address: Optional[str] = None,
+    user_agent: str = "",
+    request_method: str = "GET",
+    endpoint: str = "",
+    status_code: str = "200",
+    success: bool = True,
+    details: Optional[dict] = None,
+) -> dict:
+    """Событие аудита в JSON-совместимом виде (очередь и файл на диске).
+
+    Значения обрезаются по длине колонок, а невалидные UUID заменяются на
+    None, чтобы одна строка не валила вставку всей пачки.
+    """
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": _uuid_or_none(user_id),
+        "user_type": (user_type or "anonymous")[:20],
+        "action": action[:50],
+        "resource_type": resource_type[:50],
+        "resource_id": _uuid_or_none(resource_id),
+        "ip_address": ip_address[:45] if ip_address else None,
+        "user_agent": (user_agent or "")[:500],
+        "request_method": request_method[:10],
+        "endpoint": endpoint[:255],
+        "status_code": str(status_code)[:3],
+        "success": success,
+        "details": details,
+        "created_at": get_utc_now_naive().isoformat(),
+    }
+
+
+def db_row(event: dict) -> dict:
+    row = dict(event)
+    for field in _UUID_FIELDS:
+        if row[field] is not None:
+            row[field] = uuid.UUID(row[field])
+    row["created_at"] = datetime.fromisoformat(row["created_at"])
+    return row
+
+
+class AuditWriter:
+    """Очередь событий аудита процесса и фоновая задача их записи."""
+
+    def __init__(
+        self,
+        spill_dir: str = AUDIT_SPILL_DIR,
+        queue_size: int = AUDIT_QUEUE_SIZE,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL,
+    ):
+        self.spill_dir = Path(spill_dir)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        # Не поместившиеся в очередь события, ждут записи на диск пачкой
+        self._overflow: list = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._recover_stale_claims()
+        self._task = asyncio.create_task(self._run())
+        logger.info("Audit writer started")
+
+    async def stop(self):
+        """Дописывает очередь; не успели за AUDIT_SHUTDOWN_TIMEOUT — на диск."""
+        if not self.running:
+            return
+        await self.queue.put(_STOP)
+        try:
+            await asyncio.wait_for(self._task, AUDIT_SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error("Audit writer did not drain in time, spilling the rest")
+        finally:
+            self._task = None
+        await self.spill(self._drain() + self._take_overflow())
+        logger.info("Audit writer stopped")
+
+    async def enqueue(self, event: dict):
+        if not self.running:
+            # Фоновая задача не запущена (скрипты, тесты) — пишем сразу
+            await self.flush([event])
+            return
+        try:
+            self.queue.put_nowait(event)
+            return
+        except asyncio.QueueFull:
+            AUDIT_QUEUE_FULL.inc()
+        try:
+            await asyncio.wait_for(self.queue.put(event), AUDIT_ENQUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            # Файл с fsync на каждое событие в запросе не пишем: пачку
+            # переполнения выливает на диск фоновая задача
+            self._overflow.append(event)
+            if len(self._overflow) >= self.batch_size:
+                await self.spill(self._take_overflow())
+
+    def _take_overflow(self) -> list:
+        events, self._overflow = self._overflow, []
+        return events
+
+    async def flush(self, events: list):
+        if not events:
+            return
+        started = time.perf_counter()
+        try:
+            await self._insert(events)
+        except asyncio.CancelledError:
+            # Задачу снимают (остановка) — пишем синхронно, до выхода
+            self._write_spill_file(events)
+            raise
+        except Exception as e:
+            logger.error(f"Audit flush of {len(events)} events failed, spilling: {e}")
+            await self.spill(events)
+            return
+        AUDIT_FLUSH_SECONDS.observe(time.perf_counter() - started)
+        AUDIT_BATCH_ROWS.observe(len(events))
+        AUDIT_EVENTS.labels(outcome="written").inc(len(events))
+
+    async def _insert(self, events: list):
+        async with get_async_sessionmaker()() as db:
+            await db.execute(
+                insert(AuditLog).on_conflict_do_nothing(),
+                [db_row(event) for event in events],
+            )
+            await db.commit()
+
+    async def _run(self):
+        last_replay = 0.0
+        while True:
+            batch, stopping = await self._next_batch()
+            await self.flush(batch)
+            await self.spill(self._take_overflow())
+            AUDIT_QUEUE_DEPTH.set(self.queue.qsize())
+            if stopping:
+                await self.flush(self._drain())
+                return
+            if time.monotonic() - last_replay >= AUDIT_REPLAY_INTERVAL:
+                last_replay = time.monotonic()
+                await self.replay_spilled()
+
+    async def _next_batch(self):
+        """Пачка до batch_size событий, собранная не дольше flush_interval."""
+        try:
+            first = await asyncio.wait_for(self.queue.get(), AUDIT_REPLAY_INTERVAL)
+        except asyncio.TimeoutError:
+            return [], False
+        if first is _STOP:
+            return [], True
+
+        loop = asyncio.get_running_loop()
+        batch = [first]
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                event = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(self.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if event is _STOP:
+                return batch, True
+            batch.append(event)
+        return batch, False
+
+    def _drain(self) -> list:
+        events = []
+        while True:
+            try:
+                event = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return events
+            if event is not _STOP:
+                events.append(event)
+
+    async def spill(self, events: list):
+        """Дописывает события в новый JSONL-файл вне event loop."""
+        if events:
+            await asyncio.to_thread(self._write_spill_file, events)
+
+    def _write_spill_file(self, events: list):
+        """write + fsync + rename; блокирует поток — из loop только через spill."""
+        name = f"audit-{os.getpid()}-{time.time_ns()}.jsonl"
+        part = self.spill_dir / f"{name}.part"
+        try:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+            with open(part, "w", encoding="utf-8") as f:
+                for event in events:
+                    f.write(json.dumps(event, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(part, self.spill_dir / name)
+        except OSError as e:
+            logger.critical(f"Audit spill failed, {len(events)} events lost: {e}")
+            AUDIT_EVENTS.labels(outcome="dropped").inc(len(events))
+            return
+        AUDIT_EVENTS.labels(outcome="spilled").inc(len(events))
+        logger.warning(f"Spilled {len(events)} audit events to {name}")
+
+    async def replay_spilled(self):
+        """Переигрывает файлы из AUDIT_SPILL_DIR; файл захватывается rename."""
+        if not self.spill_dir.is_dir():
+            return
+        for path in sorted(self.spill_dir.glob("*.jsonl")):
+            claimed = path.with_name(f"{path.name}.{os.getpid()}.replay")
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue  # забрал другой воркер
+            events = [
+                json.loads(line)
+                for line in claimed.read_text(encoding="utf-8").splitlines()
+                if line
+            ]
+            try:
+                for i in range(0, len(events), self.batch_size):
+                    await self._insert(events[i : i + self.batch_size])
+            except Exception as e:
+                os.rename(claimed, path)
+                logger.warning(f"Audit replay of {path.name} failed: {e}")
+                return
+            claimed.unlink()
+            AUDIT_EVENTS.labels(outcome="replayed").inc(len(events))
+            logger.info(f"Replayed {len(events)} spilled audit events from {path.name}")
+
+    def _recover_stale_claims(self):
+        if not self.spill_dir.is_dir():
+            return
+        for claimed in self.spill_dir.glob("*.jsonl.*.replay"):
+            try:
+                if time.time() - claimed.stat().st_mtime > AUDIT_REPLAY_STALE:
+                    original = claimed.name.split(".jsonl.")[0] + ".jsonl"
+                    os.rename(claimed, claimed.with_name(original))
+            except FileNotFoundError:
+                continue
+
+
+audit_writer = AuditWriter()
+
+
+def start_audit_writer():
+    """Start the audit writer background task"""
+    audit_writer.start()
+
+
+async def stop_audit_writer():
+    """Flush queued audit events and stop the background task"""
+    await audit_writer.stop()
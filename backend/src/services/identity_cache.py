@@ -0,0 +1,290 @@
+"""Кэш идентификации пользователя бота по telegram_id.
+
+RoleMiddleware на каждый апдейт искал пользователя и активного фармацевта
+(2–3 запроса). Теперь снимок строк User/Pharmacist хранится в двух уровнях:
+
+- локальный LRU процесса — IDENTITY_LOCAL_SIZE записей на
+  IDENTITY_LOCAL_TTL секунд;
+- Redis (``bot:identity:{telegram_id}``) — общий для всех воркеров, на
+  IDENTITY_CACHE_TTL секунд.
+
+В снимок попадают только идентификаторы и флаги, нужные middleware и
+обработчикам (CACHED_COLUMNS): персональные данные (ФИО, телефон, email и их
+зашифрованные копии) и хэш пароля в Redis не кладутся. Из снимка собираются
+persistent-объекты текущей сессии без запросов в БД, поэтому обработчики
+по-прежнему меняют их и делают commit; остальные колонки не загружены —
+обработчик, которому они нужны, подгружает их через ``ensure_loaded``.
+
+Инвалидация — через события сессии SQLAlchemy: после commit, в котором
+изменились, добавились или удалились User/Pharmacist (регистрация,
+/online и /offline, деактивация, согласия, профиль), запись удаляется из
+локального LRU сразу и из Redis фоновой задачей. LRU других воркеров может
+отставать не дольше IDENTITY_LOCAL_TTL. Ошибки Redis не ломают апдейт —
+middleware уходит в БД.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from prometheus_client import Counter
+from sqlalchemy import DateTime, event, inspect, select
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import get_history, set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from auth.session_manager import get_redis_client
+from db.qa_models import Pharmacist, User
+
+logger = logging.getLogger(__name__)
+
+IDENTITY_CACHE_PREFIX = "bot:identity:"
+IDENTITY_CACHE_TTL = int(os.getenv("IDENTITY_CACHE_TTL", "300"))
+IDENTITY_LOCAL_TTL = float(os.getenv("IDENTITY_LOCAL_TTL", "5"))
+IDENTITY_LOCAL_SIZE = int(os.getenv("IDENTITY_LOCAL_SIZE", "10000"))
+
+# Только идентификаторы и флаги: персональные данные (ОАЦ) и хэш пароля
+# в Redis не кладём
+CACHED_COLUMNS = {
+    User: {
+        "uuid",
+        "telegram_id",
+        "user_type",
+        "consent_privacy_policy",
+        "consent_privacy_policy_date",
+        "consent_transboundary_transfer",
+        "consent_transboundary_transfer_date",
+        "transboundary_risks_acknowledged",
+    },
+    Pharmacist: {
+        "uuid",
+        "user_id",
+        "pharmacy_info",
+        "is_active",
+        "is_online",
+        "last_seen",
+        "created_at",
+    },
+}
+
+_PENDING_KEY = "identity_cache_invalidate"
+
+IDENTITY_CACHE_LOOKUPS = Counter(
+    "bot_identity_cache_lookups_total",
+    "Bot identity lookups by the tier that answered",
+    ["tier"],
+)
+
+
+class LocalLRU:
+    """LRU с TTL для одного процесса (без блокировок — один event loop)."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def pop(self, key):
+        self._items.pop(key, None)
+
+    def clear(self):
+        self._items.clear()
+
+
+local_identities = LocalLRU(IDENTITY_LOCAL_SIZE, IDENTITY_LOCAL_TTL)
+_background_tasks: set = set()
+
+
+def identity_key_for(telegram_id: int) -> str:
+    return f"{IDENTITY_CACHE_PREFIX}{telegram_id}"
+
+
+def _columns(model):
+    return [
+        column
+        for column in inspect(model).columns
+        if column.key in CACHED_COLUMNS[model]
+    ]
+
+
+def snapshot_row(obj) -> dict:
+    row = {}
+    for column in _columns(type(obj)):
+        value = getattr(obj, column.key)
+        if isinstance(value, uuid.UUID):
+            value = str(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        row[column.key] = value
+    return row
+
+
+def restore_row(model, row: dict):
+    values = {}
+    for column in _columns(model):
+        value = row.get(column.key)
+        if value is not None:
+            if isinstance(column.type, UUID):
+                value = uuid.UUID(value)
+            elif isinstance(column.type, DateTime):
+                value = datetime.fromisoformat(value)
+        values[column.key] = value
+    obj = model(**values)
+    make_transient_to_detached(obj)
+    return obj
+
+
+async def ensure_loaded(db, obj, *attributes: str):
+    """Подгружает колонки, которых нет в объекте из кэша (одним SELECT)."""
+    missing = [name for name in attributes if name in inspect(obj).unloaded]
+    if missing:
+        await db.refresh(obj, missing)
+
+
+def snapshot_identity(user: User, pharmacist: Optional[Pharmacist]) -> dict:
+    return {
+        "user": snapshot_row(user),
+        "pharmacist": snapshot_row(pharmacist) if pharmacist is not None else None,
+    }
+
+
+def attach_identity(db, snapshot: dict):
+    """Собирает User/Pharmacist из снимка и добавляет их в сессию без SELECT."""
+    user = restore_row(User, snapshot["user"])
+    db.add(user)
+    pharmacist = None
+    if snapshot["pharmacist"] is not None:
+        pharmacist = restore_row(Pharmacist, snapshot["pharmacist"])
+        set_committed_value(pharmacist, "user", user)
+        db.add(pharmacist)
+    return user, pharmacist
+
+
+async def load_identity(db, telegram_id: int):
+    """(user, pharmacist) из кэша, привязанные к ``db``, или None при промахе."""
+    snapshot = local_identities.get(telegram_id)
+    if snapshot is not None:
+        IDENTITY_CACHE_LOOKUPS.labels(tier="local").inc()
+        return attach_identity(db, snapshot)
+
+    try:
+        redis_client = await get_redis_client()
+        cached = await redis_client.get(identity_key_for(telegram_id))
+    except Exception as e:
+        logger.warning(f"Identity cache lookup failed for {telegram_id}: {e}")
+        cached = None
+    if cached is None:
+        IDENTITY_CACHE_LOOKUPS.labels(tier="database").inc()
+        return None
+
+    IDENTITY_CACHE_LOOKUPS.labels(tier="redis").inc()
+    snapshot = json.loads(cached)
+    local_identities.set(telegram_id, snapshot)
+    return attach_identity(db, snapshot)
+
+
+async def store_identity(telegram_id: int, user: User, pharmacist: Optional[Pharmacist]):
+    snapshot = snapshot_identity(user, pharmacist)
+    local_identities.set(telegram_id, snapshot)
+    try:
+        redis_client = await get_redis_client()
+        await redis_client.set(
+            identity_key_for(telegram_id), json.dumps(snapshot), ex=IDENTITY_CACHE_TTL
+        )
+    except Exception as e:
+        logger.warning(f"Identity cache store failed for {telegram_id}: {e}")
+
+
+async def invalidate_identity(*telegram_ids: int):
+    for telegram_id in telegram_ids:
+        local_identities.pop(telegram_id)
+    if not telegram_ids:
+        return
+    try:
+        redis_client = await get_redis_client()
+        await redis_client.delete(*(identity_key_for(t) for t in telegram_ids))
+    except Exception as e:
+        logger.warning(f"Identity cache invalidation failed for {telegram_ids}: {e}")
+
+
+def _telegram_ids(session: Session, obj) -> set:
+    if isinstance(obj, User):
+        history = get_history(obj, "telegram_id")
+        return {
+            value
+            for value in (*history.added, *history.unchanged, *history.deleted)
+            if value is not None
+        }
+
+    user = obj.__dict__.get("user")
+    if user is None and obj.user_id is not None:
+        user = session.identity_map.get(identity_key(User, obj.user_id))
+    if user is not None:
+        return {user.telegram_id} - {None}
+    if obj.user_id is None:
+        return set()
+    telegram_id = session.execute(
+        select(User.telegram_id).where(User.uuid == obj.user_id)
+    ).scalar()
+    return {telegram_id} - {None}
+
+
+@event.listens_for(Session, "after_flush")
+def collect_changed_identities(session, flush_context):
+    changed = [
+        obj
+        for obj in (*session.new, *session.dirty, *session.deleted)
+        if isinstance(obj, (User, Pharmacist))
+        and (obj not in session.dirty or session.is_modified(obj))
+    ]
+    if not changed:
+        return
+    pending = session.info.setdefault(_PENDING_KEY, set())
+    for obj in changed:
+        pending |= _telegram_ids(session, obj)
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_committed_identities(session):
+    telegram_ids = session.info.pop(_PENDING_KEY, None)
+    if not telegram_ids:
+        return
+    for telegram_id in telegram_ids:
+        local_identities.pop(telegram_id)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Синхронная сессия вне event loop: Redis-запись доживёт до TTL
+        logger.debug(f"No event loop to invalidate identities {telegram_ids}")
+        return
+    task = loop.create_task(invalidate_identity(*telegram_ids))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def discard_pending_identities(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
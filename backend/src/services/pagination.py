@@ -0,0 +1,112 @@
+"""Keyset-пагинация (курсоры) для поиска и списков заказов.
+
+Курсор — непрозрачная для клиента строка: base64url от JSON-массива значений
+ключа сортировки последней отданной строки. Следующая страница выбирается
+условием ``(ключ) > (курсор)`` вместо OFFSET, поэтому стоимость страницы
+не зависит от её номера.
+"""
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Optional
+
+from sqlalchemy import tuple_
+
+from db.booking_models import BookingOrder
+
+# Размер страницы заказов, если передан только курсор
+DEFAULT_ORDERS_PAGE_SIZE = 100
+MAX_ORDERS_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursorError(ValueError):
+    """Курсор повреждён или получен от другого списка."""
+
+
+def encode_cursor(values: list) -> str:
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, length: int) -> list:
+    """Возвращает значения ключа; length — ожидаемое число компонент.
+
+    Дробные числа читаются как Decimal, чтобы без потерь сравниваться
+    с Numeric-колонками.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(
+            base64.urlsafe_b64decode(padded.encode("ascii")), parse_float=Decimal
+        )
+    except (ValueError, binascii.Error, UnicodeError) as e:
+        raise InvalidCursorError("Malformed cursor") from e
+    if not isinstance(values, list) or len(values) != length:
+        raise InvalidCursorError("Cursor does not match this listing")
+    return values
+
+
+def decode_uuid(value) -> uuid.UUID:
+    try:
+        return uuid.UUID(str(value))
+    except ValueError as e:
+        raise InvalidCursorError("Malformed cursor") from e
+
+
+def cursor_params(keys: list, values: list) -> list:
+    """Значения курсора, приведённые к python-типам выражений ключа."""
+    params = []
+    for key, value in zip(keys, values):
+        python_type = key.type.python_type
+        try:
+            params.append(
+                decode_uuid(value) if python_type is uuid.UUID else python_type(value)
+            )
+        except (TypeError, ValueError, ArithmeticError) as e:
+            raise InvalidCursorError("Malformed cursor") from e
+    return params
+
+
+# --- Заказы: created_at DESC, uuid DESC ---------------------------------------
+
+
+def orders_page_size(cursor: Optional[str], limit: Optional[int]) -> Optional[int]:
+    """None — старый режим «все заказы без лимита»."""
+    if limit is not None:
+        return limit
+    return DEFAULT_ORDERS_PAGE_SIZE if cursor else None
+
+
+def apply_orders_keyset(query, cursor: Optional[str], page_size: Optional[int]):
+    """Сортировка заказов по (created_at, uuid) DESC и условие курсора.
+
+    Запрашивается page_size + 1 строка: лишняя строка показывает, что есть
+    следующая страница (см. split_orders_page).
+    """
+    query = query.order_by(BookingOrder.created_at.desc(), BookingOrder.uuid.desc())
+    if cursor:
+        created_at, order_uuid = decode_cursor(cursor, 2)
+        try:
+            created_at = datetime.fromisoformat(created_at)
+        except (TypeError, ValueError) as e:
+            raise InvalidCursorError("Malformed cursor") from e
+        query = query.where(
+            tuple_(BookingOrder.created_at, BookingOrder.uuid)
+            < tuple_(created_at, decode_uuid(order_uuid))
+        )
+    if page_size is not None:
+        query = query.limit(page_size + 1)
+    return query
+
+
+def split_orders_page(orders: List, page_size: Optional[int]):
+    """Возвращает (заказы страницы, курсор следующей страницы или None)."""
+    if page_size is None or len(orders) <= page_size:
+        return orders, None
+    orders = orders[:page_size]
+    last = orders[-1]
+    return orders, encode_cursor([last.created_at.isoformat(), str(last.uuid)])
@@ -0,0 +1,181 @@
+"""
+Агрегаты групп товаров для ``available_combinations`` (шаг 2 поиска).
+
+Таблица ``product_groups`` хранит по каждой группе (name, form, manufacturer,
+country) количество строк, сумму остатков, min/max цену и число аптек —
+отдельно для каждого города (``scope`` = pharmacies.city) и для всех аптек
+(``scope`` = ``GLOBAL_GROUP_SCOPE``). Как и живой запрос, который она
+заменяет, агрегаты считаются по всем строкам products (включая снятые с
+продажи — у них quantity = 0).
+
+Импорт CSV пересчитывает только группы, затронутые изменениями аптеки
+(``refresh_product_groups`` в той же транзакции). ``find_product_group_drift``
+сравнивает таблицу с пересчётом из ``products``
+(``python -m scripts.check_product_groups``).
+"""
+import logging
+from typing import Dict, Iterable, List, Tuple
+
+import asyncpg
+
+from services.search_index import SEARCH_TS_CONFIG, normalize_search_text
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_GROUP_SCOPE = "*"
+
+# Все пересчёты product_groups сериализуются: строки scope = '*' общие для всех аптек
+PRODUCT_GROUPS_LOCK_ID = 740_215_001
+
+GROUP_KEY_COLUMNS = ("name", "form", "manufacturer", "country")
+GROUP_VALUE_COLUMNS = (
+    "product_count",
+    "quantity_sum",
+    "min_price",
+    "max_price",
+    "pharmacy_count",
+)
+
+# Агрегаты по городам и по всем аптекам одним проходом (GROUPING SETS).
+# {where} — дополнительное условие на products p.
+_AGGREGATE_SQL = f"""
+    SELECT
+        CASE WHEN GROUPING(coalesce(ph.city, '')) = 1 THEN '{GLOBAL_GROUP_SCOPE}'
+             ELSE coalesce(ph.city, '') END AS scope,
+        p.name, p.form, p.manufacturer, p.country,
+        min(p.name_lower) AS name_lower,
+        count(*) AS product_count,
+        sum(p.quantity) AS quantity_sum,
+        min(p.price) AS min_price,
+        max(p.price) AS max_price,
+        count(DISTINCT p.pharmacy_id) AS pharmacy_count
+    FROM products p
+    JOIN pharmacies ph ON ph.uuid = p.pharmacy_id
+    {{where}}
+    GROUP BY GROUPING SETS (
+        (coalesce(ph.city, ''), p.name, p.form, p.manufacturer, p.country),
+        (p.name, p.form, p.manufacturer, p.country)
+    )
+"""
+
+_INSERT_SQL = f"""
+    INSERT INTO product_groups (
+        scope, name, form, manufacturer, country,
+        name_lower, search_tokens, search_vector,
+        product_count, quantity_sum, min_price, max_price, pharmacy_count
+    )
+    SELECT
+        a.scope, a.name, a.form, a.manufacturer, a.country,
+        a.name_lower,
+        ARRAY(
+            SELECT DISTINCT t
+            FROM unnest(regexp_split_to_array(a.name_lower, '[^[:alnum:]_]+')) AS t
+            WHERE t <> ''
+        ),
+        to_tsvector('{SEARCH_TS_CONFIG}', coalesce(a.name_lower, '')),
+        a.product_count, a.quantity_sum, a.min_price, a.max_price, a.pharmacy_count
+    FROM ({{aggregate}}) AS a
+"""
+
+_KEYS_CTE = """
+    unnest($1::text[], $2::text[], $3::text[], $4::text[])
+        AS k(name, form, manufacturer, country)
+"""
+
+
+def group_keys(rows: Iterable[dict]) -> List[Tuple[str, str, str, str]]:
+    """Уникальные ключи групп из строк импорта (dict с колонками products)."""
+    return sorted({tuple(row[column] for column in GROUP_KEY_COLUMNS) for row in rows})
+
+
+async def refresh_product_groups(
+    conn: asyncpg.Connection, keys: List[Tuple[str, str, str, str]]
+) -> int:
+    """Пересчитывает группы keys во всех scope (вызывать внутри транзакции).
+
+    Returns
+    -------
+    int
+        Количество строк product_groups после пересчёта.
+    """
+    if not keys:
+        return 0
+    columns = [list(column) for column in zip(*keys)]
+    names_lower = sorted({normalize_search_text(name) for name in columns[0]})
+
+    await conn.execute("SELECT pg_advisory_xact_lock($1)", PRODUCT_GROUPS_LOCK_ID)
+    await conn.execute(
+        f"""
+        DELETE FROM product_groups g
+        USING {_KEYS_CTE}
+        WHERE g.name = k.name AND g.form = k.form
+        AND g.manufacturer = k.manufacturer AND g.country = k.country
+        """,
+        *columns,
+    )
+    # name_lower = ANY(...) — предфильтр по индексу idx_product_name_lower_pattern
+    aggregate = _AGGREGATE_SQL.format(
+        where=f"""
+        WHERE p.name_lower = ANY($5::text[])
+        AND (p.name, p.form, p.manufacturer, p.country) IN (SELECT * FROM {_KEYS_CTE})
+        """
+    )
+    status = await conn.execute(_INSERT_SQL.format(aggregate=aggregate), *columns, names_lower)
+    inserted = int(status.split()[-1])
+    logger.info(f"Product groups refreshed: {len(keys)} keys, {inserted} rows")
+    return inserted
+
+
+async def rebuild_product_groups(conn: asyncpg.Connection) -> int:
+    """Полная пересборка таблицы в одной транзакции."""
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", PRODUCT_GROUPS_LOCK_ID)
+        await conn.execute("DELETE FROM product_groups")
+        status = await conn.execute(
+            _INSERT_SQL.format(aggregate=_AGGREGATE_SQL.format(where=""))
+        )
+    return int(status.split()[-1])
+
+
+async def find_product_group_drift(conn: asyncpg.Connection, sample: int = 20) -> Dict:
+    """Сравнивает product_groups с пересчётом из products.
+
+    Returns
+    -------
+    dict
+        missing — групп нет в таблице, extra — лишние группы, mismatched —
+        расходятся значения; examples — до ``sample`` расходящихся строк.
+    """
+    keys = ", ".join(("scope",) + GROUP_KEY_COLUMNS)
+    diff_condition = " OR ".join(
+        f"e.{column} IS DISTINCT FROM g.{column}" for column in GROUP_VALUE_COLUMNS
+    )
+    rows = await conn.fetch(
+        f"""
+        WITH expected AS ({_AGGREGATE_SQL.format(where="")}),
+        diff AS (
+            SELECT
+                coalesce(e.scope, g.scope) AS scope,
+                coalesce(e.name, g.name) AS name,
+                coalesce(e.form, g.form) AS form,
+                coalesce(e.manufacturer, g.manufacturer) AS manufacturer,
+                coalesce(e.country, g.country) AS country,
+                CASE WHEN g.scope IS NULL THEN 'missing'
+                     WHEN e.scope IS NULL THEN 'extra'
+                     ELSE 'mismatched' END AS kind
+            FROM expected e
+            FULL JOIN product_groups g USING ({keys})
+            WHERE e.scope IS NULL OR g.scope IS NULL OR {diff_condition}
+        )
+        SELECT kind, count(*) OVER (PARTITION BY kind) AS kind_count,
+               scope, name, form, manufacturer, country
+        FROM diff
+        ORDER BY kind, scope, name
+        """
+    )
+    report = {"missing": 0, "extra": 0, "mismatched": 0, "examples": []}
+    for row in rows:
+        report[row["kind"]] = row["kind_count"]
+        if len(report["examples"]) < sample:
+            report["examples"].append(dict(row))
+    return report
@@ -0,0 +1,657 @@
+"""
+Движок поиска товаров для ``/search-fts/``.
+
+Кандидаты (товары, подходящие хотя бы под один уровень поиска) собираются
+ОДИН раз в CTE ``candidates``; в том же проходе каждой строке назначаются
+уровень (1 — exact, 2 — fts, 3 — fuzzy) и поля ранжирования. Из этого
+CTE одним SQL-выражением вычисляются выбранный уровень, total, номер страницы,
+``available_combinations`` и сама страница товаров (в виде JSON).
+
+``available_combinations`` без фильтра цены читаются из агрегатов
+``product_groups`` (services/product_groups.py), а не группируются заново.
+
+Страница выбирается либо по номеру (OFFSET), либо по курсору (keyset по
+ключу сортировки: ранжирование, цена, uuid — см. services/pagination.py).
+
+Выбранный уровень — минимальный уровень среди кандидатов: если есть хотя бы
+одно точное совпадение, строки уровня exact — это ровно строки с tier = 1;
+иначе строк с tier = 1 нет, и строки уровня fts — это строки с tier = 2 и т.д.
+"""
+
+from dataclasses import dataclass
+from math import ceil
+from typing import Optional
+
+from sqlalchemy import (
+    Float,
+    Integer,
+    JSON,
+    and_,
+    case,
+    func,
+    literal,
+    literal_column,
+    or_,
+    select,
+    true,
+    tuple_,
+)
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Pharmacy, Product, ProductGroup
+from services.pagination import cursor_params, decode_cursor, encode_cursor
+from services.product_groups import GLOBAL_GROUP_SCOPE
+from services.search_index import SEARCH_TS_CONFIG, normalize_search_text
+
+TIER_EXACT = 1
+TIER_FTS = 2
+TIER_FUZZY = 3
+TIER_NAMES = {TIER_EXACT: "exact", TIER_FTS: "fts", TIER_FUZZY: "fuzzy"}
+
+# Значения фильтров из UI, означающие «без фильтра»
+ALL_CITIES = "Все города"
+ALL_FORMS = "Все формы"
+ALL_MANUFACTURERS = "Все производители"
+ALL_COUNTRIES = "Все страны"
+
+SPECIFIC_STOPWORDS = {"уп", "упак", "н", "и", "в", "на", "по", "для", "от"}
+
+EMPTY_JSON_ARRAY = literal_column("'[]'::json", type_=JSON)
+
+
+@dataclass(frozen=True)
+class SearchFilters:
+    """Фильтры шага 2/3 поискового UI."""
+
+    city: Optional[str] = None
+    form: Optional[str] = None
+    manufacturer: Optional[str] = None
+    country: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+
+    @property
+    def has_form(self) -> bool:
+        return bool(self.form and self.form != ALL_FORMS)
+
+    @property
+    def is_specific_combination(self) -> bool:
+        """Шаг 3 — выбрана конкретная комбинация (form, manufacturer, country)."""
+        return bool(self.form and self.manufacturer and self.country)
+
+
+def calculate_max_distance(search_query: str) -> int:
+    """Вычисляет максимальное расстояние Левенштейна в зависимости от длины запроса"""
+    length = len(search_query)
+    if length <= 3:
+        return 1
+    elif length <= 6:
+        return 2
+    elif length <= 10:
+        return 3
+    else:
+        return 4
+
+
+def empty_search_response(size: int, search_level: str = "none") -> dict:
+    return {
+        "items": [],
+        "total": 0,
+        "page": 1,
+        "size": size,
+        "total_pages": 1,
+        "available_combinations": [],
+        "total_found": 0,
+        "search_level": search_level,
+        "next_cursor": None,
+    }
+
+
+def _location_price_conditions(filters: SearchFilters) -> list:
+    """Фильтры, общие для всех частей ответа: город и цена."""
+    conditions = []
+    if filters.city and filters.city != ALL_CITIES:
+        conditions.append(Pharmacy.city.ilike(filters.city))
+    if filters.min_price is not None:
+        conditions.append(Product.price >= filters.min_price)
+    if filters.max_price is not None:
+        conditions.append(Product.price <= filters.max_price)
+    return conditions
+
+
+def _attribute_conditions(filters: SearchFilters) -> list:
+    """Фильтры по форме, производителю и стране (не влияют на комбинации)."""
+    conditions = []
+    if filters.has_form:
+        conditions.append(Product.form == filters.form)
+    if filters.manufacturer and filters.manufacturer != ALL_MANUFACTURERS:
+        conditions.append(Product.manufacturer.ilike(f"%{filters.manufacturer}%"))
+    if filters.country and filters.country != ALL_COUNTRIES:
+        conditions.append(Product.country.ilike(f"%{filters.country}%"))
+    return conditions
+
+
+def build_level_conditions(search_query: str, source=Product) -> dict:
+    """Условия уровней exact / fts / fuzzy и выражения ранжирования.
+
+    Все выражения построены по индексным колонкам ``name_lower``,
+    ``search_tokens`` и ``search_vector`` (см. services/search_index.py);
+    source — модель с этими колонками (Product или ProductGroup).
+    """
+    words = search_query.split()
+    max_distance = calculate_max_distance(search_query)
+
+    # Создаем полнотекстовый запрос
+    fts_query_str = " & ".join([f"{word}:*" for word in words if len(word) > 1])
+    if not fts_query_str:
+        fts_query_str = f"{search_query}:*"
+    ts_query = func.to_tsquery(SEARCH_TS_CONFIG, fts_query_str)
+
+    name_lower = source.name_lower
+    levenshtein_distance = func.levenshtein(name_lower, search_query, type_=Integer)
+
+    # Совпадение запроса с целым словом названия
+    if len(words) == 1:
+        whole_word_condition = source.search_tokens.contains([search_query])
+    else:
+        whole_word_condition = name_lower.like(f"% {search_query} %")
+
+    # УРОВЕНЬ 1: ТОЧНЫЕ СОВПАДЕНИЯ
+    # name_lower уже без крайних и повторных пробелов, поэтому варианты
+    # " q ", "q ", " q" и "q %" покрываются тремя условиями ниже
+    exact = or_(
+        name_lower == search_query,
+        name_lower.like(f"{search_query}%"),
+        name_lower.like(f"% {search_query}"),
+    )
+
+    # УРОВЕНЬ 2: ПОЛНОТЕКСТОВЫЙ ПОИСК
+    fts_conditions = [source.search_vector.op("@@")(ts_query)]
+    if len(words) > 1:
+        word_conditions = [
+            name_lower.like(f"%{word}%") for word in words if len(word) >= 3
+        ]
+        if word_conditions:
+            fts_conditions.append(or_(*word_conditions))
+    fts = or_(*fts_conditions)
+
+    # УРОВЕНЬ 3: НЕТОЧНЫЙ ПОИСК/ОПЕЧАТКИ
+    # Предварительный фильтр — индексируемые операции (LIKE, trigram %)
+    fuzzy_pre_conditions = [
+        # Оператор % использует GIN trigram индекс (порог pg_trgm.similarity_threshold = 0.3)
+        name_lower.op("%")(search_query),
+        name_lower.like(f"{search_query}%"),
+    ]
+    if len(search_query) >= 5:
+        root_length = min(5, len(search_query) - 1)
+        search_root = search_query[:root_length]
+        fuzzy_pre_conditions.append(name_lower.like(f"{search_root}%"))
+        fuzzy_pre_conditions.append(name_lower.like(f"% {search_root}%"))
+    if len(words) > 1:
+        first_letters = "".join([word[0] for word in words if len(word) > 0])
+        if len(first_letters) >= 3:
+            fuzzy_pre_conditions.append(name_lower.like(f"{first_letters}%"))
+
+    # Финальный фильтр — предварительный фильтр + Левенштейн
+    fuzzy = and_(or_(*fuzzy_pre_conditions), levenshtein_distance <= max_distance)
+
+    # Per-word Levenshtein — только для слов >= 3 символов (LIKE предфильтр + Levenshtein)
+    word_lev_conditions = [
+        and_(
+            name_lower.like(f"%{word}%"),
+            func.levenshtein(name_lower, word) <= 2,
+        )
+        for word in words
+        if len(word) >= 3
+    ]
+    if word_lev_conditions:
+        fuzzy = or_(fuzzy, *word_lev_conditions)
+
+    return {
+        "exact": exact,
+        "fts": fts,
+        "fuzzy": fuzzy,
+        "ts_query": ts_query,
+        "levenshtein_distance": levenshtein_distance,
+        "levenshtein_normalized": case(
+            (
+                func.length(name_lower) > 0,
+                1.0
+                - (
+                    levenshtein_distance
+                    / func.greatest(func.length(name_lower), len(search_query))
+                ),
+            ),
+            else_=0.0,
+        ),
+        "exact_score": case((name_lower == search_query, 100), else_=0),
+        "starts_score": case((name_lower.like(f"{search_query}%"), 50), else_=0),
+        "word_score": case((whole_word_condition, 30), else_=0),
+        "name_rank": case(
+            (name_lower == search_query, 6),
+            (name_lower.like(f"{search_query}%"), 5),
+            (whole_word_condition, 4),
+            (name_lower.like(f"% {search_query}"), 3),
+            else_=0,
+        ),
+    }
+
+
+def _item_json(product, pharmacy):
+    """JSON-объект товара в формате ответа /search-fts/."""
+    return func.json_build_object(
+        "uuid", product.uuid,
+        "name", product.name,
+        "form", product.form,
+        "manufacturer", product.manufacturer,
+        "country", product.country,
+        "price", func.coalesce(product.price, 0),
+        "quantity", func.coalesce(product.quantity, 0),
+        "pharmacy_name", pharmacy.name,
+        "pharmacy_city", pharmacy.city,
+        "pharmacy_district", pharmacy.district,
+        "pharmacy_address", pharmacy.address,
+        "pharmacy_phone", pharmacy.phone,
+        "pharmacy_number", pharmacy.pharmacy_number,
+        "pharmacy_id", pharmacy.uuid,
+        "updated_at", product.updated_at,
+        "working_hours", pharmacy.opening_hours,
+    )  # fmt: skip
+
+
+def _paging_cte(count_query, page: int, size: int):
+    """total и текущая страница (номер страницы ограничен количеством страниц)."""
+    totals = count_query.cte("totals")
+    total_pages = func.greatest(
+        func.ceil(totals.c.total / literal(float(size))).cast(Integer), 1
+    )
+    return select(
+        totals.c.total,
+        func.least(page, total_pages).label("current_page"),
+    ).cte("paging")
+
+
+def _page_items_json(
+    candidates, where_clause, sort_keys: list, paging, size: int, cursor=None
+):
+    """JSON-массив товаров страницы и ключ сортировки её последней строки.
+
+    sort_keys — выражения, сортируемые по возрастанию (убывающие ключи
+    передаются с минусом), поэтому условие курсора — сравнение кортежей.
+    Берётся size + 1 строка: ключ для следующего курсора возвращается,
+    только если за страницей есть ещё строки.
+
+    Сортировка и LIMIT выполняются по узкому CTE кандидатов; полные строки
+    products/pharmacies подтягиваются по первичному ключу только для
+    строк страницы.
+    """
+    ranked = (
+        select(candidates.c.uuid, *[key.label(f"k{i}") for i, key in enumerate(sort_keys)])
+        .where(where_clause)
+        .order_by(*sort_keys)
+        .limit(size + 1)
+    )
+    if cursor is None:
+        ranked = ranked.offset(
+            select((paging.c.current_page - 1) * size).scalar_subquery()
+        )
+    else:
+        values = cursor_params(sort_keys, decode_cursor(cursor, len(sort_keys)))
+        ranked = ranked.where(
+            tuple_(*sort_keys)
+            > tuple_(*[literal(v, key.type) for key, v in zip(sort_keys, values)])
+        )
+    ranked = ranked.subquery("ranked")
+    key_columns = [ranked.c[f"k{i}"] for i in range(len(sort_keys))]
+    page_rows = select(
+        ranked.c.uuid,
+        func.json_build_array(*key_columns).label("sort_key"),
+        func.row_number().over(order_by=key_columns).label("ordinal"),
+    ).cte("page_rows")
+
+    product = Product.__table__
+    pharmacy = Pharmacy.__table__
+    items_json = (
+        select(
+            func.coalesce(
+                func.json_agg(
+                    aggregate_order_by(_item_json(product.c, pharmacy.c), page_rows.c.ordinal)
+                ),
+                EMPTY_JSON_ARRAY,
+            )
+        )
+        .select_from(page_rows)
+        .join(product, product.c.uuid == page_rows.c.uuid)
+        .join(pharmacy, pharmacy.c.uuid == product.c.pharmacy_id)
+        .where(page_rows.c.ordinal <= size)
+        .scalar_subquery()
+    )
+    has_more = select(func.count() > size).select_from(page_rows).scalar_subquery()
+    next_key = (
+        select(page_rows.c.sort_key)
+        .where(page_rows.c.ordinal == size, has_more)
+        .scalar_subquery()
+    )
+    return items_json, next_key
+
+
+def _candidate_combinations(candidates, chosen_tier):
+    """Комбинации выбранного уровня, сгруппированные по строкам кандидатов."""
+    c = candidates.c
+    combination_order = [
+        func.max(c.exact_score).desc(),
+        func.max(c.starts_score).desc(),
+        func.max(c.word_score).desc(),
+        func.max(c.fts_score).desc(),
+        func.max(c.trigram_score).desc(),
+        func.max(c.levenshtein_score).desc(),
+        func.count().desc(),
+        c.name.asc(),
+    ]
+    return (
+        select(
+            func.json_build_object(
+                "name", c.name,
+                "form", c.form,
+                "manufacturer", c.manufacturer,
+                "country", c.country,
+                "count", func.count(),
+                "min_price", func.coalesce(func.min(c.price), 0),
+                "max_price", func.coalesce(func.max(c.price), 0),
+                "pharmacy_count", func.count(c.pharmacy_id.distinct()),
+            ).label("combination"),  # fmt: skip
+            func.row_number().over(order_by=combination_order).label("ordinal"),
+        )
+        .where(c.tier == chosen_tier)
+        .group_by(c.name, c.form, c.manufacturer, c.country)
+        .having(func.sum(c.quantity) > 0)
+        .subquery("combinations")
+    )
+
+
+def _group_combinations(search_query: str, filters: SearchFilters, chosen_tier):
+    """Комбинации выбранного уровня из предвычисленных агрегатов product_groups.
+
+    Уровни поиска применяются к названию группы теми же выражениями, что и к
+    товарам; строки нескольких городов (ILIKE-фильтр) суммируются.
+    """
+    g = ProductGroup
+    levels = build_level_conditions(search_query, ProductGroup)
+    tier = case(
+        (levels["exact"], TIER_EXACT),
+        (levels["fts"], TIER_FTS),
+        else_=TIER_FUZZY,
+    )
+    if filters.city and filters.city != ALL_CITIES:
+        scope = and_(g.scope.ilike(filters.city), g.scope != GLOBAL_GROUP_SCOPE)
+    else:
+        scope = g.scope == GLOBAL_GROUP_SCOPE
+
+    combination_order = [
+        func.max(levels["exact_score"]).desc(),
+        func.max(levels["starts_score"]).desc(),
+        func.max(levels["word_score"]).desc(),
+        func.max(func.ts_rank(g.search_vector, levels["ts_query"])).desc(),
+        func.max(func.similarity(g.name_lower, search_query)).desc(),
+        func.max(levels["levenshtein_normalized"]).desc(),
+        func.sum(g.product_count).desc(),
+        g.name.asc(),
+    ]
+    return (
+        select(
+            func.json_build_object(
+                "name", g.name,
+                "form", g.form,
+                "manufacturer", g.manufacturer,
+                "country", g.country,
+                "count", func.sum(g.product_count),
+                "min_price", func.coalesce(func.min(g.min_price), 0),
+                "max_price", func.coalesce(func.max(g.max_price), 0),
+                "pharmacy_count", func.sum(g.pharmacy_count),
+            ).label("combination"),  # fmt: skip
+            func.row_number().over(order_by=combination_order).label("ordinal"),
+        )
+        .where(scope)
+        .where(or_(levels["exact"], levels["fts"], levels["fuzzy"]))
+        .where(tier == chosen_tier)
+        .group_by(g.name, g.form, g.manufacturer, g.country)
+        .having(func.sum(g.quantity_sum) > 0)
+        .subquery("combinations")
+    )
+
+
+def build_tiered_search_statement(
+    search_query: str,
+    filters: SearchFilters,
+    page: int,
+    size: int,
+    cursor: Optional[str] = None,
+):
+    """Один SELECT: уровень, total, текущая страница, комбинации и товары."""
+    levels = build_level_conditions(search_query)
+    attribute_conditions = _attribute_conditions(filters)
+
+    tier = case(
+        (levels["exact"], TIER_EXACT),
+        (levels["fts"], TIER_FTS),
+        else_=TIER_FUZZY,
+    )
+    candidates = (
+        select(
+            Product.uuid,
+            Product.name,
+            Product.form,
+            Product.manufacturer,
+            Product.country,
+            Product.price,
+            Product.quantity,
+            Product.pharmacy_id,
+            tier.label("tier"),
+            (and_(*attribute_conditions) if attribute_conditions else true()).label(
+                "attr_match"
+            ),
+            levels["exact_score"].label("exact_score"),
+            levels["starts_score"].label("starts_score"),
+            levels["word_score"].label("word_score"),
+            levels["name_rank"].label("name_rank"),
+            # float8: значения попадают в курсор и сравниваются без потери точности
+            func.coalesce(
+                func.ts_rank(Product.search_vector, levels["ts_query"]).cast(Float), 0.0
+            ).label("fts_score"),
+            func.coalesce(
+                func.similarity(Product.name_lower, search_query).cast(Float), 0.0
+            ).label("trigram_score"),
+            levels["levenshtein_normalized"].cast(Float).label("levenshtein_score"),
+            levels["levenshtein_distance"].label("levenshtein_distance"),
+        )
+        .join(Pharmacy)
+        .where(or_(levels["exact"], levels["fts"], levels["fuzzy"]))
+        .where(*_location_price_conditions(filters))
+        .cte("candidates")
+    )
+    c = candidates.c
+
+    # Уровень выбирается с учётом всех фильтров (как и раньше при подсчёте уровней)
+    chosen = select(func.min(c.tier).filter(c.attr_match).label("tier")).cte("chosen")
+    chosen_tier = select(chosen.c.tier).scalar_subquery()
+
+    items_where = and_(c.tier == chosen_tier, c.attr_match, c.quantity > 0)
+    paging = _paging_cte(
+        select(func.count().label("total")).where(items_where), page, size
+    )
+    items_json, next_key = _page_items_json(
+        candidates,
+        items_where,
+        [
+            -c.name_rank,
+            -c.fts_score,
+            -c.trigram_score,
+            -c.levenshtein_score,
+            c.levenshtein_distance,
+            func.coalesce(c.price, 0),
+            c.uuid,
+        ],
+        paging,
+        size,
+        cursor,
+    )
+
+    # Шаг 2 — комбинации (name, form, manufacturer, country); при выбранной форме не нужны
+    if filters.has_form:
+        combinations_json = EMPTY_JSON_ARRAY
+    else:
+        if filters.min_price is None and filters.max_price is None:
+            combinations = _group_combinations(search_query, filters, chosen_tier)
+        else:
+            # Агрегаты product_groups не зависят от цены — считаем по кандидатам
+            combinations = _candidate_combinations(candidates, chosen_tier)
+        combinations_json = select(
+            func.coalesce(
+                func.json_agg(
+                    aggregate_order_by(
+                        combinations.c.combination, combinations.c.ordinal
+                    )
+                ),
+                EMPTY_JSON_ARRAY,
+            )
+        ).scalar_subquery()
+
+    return select(
+        chosen.c.tier,
+        paging.c.total,
+        paging.c.current_page,
+        combinations_json.label("combinations"),
+        items_json.label("items"),
+        next_key.label("next_key"),
+    ).select_from(chosen.join(paging, true()))
+
+
+def build_specific_search_statement(
+    search_query: str,
+    filters: SearchFilters,
+    page: int,
+    size: int,
+    cursor: Optional[str] = None,
+):
+    """Шаг 3: прямой поиск по выбранной комбинации, без уровней."""
+    conditions = _location_price_conditions(filters) + _attribute_conditions(filters)
+    # Только товары в наличии
+    conditions.append(Product.quantity > 0)
+
+    # Фильтрация по имени: все значимые слова (AND) через полнотекстовый индекс
+    search_words = [
+        w for w in search_query.split() if len(w) >= 2 and w not in SPECIFIC_STOPWORDS
+    ]
+    if search_words:
+        ts_query = func.to_tsquery(
+            SEARCH_TS_CONFIG, " & ".join([f"{w}:*" for w in search_words])
+        )
+        conditions.append(Product.search_vector.op("@@")(ts_query))
+        relevance = func.coalesce(
+            func.ts_rank(Product.search_vector, ts_query).cast(Float), 0.0
+        )
+    else:
+        # Fallback: точное вхождение (если все слова были стоп-словами)
+        conditions.append(Product.name_lower.like(f"%{search_query}%"))
+        relevance = literal(0.0, Float)
+
+    candidates = (
+        select(
+            Product.uuid,
+            Product.price,
+            Product.quantity,
+            relevance.label("relevance"),
+        )
+        .join(Pharmacy)
+        .where(*conditions)
+        .cte("candidates")
+    )
+    c = candidates.c
+    paging = _paging_cte(
+        select(func.count().label("total")).select_from(candidates), page, size
+    )
+    items_json, next_key = _page_items_json(
+        candidates,
+        true(),
+        [-c.relevance, func.coalesce(c.price, 0), -c.quantity, c.uuid],
+        paging,
+        size,
+        cursor,
+    )
+    return select(
+        paging.c.total,
+        paging.c.current_page,
+        items_json.label("items"),
+        next_key.label("next_key"),
+    ).select_from(paging)
+
+
+def _page_count(total: int, size: int) -> int:
+    return ceil(total / size) if total > 0 else 1
+
+
+def _next_cursor(next_key: Optional[list]) -> Optional[str]:
+    return encode_cursor(next_key) if next_key else None
+
+
+async def execute_search(
+    db: AsyncSession,
+    q: str,
+    filters: SearchFilters,
+    page: int,
+    size: int,
+    cursor: Optional[str] = None,
+) -> dict:
+    """Выполняет поиск одним SQL-запросом и возвращает ответ /search-fts/.
+
+    С cursor страница выбирается по keyset (page игнорируется, в ответе
+    page = None); next_cursor возвращается в обоих режимах.
+    """
+    # Нормализуем запрос по тем же правилам, что и Product.name_lower
+    search_query = normalize_search_text(q)
+    if not search_query:
+        return empty_search_response(size)
+
+    if filters.is_specific_combination:
+        row = (
+            await db.execute(
+                build_specific_search_statement(
+                    search_query, filters, page, size, cursor
+                )
+            )
+        ).one()
+        return {
+            "items": row.items,
+            "total": row.total,
+            "page": None if cursor else row.current_page,
+            "size": size,
+            "total_pages": _page_count(row.total, size),
+            "available_combinations": [],
+            "total_found": 0,
+            "search_level": "specific_combination",
+            "next_cursor": _next_cursor(row.next_key),
+        }
+
+    row = (
+        await db.execute(
+            build_tiered_search_statement(search_query, filters, page, size, cursor)
+        )
+    ).one()
+
+    # Ни один уровень не дал результатов
+    if row.tier is None:
+        return empty_search_response(size)
+
+    combinations = row.combinations
+    return {
+        "items": row.items,
+        "total": row.total,
+        "page": None if cursor else row.current_page,
+        "size": size,
+        "total_pages": _page_count(row.total, size),
+        "available_combinations": combinations,
+        "total_found": sum(c["count"] for c in combinations),
+        "search_level": TIER_NAMES[row.tier],
+        "next_cursor": _next_cursor(row.next_key),
+    }
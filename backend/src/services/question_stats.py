@@ -0,0 +1,126 @@
+"""Статистика вопросов/консультаций одним агрегатным запросом.
+
+Все счётчики по статусам, завершённые сегодня и среднее время ответа за
+неделю считаются одним ``SELECT count(*) FILTER (WHERE ...)`` по
+qa_questions. Общая статистика (дашборд фармацевта, /questions/stats/)
+кэшируется в Redis на QUESTION_STATS_TTL секунд — одна запись на все
+gunicorn-воркеры. Статистика одного пользователя не кэшируется: она
+читается по индексу (user_id, status) и должна сразу отражать его новые
+вопросы.
+"""
+import json
+import logging
+import os
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from prometheus_client import Counter
+from sqlalchemy import and_, func, select
+
+from auth.session_manager import get_redis_client
+from db.qa_models import Question
+from utils.time_utils import get_utc_now_naive
+
+logger = logging.getLogger(__name__)
+
+QUESTION_STATS_CACHE_KEY = "qa:stats:all"
+QUESTION_STATS_TTL = int(os.getenv("QUESTION_STATS_TTL", "10"))
+RESPONSE_TIME_WINDOW = timedelta(days=7)
+
+QUESTION_STATS_CACHE_HITS = Counter(
+    "question_stats_cache_hits_total", "Question stats served from Redis"
+)
+QUESTION_STATS_CACHE_MISSES = Counter(
+    "question_stats_cache_misses_total", "Question stats computed in Postgres"
+)
+
+
+@dataclass
+class QuestionStats:
+    total: int = 0
+    pending: int = 0
+    in_progress: int = 0
+    answered: int = 0
+    completed: int = 0
+    completed_today: int = 0
+    avg_response_time_minutes: float = 0.0
+
+    @property
+    def answer_rate(self) -> float:
+        return self.answered / self.total if self.total else 0
+
+
+def question_stats_query(user_id: Optional[uuid.UUID] = None, now: Optional[datetime] = None):
+    """Один агрегат по qa_questions (все вопросы или вопросы пользователя)."""
+    now = now or get_utc_now_naive()
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    status = Question.status
+
+    query = select(
+        func.count().label("total"),
+        func.count().filter(status == "pending").label("pending"),
+        func.count().filter(status == "in_progress").label("in_progress"),
+        func.count().filter(status == "answered").label("answered"),
+        func.count().filter(status == "completed").label("completed"),
+        func.count()
+        .filter(and_(status == "completed", Question.created_at >= today_start))
+        .label("completed_today"),
+        func.avg(
+            func.extract("epoch", Question.answered_at - Question.created_at)
+        )
+        .filter(
+            and_(
+                status.in_(["answered", "completed"]),
+                Question.created_at >= now - RESPONSE_TIME_WINDOW,
+            )
+        )
+        .label("avg_response_seconds"),
+    ).select_from(Question)
+    if user_id is not None:
+        query = query.where(Question.user_id == user_id)
+    return query
+
+
+async def compute_question_stats(db, user_id: Optional[uuid.UUID] = None) -> QuestionStats:
+    row = (await db.execute(question_stats_query(user_id))).one()
+    avg_seconds = row.avg_response_seconds
+    return QuestionStats(
+        total=row.total,
+        pending=row.pending,
+        in_progress=row.in_progress,
+        answered=row.answered,
+        completed=row.completed,
+        completed_today=row.completed_today,
+        avg_response_time_minutes=round(float(avg_seconds) / 60, 2) if avg_seconds else 0.0,
+    )
+
+
+async def get_question_stats(db, user_id: Optional[uuid.UUID] = None) -> QuestionStats:
+    """Статистика вопросов; общая — через кэш, недоступность Redis не ломает ответ."""
+    if user_id is not None:
+        return await compute_question_stats(db, user_id)
+
+    redis_client = None
+    try:
+        redis_client = await get_redis_client()
+        cached = await redis_client.get(QUESTION_STATS_CACHE_KEY)
+        if cached is not None:
+            QUESTION_STATS_CACHE_HITS.inc()
+            return QuestionStats(**json.loads(cached))
+    except Exception as e:
+        logger.warning(f"Question stats cache lookup failed: {e}")
+        redis_client = None
+
+    QUESTION_STATS_CACHE_MISSES.inc()
+    stats = await compute_question_stats(db)
+
+    if redis_client is not None:
+        try:
+            await redis_client.set(
+                QUESTION_STATS_CACHE_KEY, json.dumps(asdict(stats)), ex=QUESTION_STATS_TTL
+            )
+        except Exception as e:
+            logger.warning(f"Question stats cache store failed: {e}")
+    return stats
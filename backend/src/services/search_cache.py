@@ -0,0 +1,143 @@
+"""Кэш результатов /search-fts/ в Redis.
+
+Остатки аптек меняются только при импорте CSV, поэтому ответы поиска
+кэшируются по нормализованному запросу и фильтрам. Инвалидация — через
+счётчики поколений: импорт аптеки увеличивает поколение её города и общее
+поколение (для запросов без фильтра города). Запись хранит поколение, с
+которым была построена; при несовпадении она считается устаревшей и удаляется.
+"""
+import hashlib
+import json
+import logging
+import os
+from dataclasses import asdict
+from typing import Optional, Tuple
+
+from prometheus_client import Counter
+
+from auth.session_manager import get_redis_client
+from services.product_search import ALL_CITIES, SearchFilters, execute_search
+from services.search_index import normalize_search_text
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CACHE_PREFIX = "search:cache:"
+SEARCH_GENERATIONS_KEY = "search:generations"
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "900"))
+GLOBAL_SCOPE = "*"
+
+SEARCH_CACHE_HITS = Counter("search_cache_hits_total", "Search cache hits")
+SEARCH_CACHE_MISSES = Counter("search_cache_misses_total", "Search cache misses")
+SEARCH_CACHE_EVICTIONS = Counter(
+    "search_cache_evictions_total",
+    "Stale search cache entries dropped after a pharmacy import",
+)
+
+
+def cache_scope(city: Optional[str]) -> str:
+    """Поле счётчика поколений, которое инвалидирует запрос с данным городом.
+
+    Фильтр города применяется через ILIKE, поэтому шаблоны с % и _ могут
+    совпасть с любым городом — для них используется общее поколение.
+    """
+    if not city or city == ALL_CITIES or "%" in city or "_" in city:
+        return GLOBAL_SCOPE
+    return normalize_search_text(city)
+
+
+def build_cache_key(
+    q: str,
+    filters: SearchFilters,
+    page: int,
+    size: int,
+    cursor: Optional[str] = None,
+) -> str:
+    payload = {
+        "q": normalize_search_text(q),
+        **asdict(filters),
+        "page": page,
+        "size": size,
+        "cursor": cursor,
+    }
+    digest = hashlib.sha1(
+        json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    return f"{SEARCH_CACHE_PREFIX}{digest}"
+
+
+async def get_cached_search(
+    redis_client, key: str, scope: str
+) -> Tuple[Optional[dict], int]:
+    """Возвращает (ответ или None, текущее поколение области).
+
+    Поколение нужно сохранить вместе с ответом, прочитанным из БД: если
+    импорт завершится во время запроса, запись сразу окажется устаревшей.
+    """
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.get(key)
+        pipe.hget(SEARCH_GENERATIONS_KEY, scope)
+        raw, generation = await pipe.execute()
+
+    generation = int(generation or 0)
+    if raw is None:
+        SEARCH_CACHE_MISSES.inc()
+        return None, generation
+
+    entry = json.loads(raw)
+    if entry.get("generation") != generation:
+        SEARCH_CACHE_EVICTIONS.inc()
+        SEARCH_CACHE_MISSES.inc()
+        await redis_client.delete(key)
+        return None, generation
+
+    SEARCH_CACHE_HITS.inc()
+    return entry["response"], generation
+
+
+async def store_cached_search(redis_client, key: str, generation: int, response: dict):
+    await redis_client.set(
+        key,
+        json.dumps({"generation": generation, "response": response}, default=str),
+        ex=SEARCH_CACHE_TTL,
+    )
+
+
+async def bump_pharmacy_generation(redis_client, city: Optional[str]):
+    """Помечает устаревшими записи кэша, которые могли включать аптеку из city."""
+    async with redis_client.pipeline(transaction=True) as pipe:
+        for scope in {cache_scope(city), GLOBAL_SCOPE}:
+            pipe.hincrby(SEARCH_GENERATIONS_KEY, scope, 1)
+        await pipe.execute()
+
+
+async def cached_execute_search(
+    db,
+    q: str,
+    filters: SearchFilters,
+    page: int,
+    size: int,
+    cursor: Optional[str] = None,
+) -> dict:
+    """execute_search с кэшем; недоступность Redis не ломает поиск."""
+    key = build_cache_key(q, filters, page, size, cursor)
+    redis_client = None
+    generation = 0
+    try:
+        redis_client = await get_redis_client()
+        cached, generation = await get_cached_search(
+            redis_client, key, cache_scope(filters.city)
+        )
+        if cached is not None:
+            return cached
+    except Exception as e:
+        logger.warning(f"Search cache lookup failed: {e}")
+        redis_client = None
+
+    response = await execute_search(db, q, filters, page, size, cursor)
+
+    if redis_client is not None:
+        try:
+            await store_cached_search(redis_client, key, generation, response)
+        except Exception as e:
+            logger.warning(f"Search cache store failed: {e}")
+    return response
@@ -0,0 +1,129 @@
+"""
+Поисковый индекс товаров.
+
+Для каждой строки ``products`` хранятся предвычисленные поля:
+
+- ``name_lower`` — нормализованное название (нижний регистр, ё→е,
+  схлопнутые пробелы); по нему построены trigram GIN и text_pattern_ops
+  индексы, которые обслуживают ``LIKE``, ``%`` (similarity) и префиксный поиск;
+- ``search_tokens`` — массив уникальных токенов названия (GIN по массиву);
+- ``search_vector`` — ``to_tsvector('russian_simple', name_lower)`` (GIN).
+
+Поля заполняются импортом CSV (``tasks/tasks_increment.py``) и пересобираются
+командой ``python -m scripts.rebuild_search_index``. Нормализация запроса в
+``routers/search.py`` использует те же функции, поэтому индекс и запрос
+всегда совпадают по правилам приведения текста.
+"""
+
+import logging
+import re
+import time
+from typing import Dict, List, Optional
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Конфигурация полнотекстового поиска, используемая и для индекса, и для запросов
+SEARCH_TS_CONFIG = "russian_simple"
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TOKEN_SPLIT_RE = re.compile(r"[^\w]+")
+
+
+def normalize_search_text(value: Optional[str]) -> str:
+    """Нормализует название товара или поисковый запрос.
+
+    Правила должны совпадать с SQL-выражением в миграции
+    ``n1o2p3q4r5s6_add_product_search_index`` (первичное заполнение).
+    """
+    if not value:
+        return ""
+    text = value.lower().replace("ё", "е")
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def tokenize_search_text(normalized: str) -> List[str]:
+    """Разбивает нормализованную строку на уникальные токены (порядок сохраняется)."""
+    if not normalized:
+        return []
+    return list(dict.fromkeys(t for t in _TOKEN_SPLIT_RE.split(normalized) if t))
+
+
+def build_search_index_fields(name: Optional[str]) -> Dict[str, object]:
+    """Возвращает значения индексных колонок для названия товара.
+
+    ``search_vector`` вычисляется на стороне PostgreSQL из ``name_lower``.
+    """
+    name_lower = normalize_search_text(name)
+    return {
+        "name_lower": name_lower,
+        "search_tokens": tokenize_search_text(name_lower),
+    }
+
+
+# UPDATE одной пачки: массивы uuid / name_lower / токенов (токены склеены пробелом,
+# т.к. asyncpg не передаёт «рваные» двумерные массивы)
+_REBUILD_BATCH_SQL = f"""
+    UPDATE products p
+    SET
+        name_lower = v.name_lower,
+        search_tokens = string_to_array(v.tokens, ' '),
+        search_vector = to_tsvector('{SEARCH_TS_CONFIG}', v.name_lower)
+    FROM unnest($1::uuid[], $2::text[], $3::text[]) AS v(uuid, name_lower, tokens)
+    WHERE p.uuid = v.uuid
+"""
+
+
+async def rebuild_search_index(
+    conn: asyncpg.Connection,
+    batch_size: int = 5000,
+    only_missing: bool = False,
+) -> int:
+    """Пересобирает поисковые колонки ``products`` пачками по ``uuid``.
+
+    Каждая пачка коммитится отдельно, поэтому пересборку можно прервать
+    и продолжить с ``only_missing=True``.
+
+    Returns
+    -------
+    int
+        Количество обновлённых строк.
+    """
+    missing_clause = "AND name_lower IS NULL" if only_missing else ""
+    last_uuid = None
+    total = 0
+    started = time.monotonic()
+
+    while True:
+        rows = await conn.fetch(
+            f"""
+            SELECT uuid, name FROM products
+            WHERE ($1::uuid IS NULL OR uuid > $1) {missing_clause}
+            ORDER BY uuid
+            LIMIT $2
+            """,
+            last_uuid,
+            batch_size,
+        )
+        if not rows:
+            break
+
+        uuids, names_lower, tokens = [], [], []
+        for row in rows:
+            fields = build_search_index_fields(row["name"])
+            uuids.append(row["uuid"])
+            names_lower.append(fields["name_lower"])
+            tokens.append(" ".join(fields["search_tokens"]))
+
+        async with conn.transaction():
+            await conn.execute(_REBUILD_BATCH_SQL, uuids, names_lower, tokens)
+
+        total += len(rows)
+        last_uuid = rows[-1]["uuid"]
+        logger.info(f"Search index rebuild: {total} rows processed")
+
+    logger.info(
+        f"Search index rebuild finished: {total} rows in {time.monotonic() - started:.1f}s"
+    )
+    return total
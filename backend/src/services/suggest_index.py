@@ -0,0 +1,278 @@
+"""In-memory индекс подсказок для поисковой строки (/search/suggest).
+
+Каждый worker держит в памяти отсортированные массивы нормализованных
+названий товаров и ищет по ним префикс через bisect — без обращения к
+Postgres. Если по префиксу ничего не найдено, слова запроса исправляются
+по словарю через триграммы (опечатки) и поиск повторяется.
+
+Индекс загружается целиком при старте worker'а и периодически, а между
+загрузками обновляется сообщениями импорта CSV из канала Redis
+SUGGEST_UPDATES_CHANNEL (см. tasks/tasks_increment.py).
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import select
+
+from auth.session_manager import get_redis_client
+from db.database import async_session_maker
+from db.models import Product
+from services.search_index import normalize_search_text
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_UPDATES_CHANNEL = "search:suggest:updates"
+SUGGEST_FULL_REFRESH_SECONDS = int(os.getenv("SUGGEST_FULL_REFRESH_SECONDS", "3600"))
+SUGGEST_MIN_WORD_LENGTH = 3
+SUGGEST_SIMILARITY_THRESHOLD = 0.3
+
+
+def _trigrams(word: str) -> Set[str]:
+    """Триграммы слова в стиле pg_trgm (два пробела в начале, один в конце)."""
+    padded = f"  {word} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class SuggestIndex:
+    """Префиксный индекс названий + триграммный словарь слов для опечаток.
+
+    _keys — отсортированные нормализованные названия (поиск с начала);
+    _word_starts/_word_owners — отсортированные «хвосты» названий, начинающиеся
+    со второго и следующих слов, и названия, которым они принадлежат.
+    """
+
+    def __init__(self):
+        self._display: Dict[str, str] = {}
+        self._keys: List[str] = []
+        self._word_starts: List[str] = []
+        self._word_owners: List[str] = []
+        self._word_refs: Counter = Counter()
+        self._trigram_words: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @staticmethod
+    def _tails(key: str) -> List[str]:
+        tails = []
+        position = key.find(" ")
+        while position != -1:
+            tails.append(key[position + 1 :])
+            position = key.find(" ", position + 1)
+        return tails
+
+    @staticmethod
+    def _words(key: str) -> Set[str]:
+        return {w for w in key.split() if len(w) >= SUGGEST_MIN_WORD_LENGTH}
+
+    def _add_word(self, word: str):
+        self._word_refs[word] += 1
+        if self._word_refs[word] == 1:
+            for trigram in _trigrams(word):
+                self._trigram_words.setdefault(trigram, set()).add(word)
+
+    def _remove_word(self, word: str):
+        self._word_refs[word] -= 1
+        if self._word_refs[word] <= 0:
+            del self._word_refs[word]
+            for trigram in _trigrams(word):
+                words = self._trigram_words.get(trigram)
+                if words is not None:
+                    words.discard(word)
+                    if not words:
+                        del self._trigram_words[trigram]
+
+    def build(self, names: Iterable[str]):
+        """Полная пересборка; структуры заменяются целиком."""
+        fresh = SuggestIndex()
+        for name in names:
+            key = normalize_search_text(name)
+            if key and key not in fresh._display:
+                fresh._display[key] = name
+        fresh._keys = sorted(fresh._display)
+        pairs = sorted(
+            (tail, key) for key in fresh._keys for tail in self._tails(key)
+        )
+        fresh._word_starts = [tail for tail, _ in pairs]
+        fresh._word_owners = [key for _, key in pairs]
+        for key in fresh._keys:
+            for word in self._words(key):
+                fresh._add_word(word)
+        self.__dict__.update(fresh.__dict__)
+
+    def add(self, name: str):
+        key = normalize_search_text(name)
+        if not key or key in self._display:
+            return
+        self._display[key] = name
+        insort(self._keys, key)
+        for tail in self._tails(key):
+            # Порядок (tail, key) — как при полной сборке
+            position = bisect_left(self._word_starts, tail)
+            while (
+                position < len(self._word_starts)
+                and self._word_starts[position] == tail
+                and self._word_owners[position] < key
+            ):
+                position += 1
+            self._word_starts.insert(position, tail)
+            self._word_owners.insert(position, key)
+        for word in self._words(key):
+            self._add_word(word)
+
+    def remove(self, key: str):
+        if self._display.pop(key, None) is None:
+            return
+        del self._keys[bisect_left(self._keys, key)]
+        for tail in self._tails(key):
+            position = bisect_left(self._word_starts, tail)
+            while self._word_owners[position] != key:
+                position += 1
+            del self._word_starts[position]
+            del self._word_owners[position]
+        for word in self._words(key):
+            self._remove_word(word)
+
+    def _prefix_lookup(self, prefix: str, limit: int) -> List[str]:
+        found: List[str] = []
+        position = bisect_left(self._keys, prefix)
+        while (
+            len(found) < limit
+            and position < len(self._keys)
+            and self._keys[position].startswith(prefix)
+        ):
+            found.append(self._keys[position])
+            position += 1
+
+        seen = set(found)
+        position = bisect_left(self._word_starts, prefix)
+        while (
+            len(found) < limit
+            and position < len(self._word_starts)
+            and self._word_starts[position].startswith(prefix)
+        ):
+            key = self._word_owners[position]
+            if key not in seen:
+                seen.add(key)
+                found.append(key)
+            position += 1
+        return found
+
+    def _has_word_prefix(self, word: str) -> bool:
+        position = bisect_left(self._word_starts, word)
+        if position < len(self._word_starts) and self._word_starts[position].startswith(
+            word
+        ):
+            return True
+        position = bisect_left(self._keys, word)
+        return position < len(self._keys) and self._keys[position].startswith(word)
+
+    def _closest_word(self, word: str) -> Optional[str]:
+        query_trigrams = _trigrams(word)
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(self._trigram_words.get(trigram, ()))
+
+        scored = [
+            # |триграммы слова| = len + 1 (как в _trigrams)
+            (common / (len(query_trigrams) + len(candidate) + 1 - common), candidate)
+            for candidate, common in shared.items()
+        ]
+        scored = [item for item in scored if item[0] >= SUGGEST_SIMILARITY_THRESHOLD]
+        if not scored:
+            return None
+        return min(scored, key=lambda item: (-item[0], item[1]))[1]
+
+    def suggest(self, query: str, limit: int = 10) -> List[str]:
+        prefix = normalize_search_text(query)
+        if not prefix:
+            return []
+        keys = self._prefix_lookup(prefix, limit)
+        if not keys:
+            # Исправляем слова, с которых не начинается ни одно слово словаря
+            words = prefix.split()
+            corrected = [
+                word
+                if len(word) < SUGGEST_MIN_WORD_LENGTH or self._has_word_prefix(word)
+                else (self._closest_word(word) or word)
+                for word in words
+            ]
+            if corrected != words:
+                keys = self._prefix_lookup(" ".join(corrected), limit)
+        return [self._display[key] for key in keys]
+
+    def apply_update(self, update: dict):
+        for key in update.get("removed", ()):
+            self.remove(key)
+        for name in update.get("added", ()):
+            self.add(name)
+
+
+suggest_index = SuggestIndex()
+_suggest_index_task = None
+
+
+async def load_suggest_index():
+    started = time.monotonic()
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(Product.name).where(Product.is_removed.is_(False)).distinct()
+        )
+        suggest_index.build(name for (name,) in result.all() if name)
+    logger.info(
+        f"Suggest index loaded: {len(suggest_index)} names "
+        f"in {time.monotonic() - started:.2f}s"
+    )
+
+
+async def suggest_index_listener():
+    """Background task: полная загрузка индекса + обновления из Redis.
+
+    Подписка оформляется до загрузки, чтобы не потерять обновления, пришедшие
+    во время чтения из БД. Раз в SUGGEST_FULL_REFRESH_SECONDS индекс
+    перечитывается целиком (обновления pub/sub не гарантируют доставку).
+    """
+    while True:
+        try:
+            r = await get_redis_client()
+            pubsub = r.pubsub()
+            await pubsub.subscribe(SUGGEST_UPDATES_CHANNEL)
+            try:
+                await load_suggest_index()
+                deadline = time.monotonic() + SUGGEST_FULL_REFRESH_SECONDS
+                while time.monotonic() < deadline:
+                    msg = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=1.0
+                    )
+                    if msg and msg["type"] == "message":
+                        suggest_index.apply_update(json.loads(msg["data"]))
+            finally:
+                await pubsub.unsubscribe(SUGGEST_UPDATES_CHANNEL)
+                await pubsub.aclose()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Suggest index listener error: {e}, restarting in 5s")
+            await asyncio.sleep(5)
+
+
+def start_suggest_index():
+    """Start the suggest index background task"""
+    global _suggest_index_task
+    if _suggest_index_task is None or _suggest_index_task.done():
+        _suggest_index_task = asyncio.create_task(suggest_index_listener())
+        logger.info("Suggest index task started")
+
+
+def stop_suggest_index():
+    """Stop the suggest index background task"""
+    global _suggest_index_task
+    if _suggest_index_task and not _suggest_index_task.done():
+        _suggest_index_task.cancel()
+        logger.info("Suggest index task stopped")
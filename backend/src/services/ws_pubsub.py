@@ -0,0 +1,399 @@
+"""Межпроцессная доставка WebSocket-событий: Redis Streams + Pub/Sub по топикам.
+
+События пишутся в каналы по адресатам:
+
+- PHARMACISTS_CHANNEL — события дашборда (новые вопросы, назначения,
+  завершения, сообщения во всех консультациях);
+- ws:consultation:{id} — события чата одной консультации для пользователя.
+
+Каждое событие атомарно (Lua: XADD + PUBLISH) добавляется в ограниченный
+стрим канала ("{channel}:stream", MAXLEN ~) и публикуется в канал вместе с
+ID записи стрима. ID монотонно растёт в пределах канала и уходит клиенту
+полем event_id; при переподключении клиент передаёт last_event_id и
+получает только пропущенные события (replay) вместо полной перезагрузки.
+Если нужная часть стрима уже обрезана, клиент получает replay_reset и
+перечитывает данные целиком, как раньше.
+
+Worker подписан на канал, только пока держит подходящий сокет: реестр
+соединений (services.ws_registry) сообщает шине о первом и последнем сокете
+роли/консультации, а задача синхронизации досылает SUBSCRIBE/UNSUBSCRIBE
+по разнице между нужными и текущими каналами. Свои события worker тоже
+получает через Pub/Sub — так порядок доставки совпадает с порядком в стриме.
+Метрики ws_pubsub_messages_received_total / ws_pubsub_messages_delivered_total
+показывают по каждому worker'у, сколько полученных сообщений дошло до
+локальных сокетов.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge
+
+from auth.session_manager import get_redis_client
+from services.ws_registry import PHARMACIST, USER
+
+logger = logging.getLogger(__name__)
+
+PHARMACISTS_CHANNEL = "ws:pharmacists"
+CONSULTATION_CHANNEL_PREFIX = "ws:consultation:"
+WS_PUBSUB_POLL_TIMEOUT = 1.0
+
+WS_STREAM_MAXLEN_PHARMACISTS = int(os.getenv("WS_STREAM_MAXLEN_PHARMACISTS", "10000"))
+WS_STREAM_MAXLEN_CONSULTATION = int(os.getenv("WS_STREAM_MAXLEN_CONSULTATION", "500"))
+# Стрим консультации живёт сутки после последнего события
+WS_STREAM_CONSULTATION_TTL = int(os.getenv("WS_STREAM_CONSULTATION_TTL", "86400"))
+WS_REPLAY_LIMIT = int(os.getenv("WS_REPLAY_LIMIT", "1000"))
+WS_REPLAY_SUBSCRIBE_TIMEOUT = 2.0
+
+# KEYS[1] — стрим; ARGV: maxlen, ttl, событие, канал
+PUBLISH_EVENT_SCRIPT = """
+local id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], '*', 'event', ARGV[3])
+if tonumber(ARGV[2]) > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+redis.call('PUBLISH', ARGV[4], id .. ' ' .. ARGV[3])
+return id
+"""
+
+WS_PUBSUB_RECEIVED = Counter(
+    "ws_pubsub_messages_received_total",
+    "Cross-worker WebSocket events received from Redis by this worker",
+    ["channel_kind"],
+)
+WS_PUBSUB_DELIVERED = Counter(
+    "ws_pubsub_messages_delivered_total",
+    "Received cross-worker events that reached at least one local socket",
+    ["channel_kind"],
+)
+WS_PUBSUB_SUBSCRIPTIONS = Gauge(
+    "ws_pubsub_subscriptions", "Redis channels this worker is subscribed to"
+)
+WS_REPLAYS = Counter(
+    "ws_replays_total", "WebSocket reconnect replays by outcome", ["outcome"]
+)
+WS_REPLAYED_EVENTS = Counter(
+    "ws_replayed_events_total", "Events re-sent to reconnecting WebSockets"
+)
+
+
+def consultation_channel(consultation_id: str) -> str:
+    return f"{CONSULTATION_CHANNEL_PREFIX}{consultation_id}"
+
+
+def stream_key(channel: str) -> str:
+    return f"{channel}:stream"
+
+
+def channel_kind(channel: str) -> str:
+    return "pharmacists" if channel == PHARMACISTS_CHANNEL else "consultation"
+
+
+def stream_id(value: str) -> Tuple[int, int]:
+    """ID записи стрима ("<ms>-<seq>") для сравнения; ValueError — не ID."""
+    ms, _, seq = value.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def event_channels(message: dict) -> List[str]:
+    """Каналы, в которые публикуется событие, по его типу."""
+    event_type = message.get("type", "")
+    question_id = message.get("question_id")
+    if event_type == "message_update" and question_id:
+        return [PHARMACISTS_CHANNEL, consultation_channel(question_id)]
+    if event_type == "user_completion" and question_id:
+        return [consultation_channel(question_id)]
+    return [PHARMACISTS_CHANNEL]
+
+
+def client_message(channel: str, data: dict) -> Optional[dict]:
+    """Событие канала в формате, который ждут сокеты; None — событие битое."""
+    event_type = data.get("type", "")
+    if channel == PHARMACISTS_CHANNEL:
+        if event_type == "message_update":
+            question_id = data.get("question_id", "")
+            message_data = data.get("message_data", {})
+            if not question_id or not message_data:
+                logger.error(f"Invalid message_update data: {data}")
+                return None
+            return {"type": "message_update", "question_id": question_id, "data": message_data}
+        if event_type == "new_question":
+            question_data = data.get("question_data", {})
+            if not question_data:
+                logger.error(f"Invalid new_question data: {data}")
+                return None
+            return {"type": "new_question", "data": question_data}
+        return data
+
+    question_id = channel[len(CONSULTATION_CHANNEL_PREFIX):]
+    if event_type == "message_update":
+        return {
+            "type": "message_update",
+            "question_id": question_id,
+            "data": data.get("message_data", {}),
+        }
+    if event_type == "user_completion":
+        return {
+            "type": "question_completed",
+            "question_id": question_id,
+            "completed_by": data.get("completed_by", ""),
+            "status": "completed",
+        }
+    return data
+
+
+class WebSocketEventBus:
+    """Подписки worker'а на каналы WebSocket-событий, их доставка и replay."""
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.wanted = set()
+        self.subscribed = set()
+        # Канал -> событие "SUBSCRIBE выполнен"; его ждёт replay
+        self._ready: Dict[str, asyncio.Event] = {}
+        self._changed = asyncio.Event()
+        self._active = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._script = None
+        manager.bus = self
+        if manager.pharmacist_connections:
+            self.watch(PHARMACIST)
+        for consultation_id in manager.consultation_connections:
+            self.watch(USER, consultation_id)
+
+    def channel(self, role: str, consultation_id: Optional[str] = None) -> str:
+        if role == PHARMACIST:
+            return PHARMACISTS_CHANNEL
+        return consultation_channel(consultation_id)
+
+    def watch(self, role: str, consultation_id: Optional[str] = None):
+        """Вызывается реестром при первом сокете роли/консультации."""
+        channel = self.channel(role, consultation_id)
+        self.wanted.add(channel)
+        self._ready.setdefault(channel, asyncio.Event())
+        self._changed.set()
+
+    def unwatch(self, role: str, consultation_id: Optional[str] = None):
+        """Вызывается реестром, когда закрылся последний такой сокет."""
+        self.wanted.discard(self.channel(role, consultation_id))
+        self._changed.set()
+
+    async def publish(self, message: dict) -> bool:
+        """
+        Publish event to Redis Streams + Pub/Sub for cross-worker sync.
+        Сокетам этого worker'а событие приходит тем же путём. Если Redis
+        недоступен, событие доставляется только локальным сокетам (без
+        event_id). Возвращает True при успехе, False при ошибке.
+        """
+        channels = event_channels(message)
+        try:
+            payload = json.dumps(message, default=str)
+            r = await get_redis_client()
+            if self._script is None:
+                self._script = r.register_script(PUBLISH_EVENT_SCRIPT)
+            for channel in channels:
+                if channel == PHARMACISTS_CHANNEL:
+                    maxlen, ttl = WS_STREAM_MAXLEN_PHARMACISTS, 0
+                else:
+                    maxlen, ttl = WS_STREAM_MAXLEN_CONSULTATION, WS_STREAM_CONSULTATION_TTL
+                await self._script(
+                    keys=[stream_key(channel)],
+                    args=[maxlen, ttl, payload, channel],
+                    client=r,
+                )
+            logger.info(f"✅ Redis published: {message.get('type', 'unknown')}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Redis publish failed: {e}", exc_info=True)
+            data = json.loads(json.dumps(message, default=str))
+            for channel in channels:
+                await self._deliver(channel, data, None)
+            return False
+
+    async def _deliver(self, channel: str, data: dict, event_id: Optional[str]) -> int:
+        message = client_message(channel, data)
+        if message is None:
+            return 0
+        if event_id:
+            message = {**message, "event_id": event_id}
+        if channel == PHARMACISTS_CHANNEL:
+            return await self.manager.broadcast(message, event_id=event_id)
+        return await self.manager.broadcast_to_consultation(
+            channel[len(CONSULTATION_CHANNEL_PREFIX):], message, event_id=event_id
+        )
+
+    async def handle(self, channel: str, raw: str) -> int:
+        """Доставляет полученное событие локальным сокетам; возвращает их число."""
+        kind = channel_kind(channel)
+        WS_PUBSUB_RECEIVED.labels(channel_kind=kind).inc()
+        event_id, _, payload = raw.partition(" ")
+        try:
+            data = json.loads(payload)
+        except json.JSONDecodeError as e:
+            logger.error(f"❌ Redis WS JSON decode error: {e}")
+            return 0
+        delivered = await self._deliver(channel, data, event_id)
+        if delivered:
+            WS_PUBSUB_DELIVERED.labels(channel_kind=kind).inc()
+        return delivered
+
+    async def replay(self, websocket, last_event_id: Optional[str] = None):
+        """
+        Досылает сокету, подключённому с replay=True, события после
+        last_event_id и переключает его на живую доставку.
+
+        Последним из replay приходит {"type": "replay_complete", "event_id":
+        <позиция в стриме>} либо {"type": "replay_reset"} — часть событий
+        уже недоступна, клиенту нужно перечитать данные целиком.
+        """
+        conn = self.manager.connections.get(websocket)
+        if conn is None:
+            return
+        channel = self.channel(conn.role, conn.consultation_id)
+        events: List[dict] = []
+        position = None
+        try:
+            # Читать стрим можно только после SUBSCRIBE, иначе событие между
+            # XRANGE и подпиской потеряется
+            ready = self._ready.get(channel) or asyncio.Event()
+            await asyncio.wait_for(ready.wait(), WS_REPLAY_SUBSCRIBE_TIMEOUT)
+            r = await get_redis_client()
+            stream = stream_key(channel)
+            latest = await r.xrevrange(stream, count=1)
+            position = latest[0][0] if latest else None
+            complete = not last_event_id
+            if last_event_id:
+                last = stream_id(last_event_id)
+                oldest = await r.xrange(stream, count=1)
+                # Ничего не обрезано, если самая старая запись не новее last_event_id
+                complete = bool(oldest) and stream_id(oldest[0][0]) <= last
+                if complete and position and stream_id(position) > last:
+                    entries = await r.xrange(
+                        stream, min=f"({last_event_id}", count=WS_REPLAY_LIMIT + 1
+                    )
+                    complete = len(entries) <= WS_REPLAY_LIMIT
+                    if complete:
+                        for entry_id, fields in entries:
+                            message = client_message(channel, json.loads(fields["event"]))
+                            if message is not None:
+                                events.append({**message, "event_id": entry_id})
+                        if entries:
+                            position = entries[-1][0]
+        except ValueError:
+            complete = False
+        except asyncio.TimeoutError:
+            logger.warning(f"WebSocket replay: {channel} not subscribed in time, resetting")
+            complete = False
+        except Exception as e:
+            logger.warning(f"WebSocket replay failed for {channel}: {e}")
+            complete = False
+
+        if complete:
+            WS_REPLAYS.labels(outcome="complete" if last_event_id else "fresh").inc()
+            WS_REPLAYED_EVENTS.inc(len(events))
+            status = {"type": "replay_complete", "event_id": position, "replayed": len(events)}
+        else:
+            WS_REPLAYS.labels(outcome="reset").inc()
+            events = []
+            status = {"type": "replay_reset", "event_id": position}
+        texts = [json.dumps(message, default=str) for message in events]
+        texts.append(json.dumps(status))
+
+        # Живые события, пришедшие за время replay: уже отправленные пропускаем
+        buffered, conn.replay_buffer = conn.replay_buffer or [], None
+        after = stream_id(position) if position else None
+        for event_id, text in buffered:
+            if not (event_id and after is not None and stream_id(event_id) <= after):
+                texts.append(text)
+        for text in texts:
+            if not conn.offer(text):
+                break
+
+    async def _sync_subscriptions(self, pubsub):
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            added = self.wanted - self.subscribed
+            removed = self.subscribed - self.wanted
+            if added:
+                await pubsub.subscribe(*added)
+                self.subscribed |= added
+                for channel in added:
+                    self._ready.setdefault(channel, asyncio.Event()).set()
+            if removed:
+                await pubsub.unsubscribe(*removed)
+                self.subscribed -= removed
+                for channel in removed:
+                    if channel in self.wanted:
+                        # Снова нужен, пока шёл UNSUBSCRIBE — подпишемся на следующем шаге
+                        self._ready[channel].clear()
+                    else:
+                        self._ready.pop(channel, None)
+            WS_PUBSUB_SUBSCRIPTIONS.set(len(self.subscribed))
+            if self.subscribed:
+                self._active.set()
+            else:
+                self._active.clear()
+
+    async def _read_messages(self, pubsub):
+        while True:
+            if not self.subscribed:
+                # До первого SUBSCRIBE у pubsub нет соединения для чтения
+                await self._active.wait()
+                continue
+            msg = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=WS_PUBSUB_POLL_TIMEOUT
+            )
+            if msg and msg["type"] == "message":
+                try:
+                    await self.handle(msg["channel"], msg["data"])
+                except Exception as e:
+                    logger.error(
+                        f"❌ Redis WS message processing error: {e}", exc_info=True
+                    )
+
+    async def run(self):
+        """Background task: подписки по реестру + чтение событий из Redis."""
+        while True:
+            try:
+                r = await get_redis_client()
+                pubsub = r.pubsub()
+                # Новое соединение — подписываемся на все нужные каналы заново
+                self.subscribed = set()
+                for ready in self._ready.values():
+                    ready.clear()
+                self._active.clear()
+                self._changed.set()
+                tasks = [
+                    asyncio.create_task(self._sync_subscriptions(pubsub)),
+                    asyncio.create_task(self._read_messages(pubsub)),
+                ]
+                try:
+                    done, _ = await asyncio.wait(
+                        tasks, return_when=asyncio.FIRST_EXCEPTION
+                    )
+                    for task in done:
+                        task.result()
+                finally:
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    await pubsub.aclose()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(
+                    f"Redis WS listener error: {e}, restarting in 5s", exc_info=True
+                )
+                await asyncio.sleep(5)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+            logger.info("Redis WS listener task started")
+
+    def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            logger.info("Redis WS listener task stopped")
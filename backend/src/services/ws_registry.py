@@ -0,0 +1,223 @@
+"""Реестр WebSocket-соединений дашборда фармацевта и чата пользователя.
+
+Соединения разложены по индексам ролей:
+
+- фармацевты (``/ws/pharmacist``) — события по всем консультациям;
+- пользователи (``/ws/chat/{consultation_id}``) — consultation_id → сокеты.
+
+Рассылка не ждёт клиентов: сообщение сериализуется один раз и кладётся в
+ограниченную очередь каждого адресата (WS_SEND_QUEUE_SIZE), а отправляет
+его writer-задача соединения. Медленный клиент не тормозит остальных: при
+переполненной очереди или отправке дольше WS_SEND_TIMEOUT секунд он
+отключается (код 1013 — клиент переподключается сам).
+
+О первом и последнем сокете фармацевтов и каждой консультации реестр
+сообщает шине событий (services.ws_pubsub), чтобы worker был подписан только
+на нужные каналы Redis. Сокет, подключённый с replay=True, до конца replay
+копит живые события в буфере: после пропущенных событий из стрима ему
+досылаются только те, что новее прочитанной позиции.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import WebSocket
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+# 1013 Try Again Later: сервер перегружен, клиенту стоит переподключиться
+WS_SLOW_CONSUMER_CLOSE_CODE = 1013
+
+PHARMACIST = "pharmacist"
+USER = "user"
+
+WS_CONNECTIONS = Gauge(
+    "ws_connections", "Open dashboard/chat WebSocket connections", ["role"]
+)
+WS_EVICTIONS = Counter(
+    "ws_evictions_total",
+    "WebSocket connections dropped by the server",
+    ["reason"],
+)
+
+
+class ClientConnection:
+    """Сокет с собственной очередью исходящих сообщений и writer-задачей."""
+
+    def __init__(
+        self,
+        registry,
+        websocket: WebSocket,
+        role: str,
+        consultation_id: Optional[str] = None,
+        queue_size: int = WS_SEND_QUEUE_SIZE,
+    ):
+        self.registry = registry
+        self.websocket = websocket
+        self.role = role
+        self.consultation_id = consultation_id
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.closed = False
+        # (event_id, text) живых событий, пришедших во время replay
+        self.replay_buffer: Optional[List[Tuple[Optional[str], str]]] = None
+        self.writer = asyncio.create_task(self._write())
+
+    def offer(self, text: str, event_id: Optional[str] = None) -> bool:
+        """Кладёт сообщение в очередь; переполнена — клиент отключается."""
+        if self.closed:
+            return False
+        if self.replay_buffer is not None:
+            if len(self.replay_buffer) >= self.queue.maxsize:
+                self.registry.evict(self, "queue_full")
+                return False
+            self.replay_buffer.append((event_id, text))
+            return True
+        try:
+            self.queue.put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            self.registry.evict(self, "queue_full")
+            return False
+
+    async def _write(self):
+        while True:
+            text = await self.queue.get()
+            try:
+                await asyncio.wait_for(self.websocket.send_text(text), WS_SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.registry.evict(self, "send_timeout")
+                return
+            except Exception as e:
+                logger.debug(f"WebSocket send failed, dropping connection: {e}")
+                self.registry.evict(self, "send_failed")
+                return
+
+
+class WebSocketConnectionManager:
+    """Manage WebSocket connections for pharmacist dashboard and user chat"""
+
+    def __init__(self, queue_size: int = WS_SEND_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.connections: Dict[WebSocket, ClientConnection] = {}
+        self.pharmacist_connections: Dict[WebSocket, ClientConnection] = {}
+        # consultation_id -> сокеты пользователя в этой консультации
+        self.consultation_connections: Dict[str, Dict[WebSocket, ClientConnection]] = {}
+        self._close_tasks: set = set()
+        # services.ws_pubsub.WebSocketEventBus: watch/unwatch каналов Redis
+        self.bus = None
+
+    @property
+    def active_connections(self):
+        return self.connections.keys()
+
+    def _register(
+        self,
+        websocket: WebSocket,
+        role: str,
+        consultation_id: Optional[str] = None,
+        replay: bool = False,
+    ) -> ClientConnection:
+        conn = ClientConnection(self, websocket, role, consultation_id, self.queue_size)
+        if replay:
+            conn.replay_buffer = []
+        self.connections[websocket] = conn
+        if role == PHARMACIST:
+            index = self.pharmacist_connections
+        else:
+            index = self.consultation_connections.setdefault(consultation_id, {})
+        if not index and self.bus is not None:
+            self.bus.watch(role, consultation_id)
+        index[websocket] = conn
+        WS_CONNECTIONS.labels(role=role).inc()
+        return conn
+
+    def _unregister(self, conn: ClientConnection) -> bool:
+        if self.connections.pop(conn.websocket, None) is None:
+            return False
+        conn.closed = True
+        if conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
+        if conn.role == PHARMACIST:
+            index = self.pharmacist_connections
+        else:
+            index = self.consultation_connections.get(conn.consultation_id, {})
+        index.pop(conn.websocket, None)
+        if not index:
+            if conn.role != PHARMACIST:
+                self.consultation_connections.pop(conn.consultation_id, None)
+            if self.bus is not None:
+                self.bus.unwatch(conn.role, conn.consultation_id)
+        WS_CONNECTIONS.labels(role=conn.role).dec()
+        return True
+
+    async def connect(self, websocket: WebSocket, replay: bool = False):
+        await websocket.accept()
+        self._register(websocket, PHARMACIST, replay=replay)
+
+    async def connect_user(self, websocket: WebSocket, question_id: str, replay: bool = False):
+        """Connect a user WebSocket for a specific consultation"""
+        await websocket.accept()
+        self._register(websocket, USER, question_id, replay)
+
+    def disconnect(self, websocket: WebSocket):
+        conn = self.connections.get(websocket)
+        if conn is not None:
+            self._unregister(conn)
+
+    def disconnect_user(self, websocket: WebSocket, question_id: str = None):
+        self.disconnect(websocket)
+
+    def evict(self, conn: ClientConnection, reason: str):
+        """Отключает медленного или отвалившегося клиента."""
+        if not self._unregister(conn):
+            return
+        WS_EVICTIONS.labels(reason=reason).inc()
+        logger.warning(f"Evicting {conn.role} WebSocket ({reason})")
+        task = asyncio.create_task(self._close(conn.websocket))
+        self._close_tasks.add(task)
+        task.add_done_callback(self._close_tasks.discard)
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(
+                websocket.close(code=WS_SLOW_CONSUMER_CLOSE_CODE), WS_SEND_TIMEOUT
+            )
+        except Exception:
+            pass
+
+    def _fan_out(self, connections, message: dict, event_id: Optional[str] = None) -> int:
+        if not connections:
+            return 0
+        text = json.dumps(message, default=str)
+        return sum(conn.offer(text, event_id) for conn in list(connections))
+
+    async def broadcast(self, message: dict, event_id: Optional[str] = None) -> int:
+        """Send message to all connected pharmacists (not users)"""
+        return self._fan_out(self.pharmacist_connections.values(), message, event_id)
+
+    async def broadcast_to_consultation(
+        self, question_id: str, message: dict, event_id: Optional[str] = None
+    ) -> int:
+        """Send message to all WebSockets subscribed to a specific consultation"""
+        sockets = self.consultation_connections.get(question_id)
+        return self._fan_out(sockets.values() if sockets else (), message, event_id)
+
+    async def broadcast_new_question(self, question_data: dict) -> int:
+        """Broadcast new question notification to all connected pharmacists"""
+        return await self.broadcast({"type": "new_question", "data": question_data})
+
+    async def broadcast_message_update(self, question_id: str, message_data: dict) -> int:
+        """Broadcast a new message in consultation to pharmacists and subscribed users"""
+        message = {
+            "type": "message_update",
+            "question_id": question_id,
+            "data": message_data,
+        }
+        return await self.broadcast(message) + await self.broadcast_to_consultation(
+            question_id, message
+        )
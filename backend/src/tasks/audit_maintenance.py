@@ -0,0 +1,144 @@
+# audit_maintenance.py
+"""
+Обслуживание партиций audit_logs и суточной статистики (Celery beat, раз в сутки).
+
+- партиции audit_logs_YYYY_MM создаются на AUDIT_PARTITIONS_AHEAD месяцев
+  вперёд SQL-функцией ensure_audit_log_partition (db/audit_partitions.py,
+  пересоздаётся при каждом запуске);
+- хранение — AUDIT_RETENTION_MONTHS месяцев (по требованиям ОАЦ не меньше
+  года): старые партиции удаляются DROP TABLE целиком, без DELETE;
+- audit_log_daily_stats пересчитывается за последние
+  AUDIT_ROLLUP_LOOKBACK_DAYS закрытых суток. События, переигранные из
+  AUDIT_SPILL_DIR с опозданием, попадают в статистику при следующем запуске.
+"""
+import logging
+import os
+import re
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, List, Optional
+
+from db.audit_partitions import AUDIT_PARTITIONS_AHEAD, ENSURE_PARTITION_FUNCTION_SQL
+from tasks.celery_app import celery
+from tasks.worker_runtime import run_task, task_resources
+from utils.time_utils import get_utc_now
+
+logger = logging.getLogger(__name__)
+
+AUDIT_RETENTION_MONTHS = int(os.getenv("AUDIT_RETENTION_MONTHS", "13"))
+AUDIT_ROLLUP_LOOKBACK_DAYS = int(os.getenv("AUDIT_ROLLUP_LOOKBACK_DAYS", "3"))
+
+PARTITION_NAME = re.compile(r"^audit_logs_(\d{4})_(\d{2})$")
+
+LIST_PARTITIONS_SQL = """
+    SELECT child.relname
+    FROM pg_inherits
+    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = 'audit_logs'
+"""
+
+ROLLUP_SQL = """
+    INSERT INTO audit_log_daily_stats (day, action, resource_type, user_id, user_type, events)
+    SELECT created_at::date, action, resource_type, user_id, user_type, count(*)
+    FROM audit_logs
+    WHERE created_at >= $1 AND created_at < $2
+    GROUP BY 1, 2, 3, 4, 5
+"""
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = PARTITION_NAME.match(name)
+    if not match:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def retention_cutoff(today: date, retention_months: int = AUDIT_RETENTION_MONTHS) -> date:
+    """Первый день самого старого хранимого месяца (текущий месяц входит в срок)."""
+    return add_months(today.replace(day=1), 1 - retention_months)
+
+
+def expired_partitions(names: Iterable[str], cutoff: date) -> List[str]:
+    """Месячные партиции целиком старше cutoff; default-партиция не трогается."""
+    return sorted(
+        name
+        for name in names
+        if (month := partition_month(name)) is not None and month < cutoff
+    )
+
+
+async def ensure_partitions(conn, today: date):
+    # Функция из приложения заменяет копию, созданную миграцией
+    await conn.execute(ENSURE_PARTITION_FUNCTION_SQL)
+    month = today.replace(day=1)
+    for i in range(AUDIT_PARTITIONS_AHEAD + 1):
+        await conn.execute("SELECT ensure_audit_log_partition($1)", add_months(month, i))
+
+
+async def drop_expired_partitions(conn, cutoff: date) -> List[str]:
+    names = [row["relname"] for row in await conn.fetch(LIST_PARTITIONS_SQL)]
+    dropped = expired_partitions(names, cutoff)
+    async with conn.transaction():
+        for name in dropped:
+            await conn.execute(f'DROP TABLE "{name}"')
+        cutoff_ts = datetime.combine(cutoff, time.min)
+        await conn.execute("DELETE FROM audit_logs_default WHERE created_at < $1", cutoff_ts)
+        await conn.execute("DELETE FROM audit_log_daily_stats WHERE day < $1", cutoff)
+    return dropped
+
+
+async def rollup_days(conn, first_day: date, last_day: date) -> int:
+    """Пересчитывает audit_log_daily_stats за дни [first_day, last_day]."""
+    start = datetime.combine(first_day, time.min)
+    end = datetime.combine(last_day + timedelta(days=1), time.min)
+    async with conn.transaction():
+        await conn.execute(
+            "DELETE FROM audit_log_daily_stats WHERE day >= $1 AND day <= $2",
+            first_day,
+            last_day,
+        )
+        status = await conn.execute(ROLLUP_SQL, start, end)
+    return int(status.split()[-1])
+
+
+async def maintain_audit_logs(pool, today: Optional[date] = None) -> dict:
+    today = today or get_utc_now().date()
+    cutoff = retention_cutoff(today)
+    yesterday = today - timedelta(days=1)
+    async with pool.acquire() as conn:
+        await ensure_partitions(conn, today)
+        last_rolled = await conn.fetchval("SELECT max(day) FROM audit_log_daily_stats")
+        first_day = yesterday - timedelta(days=AUDIT_ROLLUP_LOOKBACK_DAYS - 1)
+        if last_rolled is not None and last_rolled < first_day:
+            # Beat пропускал запуски — досчитываем все пропущенные дни
+            first_day = last_rolled + timedelta(days=1)
+        rollup_rows = await rollup_days(conn, max(first_day, cutoff), yesterday)
+        dropped = await drop_expired_partitions(conn, cutoff)
+    return {
+        "status": "success",
+        "retention_cutoff": cutoff.isoformat(),
+        "dropped_partitions": dropped,
+        "rollup_rows": rollup_rows,
+    }
+
+
+@celery.task(bind=True, max_retries=3, soft_time_limit=1800)
+def maintain_audit_logs_task(self):
+    """Периодическая задача: партиции, хранение и суточная статистика audit_logs"""
+    try:
+        result = run_task(_maintain_audit_logs_async())
+        logger.info(f"Audit logs maintenance: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"Error in maintain_audit_logs_task: {str(e)}")
+        raise self.retry(exc=e, countdown=600)
+
+
+async def _maintain_audit_logs_async():
+    async with task_resources() as (_, pool):
+        return await maintain_audit_logs(pool)
@@ -44,11 +44,26 @@ celery.conf.update(
             "schedule": 28800,  # 8 часов = 3 раза в день
             "options": {"expires": 3600},
         },
+        "maintain-audit-logs": {
+            "task": "tasks.audit_maintenance.maintain_audit_logs_task",
+            "schedule": 86400,  # раз в сутки: партиции, хранение, статистика
+            "options": {"expires": 3600},
+        },
+        "sync-orders-every-10-min": {
+            "task": "tasks.tasks_increment.sync_pharmacy_orders_task",
+            "schedule": 600.0,
+        },
+        "retry-failed-orders-every-5-min": {
+            "task": "tasks.tasks_increment.retry_failed_orders_task",
+            "schedule": 300.0,
+        },
     },
 )
 
 # КРИТИЧЕСКИ ВАЖНО: Импортируем все задачи для регистрации
 from tasks import tasks_increment
+from tasks import import_preview
+from tasks import audit_maintenance
 from tasks import celery_worker_init
 
 # Регистрируем задачи
@@ -1,27 +1,27 @@
 # celery_worker_init.py
-import asyncio
 import logging
-from celery.signals import worker_process_init, worker_process_shutdown
+import os
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown
 
 logger = logging.getLogger(__name__)
 
+@worker_init.connect
+def on_worker_main_init(**kwargs):
+    """Главный процесс worker'а: HTTP-экспорт метрик дочерних процессов"""
+    from tasks.import_metrics import start_metrics_exporter
+    try:
+        start_metrics_exporter()
+    except Exception as e:
+        logger.error(f"Error starting worker metrics exporter: {e}")
+
 @worker_process_init.connect
 def on_worker_init(**kwargs):
-    """Инициализация worker процесса - создаем новый event loop"""
-    logger.info("Worker process initializing - creating new event loop")
-
-    # Создаем новый event loop для этого процесса
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-
-    # Сбрасываем engine после fork
-    from db.database import reset_engine
-    reset_engine()
+    """Инициализация worker процесса - event loop, engine, пул asyncpg и Redis"""
+    logger.info("Worker process initializing - starting worker runtime")
 
-    # Инициализируем модели в этом процессе
-    from tasks.tasks_increment import initialize_task_models
+    from tasks.worker_runtime import worker_runtime
     try:
-        loop.run_until_complete(initialize_task_models())
+        worker_runtime.start()
         logger.info("Worker initialization completed successfully")
     except Exception as e:
         logger.error(f"Error in worker init: {e}")
@@ -32,11 +32,10 @@ def on_worker_shutdown(**kwargs):
     """Очистка при завершении worker"""
     logger.info("Worker process shutting down - cleaning up")
 
-    from db.database import dispose_engine
+    from tasks.import_metrics import mark_worker_process_dead
+    from tasks.worker_runtime import worker_runtime
     try:
-        loop = asyncio.get_event_loop()
-        if not loop.is_closed():
-            loop.run_until_complete(dispose_engine())
-            loop.close()
+        worker_runtime.stop()
     except Exception as e:
         logger.error(f"Error in worker shutdown: {e}")
+    mark_worker_process_dead(os.getpid())
@@ -0,0 +1,100 @@
+# import_metrics.py
+"""
+Prometheus-метрики импорта CSV и их экспорт из Celery worker'а.
+
+Этапы импорта (label ``stage``):
+
+- decode        — чтение файла, декодирование и разбиение на строки;
+- parse         — нормализация колонок, разбор значений и хэши;
+- load_existing — чтение хэшей текущих товаров аптеки;
+- apply         — diff и запись изменений (COPY + UPDATE/INSERT);
+- lock_wait     — ожидание advisory lock аптеки;
+- load_diff     — распаковка diff из dry-run (apply без разбора);
+- total         — весь импорт.
+
+Worker работает в prefork-режиме, поэтому метрики пишутся в multiprocess
+mmap-файлы (``PROMETHEUS_MULTIPROC_DIR``), а главный процесс worker'а
+отдаёт их сумму на ``CELERY_METRICS_PORT`` (job ``celery_worker`` в
+config/prometheus.yml). Без PROMETHEUS_MULTIPROC_DIR метрики остаются в
+обычном реестре процесса.
+"""
+import logging
+import os
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, multiprocess
+from prometheus_client import start_http_server
+
+logger = logging.getLogger(__name__)
+
+CELERY_METRICS_PORT = int(os.getenv("CELERY_METRICS_PORT", "9808"))
+
+CSV_IMPORT_STAGE_SECONDS = Histogram(
+    "csv_import_stage_duration_seconds",
+    "CSV import stage duration",
+    ["stage"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+CSV_IMPORT_STAGE_ROWS = Histogram(
+    "csv_import_stage_rows",
+    "Rows handled by a CSV import stage",
+    ["stage"],
+    buckets=(100, 1_000, 5_000, 10_000, 25_000, 50_000, 100_000, 250_000, 500_000),
+)
+CSV_IMPORT_FILE_BYTES = Histogram(
+    "csv_import_file_bytes",
+    "Size of imported CSV files",
+    buckets=tuple(kb * 1024 for kb in (64, 256, 1024, 4096, 10240, 25600, 51200)),
+)
+CSV_IMPORTS = Counter("csv_imports_total", "CSV imports by outcome", ["status"])
+CSV_IMPORT_PRODUCTS = Counter(
+    "csv_import_products_total",
+    "Products added, updated, removed or left unchanged by CSV imports",
+    ["change"],
+)
+CSV_IMPORT_CANCELLED_ORDERS = Counter(
+    "csv_import_cancelled_orders_total",
+    "Active orders cancelled because their product left the pharmacy stock",
+)
+CSV_IMPORT_PARSE_ERRORS = Counter(
+    "csv_import_parse_errors_total", "CSV rows rejected while parsing"
+)
+
+_PRODUCT_CHANGES = ("added", "updated", "removed", "unchanged")
+
+
+def observe_csv_import(result: dict):
+    """Записывает метрики успешного импорта (результат import_pharmacy_csv)."""
+    CSV_IMPORTS.labels(status="success").inc()
+    for stage, seconds in result.get("timings", {}).items():
+        CSV_IMPORT_STAGE_SECONDS.labels(stage=stage).observe(seconds)
+    for stage, rows in result.get("rows", {}).items():
+        CSV_IMPORT_STAGE_ROWS.labels(stage=stage).observe(rows)
+    if "file_bytes" in result:
+        CSV_IMPORT_FILE_BYTES.observe(result["file_bytes"])
+
+    stats = result.get("stats", {})
+    for change in _PRODUCT_CHANGES:
+        CSV_IMPORT_PRODUCTS.labels(change=change).inc(stats.get(change, 0))
+    CSV_IMPORT_CANCELLED_ORDERS.inc(stats.get("cancelled_orders", 0))
+    CSV_IMPORT_PARSE_ERRORS.inc(len(result.get("processing_errors", [])))
+
+
+def observe_csv_import_failure():
+    CSV_IMPORTS.labels(status="error").inc()
+
+
+def start_metrics_exporter():
+    """HTTP-экспорт метрик всех процессов worker'а (вызывать в главном процессе)."""
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        logger.info("PROMETHEUS_MULTIPROC_DIR is not set, worker metrics are not exported")
+        return
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(CELERY_METRICS_PORT, registry=registry)
+    logger.info(f"Worker metrics exported on :{CELERY_METRICS_PORT}/metrics")
+
+
+def mark_worker_process_dead(pid: int):
+    """Убирает live-gauge файлы завершившегося дочернего процесса."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
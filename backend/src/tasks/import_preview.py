@@ -0,0 +1,456 @@
+# import_preview.py
+"""
+Пробный импорт CSV аптеки (dry-run) и применение сохранённого diff.
+
+preview: файл разбирается и сравнивается с текущими товарами аптеки так же,
+как при импорте, но ничего не записывается. Вычисленный diff сохраняется в
+Redis (hash ``csv_import:preview:<сеть>:<номер>:<sha256 файла>``):
+
+- meta — JSON: сводка (сколько товаров добавится/обновится/снимется, сколько
+  заказов будет отменено), uuid аптеки, updated_at разбора и контрольная
+  сумма состояния товаров аптеки на момент сравнения;
+- diff — zlib-сжатый JSON по колонкам (имена полей не повторяются на
+  каждой строке, uuid новых товаров не хранятся).
+
+apply: под advisory lock аптеки контрольная сумма считается заново; если
+товары аптеки не менялись после preview, diff применяется как есть — без
+повторного разбора и чтения состояния. Иначе (или если diff истёк по TTL)
+файл импортируется обычным import_pharmacy_csv.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+import zlib
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone
+from itertools import repeat
+from typing import Dict, List, Optional, Tuple
+
+import asyncpg
+import redis.asyncio as aioredis
+
+from auth.session_manager import _build_redis_url
+from tasks.celery_app import celery
+from tasks.import_metrics import observe_csv_import, observe_csv_import_failure
+from tasks.tasks_increment import (
+    compare_products,
+    execute_incremental_changes_async,
+    get_existing_products_with_hashes,
+    get_or_create_pharmacy,
+    get_pharmacy,
+    import_pharmacy_csv,
+    initialize_task_models,
+    iter_csv_file_lines,
+    pharmacy_import_lock,
+    process_csv_data_with_hashes,
+)
+from tasks.worker_runtime import run_task, task_resources
+
+logger = logging.getLogger(__name__)
+
+CSV_PREVIEW_KEY_PREFIX = "csv_import:preview:"
+CSV_PREVIEW_TTL = int(os.getenv("CSV_PREVIEW_TTL", "3600"))
+# Быстрое сжатие: выигрыш уровней выше 1 — единицы процентов при кратно большем времени
+DIFF_COMPRESS_LEVEL = 1
+
+# Колонки товара в diff (pharmacy_id и updated_at общие — хранятся в meta)
+DIFF_PRODUCT_COLUMNS = [
+    "name",
+    "form",
+    "manufacturer",
+    "country",
+    "serial",
+    "price",
+    "quantity",
+    "total_price",
+    "expiry_date",
+    "category",
+    "import_date",
+    "internal_code",
+    "wholesale_price",
+    "retail_price",
+    "distributor",
+    "internal_id",
+    "content_hash",
+    "payload_hash",
+]
+_DIFF_DATE_COLUMNS = {"expiry_date", "import_date"}
+
+
+def preview_key(pharmacy_name: str, pharmacy_number: str, digest: str) -> str:
+    return f"{CSV_PREVIEW_KEY_PREFIX}{pharmacy_name.lower()}:{pharmacy_number}:{digest}"
+
+
+async def get_products_state(conn: asyncpg.Connection, pharmacy_uuid) -> str:
+    """Контрольная сумма товаров аптеки: количество + сумма hashtext строк.
+
+    Меняется при любом добавлении, обновлении или мягком удалении товара;
+    не зависит от порядка строк и считается без передачи их в Python.
+    """
+    if pharmacy_uuid is None:
+        return "0:0"
+    row = await conn.fetchrow(
+        """
+        SELECT
+            count(*) AS rows,
+            coalesce(sum(hashtext(
+                concat_ws('|', uuid, content_hash, payload_hash, is_removed)
+            )::bigint), 0) AS checksum
+        FROM products
+        WHERE pharmacy_id = $1
+        """,
+        pharmacy_uuid,
+    )
+    return f"{row['rows']}:{row['checksum']}"
+
+
+async def count_orders_to_cancel(
+    conn: asyncpg.Connection, to_remove: List[uuid.UUID]
+) -> int:
+    """Активные заказы на товары, которые импорт снимет с продажи."""
+    if not to_remove:
+        return 0
+    return await conn.fetchval(
+        """
+        SELECT count(*)
+        FROM booking_orders
+        WHERE product_id = ANY($1::uuid[])
+        AND status IN ('pending', 'confirmed')
+        """,
+        to_remove,
+    )
+
+
+def _product_columns(
+    products: List[dict], column_names: List[str] = DIFF_PRODUCT_COLUMNS
+) -> Dict[str, list]:
+    columns = {}
+    for column in column_names:
+        values = [product[column] for product in products]
+        if column in _DIFF_DATE_COLUMNS:
+            # Дат в файле немного — каждая форматируется один раз
+            formatted = {value: value.isoformat() for value in set(values) if value}
+            values = [formatted.get(value) for value in values]
+        columns[column] = values
+    return columns
+
+
+def _column_products(columns: Dict[str, list], common: dict) -> List[dict]:
+    values = dict(columns)
+    for column in _DIFF_DATE_COLUMNS & set(values):
+        parsed = {value: date.fromisoformat(value) for value in set(values[column]) if value}
+        values[column] = [parsed.get(value) for value in values[column]]
+    names = list(values) + list(common)
+    rows = zip(*values.values(), *(repeat(value) for value in common.values()))
+    return [dict(zip(names, row)) for row in rows]
+
+
+def encode_diff(
+    to_add: List[dict],
+    to_update: List[dict],
+    to_remove: List[uuid.UUID],
+    unchanged: List[dict] = (),
+) -> bytes:
+    """Сжатый diff импорта (результат compare_products)."""
+    payload = {
+        "add": _product_columns(to_add),
+        "update": {
+            **_product_columns(to_update),
+            "existing_uuid": [str(product["existing_uuid"]) for product in to_update],
+            "is_removed": [product["is_removed"] for product in to_update],
+        },
+        "remove": [str(product_uuid) for product_uuid in to_remove],
+        # Без изменений: только uuid и import_date для обновления дат
+        "unchanged": {
+            **_product_columns(unchanged, ["import_date"]),
+            "existing_uuid": [str(product["existing_uuid"]) for product in unchanged],
+        },
+    }
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return zlib.compress(data.encode("utf-8"), DIFF_COMPRESS_LEVEL)
+
+
+def decode_diff(
+    data: bytes, pharmacy_uuid: uuid.UUID, updated_at: datetime
+) -> Tuple[List[dict], List[dict], List[uuid.UUID], List[dict]]:
+    """(to_add, to_update, to_remove, unchanged) для execute_incremental_changes_async."""
+    payload = json.loads(zlib.decompress(data))
+    common = {"pharmacy_id": pharmacy_uuid, "updated_at": updated_at}
+
+    to_add = _column_products(payload["add"], common)
+    for product in to_add:
+        product["uuid"] = uuid.uuid4()
+
+    update_columns = payload["update"]
+    existing_uuids = update_columns.pop("existing_uuid")
+    is_removed = update_columns.pop("is_removed")
+    to_update = _column_products(update_columns, common)
+    for product, existing_uuid, removed in zip(to_update, existing_uuids, is_removed):
+        product["existing_uuid"] = uuid.UUID(existing_uuid)
+        product["is_removed"] = removed
+
+    to_remove = [uuid.UUID(product_uuid) for product_uuid in payload["remove"]]
+
+    unchanged_columns = payload["unchanged"]
+    unchanged_uuids = unchanged_columns.pop("existing_uuid")
+    unchanged = _column_products(unchanged_columns, common)
+    for product, existing_uuid in zip(unchanged, unchanged_uuids):
+        product["existing_uuid"] = uuid.UUID(existing_uuid)
+    return to_add, to_update, to_remove, unchanged
+
+
+@asynccontextmanager
+async def preview_storage():
+    """Клиент Redis без decode_responses — diff хранится в бинарном виде."""
+    client = aioredis.from_url(_build_redis_url())
+    try:
+        yield client
+    finally:
+        await client.aclose()
+
+
+async def preview_pharmacy_csv(
+    session_maker,
+    pool: asyncpg.Pool,
+    redis_client,
+    file_path: str,
+    pharmacy_name: str,
+    pharmacy_number: str,
+    digest: str,
+) -> Dict:
+    """Разбор и сравнение без записи; diff сохраняется для apply.
+
+    Повторный preview того же файла при неизменных товарах аптеки
+    возвращает сохранённую сводку без разбора.
+    """
+    timings = {}
+    started = time.perf_counter()
+    key = preview_key(pharmacy_name, pharmacy_number, digest)
+
+    pharmacy = await get_pharmacy(session_maker, pharmacy_name, pharmacy_number)
+    pharmacy_uuid = pharmacy.uuid if pharmacy else None
+
+    cached_meta = await redis_client.hget(key, "meta")
+    if cached_meta:
+        meta = json.loads(cached_meta)
+        async with pool.acquire() as conn:
+            state = await get_products_state(conn, pharmacy_uuid)
+        if state == meta["state"]:
+            timings["total"] = time.perf_counter() - started
+            return {
+                "status": "success",
+                "dry_run": True,
+                "cached": True,
+                "digest": digest,
+                "pharmacy_id": meta["pharmacy_id"],
+                "summary": meta["summary"],
+                "timings": {stage: round(seconds, 3) for stage, seconds in timings.items()},
+            }
+
+    csv_data, csv_hashes, processing_errors = await asyncio.to_thread(
+        process_csv_data_with_hashes, iter_csv_file_lines(file_path), pharmacy_uuid
+    )
+    timings["parse"] = time.perf_counter() - started
+
+    read_started = time.perf_counter()
+    async with pool.acquire() as conn:
+        # Состояние и его контрольная сумма — из одного снимка
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            state = await get_products_state(conn, pharmacy_uuid)
+            existing_hashes = (
+                await get_existing_products_with_hashes(conn, pharmacy_uuid)
+                if pharmacy_uuid
+                else {}
+            )
+        to_add, to_update, to_remove, unchanged = compare_products(
+            csv_hashes, existing_hashes, csv_data
+        )
+        cancelled_orders = await count_orders_to_cancel(conn, to_remove)
+    timings["read"] = time.perf_counter() - read_started
+
+    summary = {
+        "added": len(to_add),
+        "updated": len(to_update),
+        "removed": len(to_remove),
+        "unchanged": len(unchanged),
+        "cancelled_orders": cancelled_orders,
+        "processed_rows": len(csv_data),
+        "processing_errors": len(processing_errors),
+    }
+    updated_at = (
+        csv_data[0]["updated_at"]
+        if csv_data
+        else datetime.now(timezone.utc).replace(tzinfo=None)
+    )
+    meta = {
+        "state": state,
+        "pharmacy_id": str(pharmacy_uuid) if pharmacy_uuid else None,
+        "updated_at": updated_at.isoformat(),
+        "summary": summary,
+    }
+    diff = await asyncio.to_thread(encode_diff, to_add, to_update, to_remove, unchanged)
+
+    pipe = redis_client.pipeline()
+    pipe.delete(key)
+    pipe.hset(key, mapping={"meta": json.dumps(meta), "diff": diff})
+    pipe.expire(key, CSV_PREVIEW_TTL)
+    await pipe.execute()
+
+    timings["total"] = time.perf_counter() - started
+    logger.info(
+        f"Import preview {pharmacy_name}/{pharmacy_number}: {summary}, "
+        f"diff {len(diff)} bytes"
+    )
+    return {
+        "status": "success",
+        "dry_run": True,
+        "cached": False,
+        "digest": digest,
+        "pharmacy_id": meta["pharmacy_id"],
+        "summary": summary,
+        "processing_errors": processing_errors,
+        "diff_bytes": len(diff),
+        "timings": {stage: round(seconds, 3) for stage, seconds in timings.items()},
+    }
+
+
+async def apply_pharmacy_csv_preview(
+    session_maker,
+    pool: asyncpg.Pool,
+    redis_client,
+    file_path: str,
+    pharmacy_name: str,
+    pharmacy_number: str,
+    digest: str,
+    district: str | None = None,
+) -> Dict:
+    """Применяет diff из preview; если он истёк или устарел — обычный импорт."""
+    timings = {}
+    started = time.perf_counter()
+    key = preview_key(pharmacy_name, pharmacy_number, digest)
+
+    meta_raw, diff = await redis_client.hmget(key, ["meta", "diff"])
+    pharmacy, pharmacy_created = await get_or_create_pharmacy(
+        session_maker, pharmacy_name, pharmacy_number, district
+    )
+
+    stats = None
+    meta = json.loads(meta_raw) if meta_raw else None
+    # diff, снятый до создания аптеки, проверяется по контрольной сумме (0:0)
+    if meta and diff and meta["pharmacy_id"] in (str(pharmacy.uuid), None):
+        to_add, to_update, to_remove, unchanged = await asyncio.to_thread(
+            decode_diff,
+            diff,
+            pharmacy.uuid,
+            datetime.fromisoformat(meta["updated_at"]),
+        )
+        timings["load_diff"] = time.perf_counter() - started
+
+        async with pool.acquire() as conn:
+            async with pharmacy_import_lock(conn, pharmacy.uuid) as lock_wait:
+                timings["lock_wait"] = lock_wait
+                apply_started = time.perf_counter()
+                if await get_products_state(conn, pharmacy.uuid) == meta["state"]:
+                    stats = await execute_incremental_changes_async(
+                        conn, to_add, to_update, to_remove, pharmacy.uuid, unchanged
+                    )
+                    stats["unchanged"] = len(unchanged)
+                timings["apply"] = time.perf_counter() - apply_started
+
+    # После записи (или при устаревшем состоянии) diff больше не нужен
+    await redis_client.delete(key)
+
+    if stats is None:
+        logger.info(
+            f"Import preview {pharmacy_name}/{pharmacy_number} {digest[:12]} "
+            f"is {'stale' if meta else 'missing'}, importing the file"
+        )
+        result = await import_pharmacy_csv(
+            session_maker, pool, file_path, pharmacy_name, pharmacy_number, district
+        )
+        result["preview"] = "stale" if meta else "missing"
+        return result
+
+    timings["total"] = time.perf_counter() - started
+    result = {
+        "status": "success",
+        "preview": "applied",
+        "digest": digest,
+        "pharmacy_id": str(pharmacy.uuid),
+        "stats": stats,
+        "processed_rows": meta["summary"]["processed_rows"],
+        "pharmacy_created": pharmacy_created,
+        "rows": {"apply": len(to_add) + len(to_update) + len(to_remove)},
+        "timings": {stage: round(seconds, 3) for stage, seconds in timings.items()},
+    }
+    observe_csv_import(result)
+    return result
+
+
+@celery.task(bind=True, soft_time_limit=3600)
+def preview_csv_import(
+    self, file_path: str, pharmacy_name: str, pharmacy_number: str, digest: str
+):
+    """Dry-run импорта CSV (см. preview_pharmacy_csv)."""
+    return run_task(
+        preview_csv_import_async(file_path, pharmacy_name, pharmacy_number, digest)
+    )
+
+
+async def preview_csv_import_async(
+    file_path: str, pharmacy_name: str, pharmacy_number: str, digest: str
+):
+    async with task_resources() as (session_maker, pool), preview_storage() as client:
+        await initialize_task_models()
+        return await preview_pharmacy_csv(
+            session_maker, pool, client, file_path, pharmacy_name, pharmacy_number, digest
+        )
+
+
+@celery.task(bind=True, max_retries=3, soft_time_limit=3600)
+def apply_csv_import_preview(
+    self,
+    file_path: str,
+    pharmacy_name: str,
+    pharmacy_number: str,
+    digest: str,
+    district: Optional[str] = None,
+):
+    """Применение diff из preview (см. apply_pharmacy_csv_preview)."""
+    try:
+        return run_task(
+            apply_csv_import_preview_async(
+                file_path, pharmacy_name, pharmacy_number, digest, district
+            )
+        )
+    except Exception as e:
+        logger.error(f"Error in apply_csv_import_preview: {str(e)}")
+        raise self.retry(exc=e, countdown=60)
+
+
+async def apply_csv_import_preview_async(
+    file_path: str,
+    pharmacy_name: str,
+    pharmacy_number: str,
+    digest: str,
+    district: Optional[str] = None,
+):
+    try:
+        async with task_resources() as (session_maker, pool), preview_storage() as client:
+            await initialize_task_models()
+            return await apply_pharmacy_csv_preview(
+                session_maker,
+                pool,
+                client,
+                file_path,
+                pharmacy_name,
+                pharmacy_number,
+                digest,
+                district,
+            )
+    except Exception:
+        observe_csv_import_failure()
+        raise
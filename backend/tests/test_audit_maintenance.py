@@ -0,0 +1,167 @@
+"""
+Tests for audit_logs partition maintenance and the rollup-backed stats
+endpoint.
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+from contextlib import asynccontextmanager
+from datetime import date
+from pathlib import Path
+from types import SimpleNamespace
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from sqlalchemy import create_mock_engine
+from sqlalchemy.dialects import postgresql
+
+from db.audit_partitions import ENSURE_PARTITION_FUNCTION_SQL
+from db.models import AuditLog, Base
+
+from routers.admin import audit_stats_query, get_audit_stats
+from tasks.audit_maintenance import (
+    expired_partitions,
+    maintain_audit_logs,
+    retention_cutoff,
+)
+
+
+class FakeConn:
+    def __init__(self, partitions, last_rolled):
+        self.partitions = partitions
+        self.last_rolled = last_rolled
+        self.executed = []
+
+    async def execute(self, sql, *args):
+        self.executed.append((" ".join(sql.split()), args))
+        return "INSERT 0 12"
+
+    async def fetch(self, sql):
+        return [{"relname": name} for name in self.partitions]
+
+    async def fetchval(self, sql):
+        return self.last_rolled
+
+    def transaction(self):
+        @asynccontextmanager
+        async def transaction():
+            yield
+
+        return transaction()
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+
+def rollup_range(conn):
+    return next(
+        args
+        for sql, args in conn.executed
+        if sql.startswith("DELETE FROM audit_log_daily_stats WHERE day >=")
+    )
+
+
+def test_retention_keeps_whole_months_and_the_default_partition():
+    cutoff = retention_cutoff(date(2026, 10, 17), retention_months=13)
+    names = [
+        "audit_logs_2025_08", "audit_logs_2025_09", "audit_logs_2025_10",
+        "audit_logs_2026_10", "audit_logs_default",
+    ]  # fmt: skip
+
+    assert cutoff == date(2025, 10, 1)
+    assert expired_partitions(names, cutoff) == ["audit_logs_2025_08", "audit_logs_2025_09"]
+
+
+def test_maintenance_creates_partitions_rolls_up_and_drops_old_months():
+    conn = FakeConn(["audit_logs_2025_09", "audit_logs_2026_10"], date(2026, 10, 14))
+
+    result = asyncio.run(maintain_audit_logs(FakePool(conn), today=date(2026, 10, 17)))
+
+    assert conn.executed[0] == (" ".join(ENSURE_PARTITION_FUNCTION_SQL.split()), ())
+    ensured = [
+        args[0]
+        for sql, args in conn.executed
+        if sql.startswith("SELECT ensure_audit_log_partition")
+    ]
+    assert ensured == [date(2026, 10, 1), date(2026, 11, 1), date(2026, 12, 1)]
+    rollup_delete = rollup_range(conn)
+    assert rollup_delete == (date(2026, 10, 14), date(2026, 10, 16))
+    assert ('DROP TABLE "audit_logs_2025_09"', ()) in conn.executed
+    assert result["dropped_partitions"] == ["audit_logs_2025_09"]
+    assert result["rollup_rows"] == 12
+
+
+def test_maintenance_catches_up_days_missed_by_beat():
+    conn = FakeConn([], date(2026, 10, 1))
+
+    asyncio.run(maintain_audit_logs(FakePool(conn), today=date(2026, 10, 17)))
+
+    rollup_delete = rollup_range(conn)
+    assert rollup_delete == (date(2026, 10, 2), date(2026, 10, 16))
+
+
+def test_create_all_fallback_adds_default_partition_and_current_months():
+    statements = []
+    engine = create_mock_engine(
+        "postgresql+asyncpg://",
+        lambda sql, *args, **kwargs: statements.append(
+            " ".join(str(sql.compile(dialect=engine.dialect)).split())
+        ),
+    )
+
+    Base.metadata.create_all(engine, tables=[AuditLog.__table__], checkfirst=False)
+
+    assert statements[0].startswith("CREATE TABLE audit_logs ")
+    assert "PARTITION BY RANGE (created_at)" in statements[0]
+    assert "CREATE TABLE IF NOT EXISTS audit_logs_default PARTITION OF audit_logs DEFAULT" in statements
+    function = next(s for s in statements if "CREATE OR REPLACE FUNCTION" in s)
+    assert function == " ".join(ENSURE_PARTITION_FUNCTION_SQL.split())
+    assert "'CREATE TABLE %I (LIKE audit_logs" in function
+    assert any(s.startswith("SELECT ensure_audit_log_partition(") for s in statements)
+
+
+def test_beat_schedule_keeps_maintenance_next_to_sync_tasks():
+    from tasks.celery_app import celery
+
+    assert {
+        "maintain-audit-logs",
+        "sync-tabletka-pharmacies",
+        "sync-orders-every-10-min",
+        "retry-failed-orders-every-5-min",
+    } <= set(celery.conf.beat_schedule)
+
+
+def test_stats_combine_rollup_and_live_rows():
+    query = audit_stats_query(date(2026, 1, 1), date(2026, 10, 17))
+    sql = str(query.compile(dialect=postgresql.dialect()))
+    assert "FROM audit_log_daily_stats" in sql and "UNION ALL" in sql
+
+    user = uuid.uuid4()
+    rows = [
+        SimpleNamespace(action="read", resource_type="user", user_id=user, user_type="user", events=40),
+        SimpleNamespace(action="update", resource_type="user", user_id=user, user_type="user", events=2),
+        SimpleNamespace(action="read", resource_type="order", user_id=None, user_type="anonymous", events=7),
+    ]  # fmt: skip
+
+    class FakeSession:
+        def __init__(self):
+            self.results = [SimpleNamespace(scalar=lambda: date(2026, 10, 16)),
+                            SimpleNamespace(all=lambda: rows)]  # fmt: skip
+
+        async def execute(self, statement):
+            return self.results.pop(0)
+
+    stats = asyncio.run(get_audit_stats(days=365, db=FakeSession(), _=True))
+
+    assert stats["total_events"] == 49
+    assert {"action": "read", "count": 47} in stats["by_action"]
+    assert stats["top_users"][0] == {"user_id": str(user), "user_type": "user", "count": 42}
@@ -0,0 +1,162 @@
+"""
+Tests for the batched audit log writer: batching, flush on stop, spill to
+disk when the database is down and replay once it is back.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import uuid
+from pathlib import Path
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from services.audit_writer import AuditWriter, audit_event, db_row
+
+
+class RecordingWriter(AuditWriter):
+    def __init__(self, spill_dir, **kwargs):
+        super().__init__(spill_dir=str(spill_dir), **kwargs)
+        self.batches = []
+        self.db_up = True
+
+    async def _insert(self, events):
+        if not self.db_up:
+            raise ConnectionError("database is down")
+        self.batches.append([db_row(event) for event in events])
+
+
+def written_ids(writer):
+    return [str(row["id"]) for batch in writer.batches for row in batch]
+
+
+def test_events_are_written_in_batches_and_flushed_on_stop(tmp_path):
+    writer = RecordingWriter(tmp_path, batch_size=3, flush_interval=5)
+    events = [audit_event(endpoint=f"/api/users/{i}") for i in range(7)]
+
+    async def run():
+        writer.start()
+        for event in events:
+            await writer.enqueue(event)
+        await asyncio.sleep(0.01)
+        full_batches = [len(batch) for batch in writer.batches]
+        await writer.stop()
+        return full_batches
+
+    full_batches = asyncio.run(run())
+
+    assert full_batches == [3, 3]
+    assert [len(batch) for batch in writer.batches] == [3, 3, 1]
+    assert written_ids(writer) == [event["id"] for event in events]
+    assert not writer.running
+
+
+def test_events_spill_to_disk_and_replay_when_database_returns(tmp_path):
+    writer = RecordingWriter(tmp_path, batch_size=10, flush_interval=0.01)
+    events = [audit_event(action="read") for _ in range(4)]
+
+    async def run():
+        writer.db_up = False
+        writer.start()
+        for event in events:
+            await writer.enqueue(event)
+        await writer.stop()
+        spilled = sorted(path.name for path in tmp_path.iterdir())
+
+        writer.db_up = True
+        await writer.replay_spilled()
+        return spilled
+
+    spilled = asyncio.run(run())
+
+    assert len(spilled) == 1 and spilled[0].endswith(".jsonl")
+    assert list(tmp_path.iterdir()) == []
+    assert written_ids(writer) == [event["id"] for event in events]
+
+
+def test_full_queue_spills_instead_of_blocking_requests(tmp_path):
+    writer = RecordingWriter(tmp_path, queue_size=1, batch_size=1, flush_interval=5)
+    database_slow = asyncio.Event()
+    insert = writer._insert
+
+    async def slow_insert(events):
+        await database_slow.wait()
+        await insert(events)
+
+    writer._insert = slow_insert
+
+    async def run():
+        writer.start()
+        for _ in range(3):
+            await writer.enqueue(audit_event())
+        spilled = [
+            json.loads(line)
+            for path in tmp_path.glob("*.jsonl")
+            for line in path.read_text(encoding="utf-8").splitlines()
+        ]
+        database_slow.set()
+        await writer.stop()
+        return spilled
+
+    spilled = asyncio.run(run())
+
+    assert len(spilled) == 1 and spilled[0]["user_type"] == "anonymous"
+    # Вылитое на диск событие переигрывается флашером после записи очереди
+    assert len(written_ids(writer)) == 3
+    assert list(tmp_path.glob("*.jsonl")) == []
+
+
+def test_overflow_is_spilled_in_one_batch_off_the_event_loop(tmp_path):
+    writer = RecordingWriter(tmp_path, queue_size=1, batch_size=10, flush_interval=0.01)
+    database_slow = asyncio.Event()
+    insert = writer._insert
+    spill_threads = []
+    write_spill_file = writer._write_spill_file
+
+    async def slow_insert(events):
+        await database_slow.wait()
+        await insert(events)
+
+    def recording_write(events):
+        spill_threads.append((threading.get_ident(), len(events)))
+        write_spill_file(events)
+
+    writer._insert = slow_insert
+    writer._write_spill_file = recording_write
+
+    async def run():
+        writer.start()
+        await writer.enqueue(audit_event())
+        await asyncio.sleep(0.05)  # пачка из одного события застряла в БД
+        for _ in range(4):
+            await writer.enqueue(audit_event())
+        # Запросы не пишут файлы по одному: переполнение ждёт фоновую задачу
+        files_while_slow = list(tmp_path.glob("*.jsonl"))
+        database_slow.set()
+        await writer.stop()
+        return files_while_slow
+
+    files_while_slow = asyncio.run(run())
+
+    assert files_while_slow == []
+    assert [size for _, size in spill_threads] == [3]
+    assert threading.get_ident() not in [thread for thread, _ in spill_threads]
+    # Вылитая пачка переиграна после записи очереди
+    assert len(written_ids(writer)) == 5
+
+
+def test_audit_event_drops_values_that_would_break_the_batch():
+    resource_id = uuid.uuid4()
+    event = audit_event(
+        user_id="not-a-uuid", resource_id=str(resource_id),
+        user_agent="x" * 1000, status_code="200",
+    )  # fmt: skip
+
+    row = db_row(json.loads(json.dumps(event)))
+
+    assert row["user_id"] is None
+    assert row["resource_id"] == resource_id
+    assert len(row["user_agent"]) == 500
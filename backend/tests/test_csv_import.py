@@ -0,0 +1,373 @@
+"""
+Tests for the CSV importer: file reading, change detection, COPY staging rows
+and batch fan-out.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import uuid
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from prometheus_client import REGISTRY
+
+import tasks.tasks_increment as tasks_increment
+from tasks.import_metrics import observe_csv_import
+from tasks.tasks_increment import (
+    CONTENT_HASH_SQL,
+    PRODUCTS_STAGING_COLUMNS,
+    DateColumnParser,
+    compare_products,
+    detect_file_encoding,
+    generate_payload_hash,
+    generate_product_hash,
+    iter_csv_file_lines,
+    normalize_column,
+    normalize_field_value,
+    parse_numeric_column,
+    parse_product_details,
+    process_csv_batch_async,
+    process_csv_data_with_hashes,
+    staging_record,
+)
+
+
+def make_product(**overrides):
+    product = {
+        "uuid": uuid.uuid4(),
+        "name": "НО-ШПА  Табл.",
+        "form": "-",
+        "manufacturer": "Хиноин",
+        "country": "Венгрия",
+        "serial": "A1",
+        "price": 12.5,
+        "quantity": 3,
+        "total_price": 37.5,
+        "expiry_date": None,
+        "category": "Лексредства",
+        "import_date": None,
+        "internal_code": "",
+        "wholesale_price": 10,
+        "retail_price": 12.5,
+        "distributor": "",
+        "internal_id": "42",
+        "pharmacy_id": uuid.uuid4(),
+        "updated_at": datetime(2026, 1, 1, tzinfo=timezone.utc),
+    }
+    product.update(overrides)
+    return product
+
+
+def test_staging_record_matches_staging_columns():
+    product = make_product()
+    record = dict(zip(PRODUCTS_STAGING_COLUMNS, staging_record("a", product)))
+
+    assert len(record) == len(PRODUCTS_STAGING_COLUMNS)
+    assert record["op"] == "a"
+    assert record["uuid"] == product["uuid"]
+    assert record["expiry_date"] == date(2099, 12, 31)
+    assert record["updated_at"].tzinfo is None
+    assert record["quantity"] == 3.0
+    assert record["name_lower"] == "но-шпа табл."
+    assert record["search_tokens"] == ["но", "шпа", "табл"]
+
+
+def test_update_record_targets_existing_product():
+    existing_uuid = uuid.uuid4()
+    product = make_product(existing_uuid=existing_uuid)
+
+    record = dict(zip(PRODUCTS_STAGING_COLUMNS, staging_record("u", product)))
+
+    assert record["uuid"] == existing_uuid
+
+
+def test_product_hash_is_stable_md5_of_key_fields():
+    product = make_product(
+        name="НО-ШПА",
+        serial="A1",
+        expiry_date=date(2030, 12, 31),
+        manufacturer="Хиноин",
+        country="Венгрия",
+    )
+
+    assert generate_product_hash(product) == "5f81bee2b8d78d6a6fe982209fce1db4"
+
+
+def postgres_functions(conn):
+    # md5, concat_ws и to_char с семантикой PostgreSQL (concat_ws пропускает NULL)
+    conn.create_function("md5", 1, lambda text: hashlib.md5(text.encode()).hexdigest())
+    conn.create_function(
+        "concat_ws", -1, lambda sep, *args: sep.join(a for a in args if a is not None)
+    )
+    conn.create_function(
+        "to_char",
+        2,
+        lambda value, fmt: date.fromisoformat(value).strftime(
+            fmt.replace("YYYY", "%Y").replace("MM", "%m").replace("DD", "%d")
+        ),
+    )
+
+
+def test_content_hash_sql_matches_generate_product_hash():
+    products = [
+        make_product(name="НО-ШПА", expiry_date=date(2030, 12, 31)),
+        make_product(
+            name="Бинт", form="", serial="", manufacturer="", country="",
+            expiry_date=date(2027, 1, 5),
+        ),  # fmt: skip
+    ]
+    conn = sqlite3.connect(":memory:")
+    postgres_functions(conn)
+    conn.execute(
+        "CREATE TABLE products "
+        "(name, form, serial, expiry_date, manufacturer, country)"
+    )
+    conn.executemany(
+        "INSERT INTO products VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (p["name"], p["form"], p["serial"], p["expiry_date"].isoformat(),
+             p["manufacturer"], p["country"])
+            for p in products
+        ],
+    )  # fmt: skip
+
+    sql_hashes = [row[0] for row in conn.execute(f"SELECT {CONTENT_HASH_SQL} FROM products")]
+
+    assert sql_hashes == [generate_product_hash(p) for p in products]
+
+
+def test_content_hash_migration_uses_content_hash_sql():
+    migration = (
+        Path(__file__).resolve().parents[1]
+        / "alembic/versions/r5s6t7u8v9w0_add_product_content_hash.py"
+    ).read_text()
+    backfill = migration.split("content_hash = ", 1)[1].split('"""', 1)[0]
+
+    def normalize(sql):
+        return re.sub(r"\s+", " ", sql.replace("p.", "")).replace("( ", "(").strip()
+
+    assert normalize(backfill) == normalize(CONTENT_HASH_SQL)
+
+
+def test_payload_hash_ignores_float_noise_and_key_fields():
+    product = make_product()
+    same = make_product(price=12.500000001, quantity=3.0, name="Другое имя")
+
+    assert generate_payload_hash(product) == generate_payload_hash(same)
+    assert generate_payload_hash(product) != generate_payload_hash(
+        make_product(quantity=4)
+    )
+
+
+def test_compare_products_skips_unchanged_rows():
+    unchanged = make_product()
+    changed = make_product(price=99)
+    resurrected = make_product()
+    new = make_product()
+    csv_hashes = {}
+    existing_hashes = {}
+    for key, product in [("u", unchanged), ("c", changed), ("r", resurrected)]:
+        product["payload_hash"] = generate_payload_hash(product)
+        csv_hashes[key] = product
+        existing_hashes[key] = {
+            "uuid": uuid.uuid4(),
+            "is_removed": key == "r",
+            "payload_hash": generate_payload_hash(make_product()),
+        }
+    new["payload_hash"] = generate_payload_hash(new)
+    csv_hashes["n"] = new
+    existing_hashes["gone"] = {"uuid": uuid.uuid4(), "is_removed": False}
+
+    to_add, to_update, to_remove, unchanged_rows = compare_products(
+        csv_hashes, existing_hashes, list(csv_hashes.values())
+    )
+
+    assert to_add == [new]
+    assert to_update == [changed, resurrected]
+    assert to_remove == [existing_hashes["gone"]["uuid"]]
+    assert unchanged_rows == [unchanged]
+    assert unchanged["existing_uuid"] == existing_hashes["u"]["uuid"]
+
+
+class RecordingConn:
+    def __init__(self):
+        self.executed = []
+
+    async def execute(self, sql, *args):
+        self.executed.append((" ".join(sql.split()), args))
+        return "UPDATE 1"
+
+    async def fetchval(self, sql, *args):
+        return "Минск"
+
+
+def test_unchanged_rows_only_refresh_their_dates():
+    pharmacy_uuid = uuid.uuid4()
+    product = make_product(existing_uuid=uuid.uuid4(), import_date=date(2026, 10, 1))
+    conn = RecordingConn()
+
+    stats = asyncio.run(
+        tasks_increment.execute_incremental_changes_async(
+            conn, [], [], [], pharmacy_uuid, [product]
+        )
+    )
+
+    statements = [sql for sql, _ in conn.executed]
+    assert statements[0] == "BEGIN" and statements[-1] == "COMMIT"
+    (sql, args), = [(sql, args) for sql, args in conn.executed if sql.startswith("UPDATE")]
+    assert "SET updated_at = t.updated_at, import_date = t.import_date" in sql
+    assert "search_vector" not in sql and "products_staging" not in sql
+    assert args == (
+        pharmacy_uuid,
+        [product["existing_uuid"]],
+        [datetime(2026, 1, 1)],
+        [date(2026, 10, 1)],
+    )
+    assert stats == {"added": 0, "updated": 0, "removed": 0, "cancelled_orders": 0}
+
+
+CSV_LINE = (
+    "АСПИРИН ТАБЛ. 500МГ №10;Байер;Германия;S1;1.50;2;3.00;31.12.2030;"
+    "Лексредства;01.10.2026;C1;1.20;1.50;Дистрибьютор;I1"
+)
+
+
+def test_csv_file_is_read_line_by_line_in_detected_encoding(tmp_path):
+    cp1251_file = tmp_path / "cp1251.csv"
+    cp1251_file.write_bytes(f"{CSV_LINE}\r\n\r\n{CSV_LINE}".encode("cp1251"))
+    bom_file = tmp_path / "bom.csv"
+    bom_file.write_bytes(f"\ufeff{CSV_LINE}\n".encode("utf-8"))
+
+    assert detect_file_encoding(str(cp1251_file)) == "windows-1251"
+    assert list(iter_csv_file_lines(str(cp1251_file))) == [CSV_LINE, "", CSV_LINE]
+    assert detect_file_encoding(str(bom_file)) == "utf-8-sig"
+    assert list(iter_csv_file_lines(str(bom_file))) == [CSV_LINE]
+
+
+def test_process_csv_lines_skips_blank_and_duplicate_rows():
+    products, hashes, errors = process_csv_data_with_hashes(
+        iter([CSV_LINE, "", CSV_LINE, "короткая;строка"]), uuid.uuid4()
+    )
+
+    assert len(products) == 1
+    assert list(hashes) == [products[0]["content_hash"]]
+    assert products[0]["name"] == "АСПИРИН"
+    assert [row_num for row_num, _ in errors] == [4]
+
+
+def test_import_stages_are_timed_and_exported_as_metrics():
+    timings = {}
+    products, _, errors = process_csv_data_with_hashes(
+        iter([CSV_LINE, "короткая;строка"]), uuid.uuid4(), timings
+    )
+    result = {
+        "stats": {"added": 1, "updated": 0, "removed": 2, "cancelled_orders": 3,
+                  "unchanged": 0},
+        "processing_errors": errors,
+        "file_bytes": 2048,
+        "rows": {"parse": len(products)},
+        "timings": {**timings, "total": 0.5},
+    }  # fmt: skip
+
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+
+    before = {
+        "removed": sample("csv_import_products_total", change="removed"),
+        "cancelled": sample("csv_import_cancelled_orders_total"),
+        "errors": sample("csv_import_parse_errors_total"),
+        "parse": sample("csv_import_stage_duration_seconds_count", stage="parse"),
+        "rows": sample("csv_import_stage_rows_sum", stage="parse"),
+    }
+    observe_csv_import(result)
+
+    assert set(timings) == {"decode", "parse"}
+    assert sample("csv_import_products_total", change="removed") == before["removed"] + 2
+    assert sample("csv_import_cancelled_orders_total") == before["cancelled"] + 3
+    assert sample("csv_import_parse_errors_total") == before["errors"] + 1
+    assert sample("csv_import_stage_duration_seconds_count", stage="parse") == before["parse"] + 1
+    assert sample("csv_import_stage_rows_sum", stage="parse") == before["rows"] + 1
+
+
+def test_batch_import_bounds_concurrency_and_isolates_failures(monkeypatch):
+    running = 0
+    peak = 0
+
+    async def fake_import(session_maker, pool, file_path, pharmacy_name, pharmacy_number):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if pharmacy_number == "3":
+            raise RuntimeError("broken file")
+        return {"status": "success", "processed_rows": 100}
+
+    @asynccontextmanager
+    async def fake_resources(pool_size=1):
+        yield None, None
+
+    async def noop():
+        pass
+
+    monkeypatch.setattr(tasks_increment, "import_pharmacy_csv", fake_import)
+    monkeypatch.setattr(tasks_increment, "task_resources", fake_resources)
+    monkeypatch.setattr(tasks_increment, "initialize_task_models", noop)
+    files = [
+        {"file_path": f"/tmp/novamedika_{n}.csv", "pharmacy_name": "novamedika",
+         "pharmacy_number": str(n)}
+        for n in range(6)
+    ]  # fmt: skip
+
+    report = asyncio.run(process_csv_batch_async(files, concurrency=2))
+
+    assert peak == 2
+    assert report["status"] == "partial"
+    assert report["failed"] == 1
+    assert report["processed_rows"] == 500
+    assert report["rows_per_second"] > 0
+    assert [r["status"] for r in report["results"]].count("error") == 1
+
+
+def test_column_helpers_match_row_helpers():
+    values = ["  Байер\xa0 Германия ", "", "a\tb", "Байер\xa0 Германия"]
+    cache = {}
+
+    assert normalize_column(values, cache) == [normalize_field_value(v) for v in values]
+    assert normalize_column(values) == [normalize_field_value(v) for v in values]
+    assert parse_numeric_column(["1,5", "", "x", "1e12"], "price") == [
+        1.5,
+        0.0,
+        0.0,
+        99999999.99,
+    ]
+
+
+def test_date_column_format_is_detected_once_per_file():
+    parser = DateColumnParser()
+
+    assert parser.parse(["12/31/2030", "", "05/06/2030"]) == [
+        date(2030, 12, 31),
+        None,
+        date(2030, 5, 6),
+    ]
+    # Формат уже выбран (%m/%d/%Y); чужие значения — через convert_date_format
+    assert parser.parse(["31.12.2030", "2.26", "15.07.29"]) == [
+        date(2030, 12, 31),
+        None,
+        date(2029, 7, 15),
+    ]
+
+
+def test_product_form_is_split_off_the_name():
+    assert parse_product_details("АСПИРИН ТАБЛ. 500МГ №10") == ("АСПИРИН", "ТАБЛ. 500МГ №10")
+    assert parse_product_details("ЭССЕНЦИКАПС КАПС., №50") == ("ЭССЕНЦИКАПС", "КАПС., №50")
+    assert parse_product_details("БИНТ СТЕРИЛЬНЫЙ") == ("БИНТ СТЕРИЛЬНЫЙ", "-")
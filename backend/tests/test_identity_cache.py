@@ -0,0 +1,229 @@
+"""
+Tests for the bot identity cache: warm users resolve without queries, cached
+rows stay writable and carry no personal data, and commits touching
+users/pharmacists invalidate them.
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import pytest
+from sqlalchemy import create_engine, inspect, select
+from sqlalchemy.orm import Session
+
+import bot.middleware.role_middleware as role_middleware
+import services.identity_cache as identity_cache
+from bot.middleware.role_middleware import resolve_identity
+from db.qa_models import Pharmacist, User
+from services.identity_cache import (
+    attach_identity,
+    ensure_loaded,
+    identity_key_for,
+    snapshot_identity,
+)
+
+TELEGRAM_ID = 555_000_111
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+
+class NoQuerySession:
+    def __init__(self):
+        self.added = []
+
+    def add(self, obj):
+        self.added.append(obj)
+
+    async def execute(self, statement):
+        raise AssertionError("warm identity must not query the database")
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    redis = FakeRedis()
+
+    async def get_redis_client():
+        return redis
+
+    monkeypatch.setattr(identity_cache, "get_redis_client", get_redis_client)
+    identity_cache.local_identities.clear()
+    yield redis
+    identity_cache.local_identities.clear()
+
+
+def make_identity():
+    user = User(
+        uuid=uuid.uuid4(), telegram_id=TELEGRAM_ID, first_name="Анна",
+        last_name="Климович", phone="+375291112233", email="anna@example.by",
+        telegram_username="anna_k", user_type="pharmacist",
+        created_at=datetime(2026, 1, 5, 9, 0),
+        consent_privacy_policy=True, consent_transboundary_transfer=False,
+        transboundary_risks_acknowledged=False, password_hash="secret",
+    )  # fmt: skip
+    pharmacist = Pharmacist(
+        uuid=uuid.uuid4(), user_id=user.uuid, pharmacy_info={"number": "7"},
+        is_active=True, is_online=True, last_seen=datetime(2026, 10, 1, 8, 30),
+        created_at=datetime(2026, 1, 5, 9, 0),
+    )  # fmt: skip
+    pharmacist.user = user
+    return user, pharmacist
+
+
+def test_warm_identity_resolves_without_queries(monkeypatch, redis):
+    user, pharmacist = make_identity()
+    calls = []
+
+    async def get_or_create_user(db, telegram_id):
+        calls.append("user")
+        return user
+
+    async def get_pharmacist(telegram_id, db):
+        calls.append("pharmacist")
+        return pharmacist
+
+    monkeypatch.setattr(role_middleware, "get_or_create_user", get_or_create_user)
+    monkeypatch.setattr(role_middleware, "get_pharmacist_by_telegram_id", get_pharmacist)
+
+    asyncio.run(resolve_identity(TELEGRAM_ID, NoQuerySession()))
+    local_user, local_pharmacist = asyncio.run(resolve_identity(TELEGRAM_ID, NoQuerySession()))
+    identity_cache.local_identities.clear()
+    redis_user, redis_pharmacist = asyncio.run(resolve_identity(TELEGRAM_ID, NoQuerySession()))
+
+    assert calls == ["user", "pharmacist"]
+    for cached_user, cached_pharmacist in (
+        (local_user, local_pharmacist), (redis_user, redis_pharmacist)
+    ):  # fmt: skip
+        assert cached_user.uuid == user.uuid
+        assert cached_pharmacist.uuid == pharmacist.uuid
+        assert cached_pharmacist.is_online is True
+        assert cached_pharmacist.last_seen == pharmacist.last_seen
+        assert cached_pharmacist.user is cached_user
+    cached = redis.values[identity_key_for(TELEGRAM_ID)]
+    for value in (
+        "password_hash", "first_name", "phone", "email", "secret",
+        "Климович", "+375291112233", "anna@example.by", "anna_k",
+    ):  # fmt: skip
+        assert value not in cached
+    assert {"first_name", "phone", "email"} <= inspect(redis_user).unloaded
+
+
+def test_customer_identity_is_cached_without_pharmacist(monkeypatch, redis):
+    user, _ = make_identity()
+
+    async def get_or_create_user(db, telegram_id):
+        return user
+
+    async def get_pharmacist(telegram_id, db):
+        return None
+
+    monkeypatch.setattr(role_middleware, "get_or_create_user", get_or_create_user)
+    monkeypatch.setattr(role_middleware, "get_pharmacist_by_telegram_id", get_pharmacist)
+
+    asyncio.run(resolve_identity(TELEGRAM_ID, NoQuerySession()))
+    cached_user, cached_pharmacist = asyncio.run(
+        resolve_identity(TELEGRAM_ID, NoQuerySession())
+    )
+
+    assert cached_user.uuid == user.uuid
+    assert cached_pharmacist is None
+
+
+def test_cached_rows_are_writable_and_commit_invalidates(redis):
+    engine = create_engine("sqlite://")
+    User.__table__.create(engine)
+    Pharmacist.__table__.create(engine)
+    user, pharmacist = make_identity()
+    with Session(engine) as session:
+        session.add_all([user, pharmacist])
+        session.commit()
+        snapshot = snapshot_identity(user, pharmacist)
+
+    async def toggle_offline():
+        identity_cache.local_identities.set(TELEGRAM_ID, snapshot)
+        redis.values[identity_key_for(TELEGRAM_ID)] = "cached"
+        with Session(engine) as session:
+            cached_user, cached_pharmacist = attach_identity(session, snapshot)
+            assert inspect(cached_pharmacist).persistent
+            cached_pharmacist.is_online = False
+            session.commit()
+        await asyncio.sleep(0)
+
+    asyncio.run(toggle_offline())
+
+    with Session(engine) as session:
+        stored = session.execute(select(Pharmacist)).scalar_one()
+        assert stored.is_online is False
+        assert stored.pharmacy_info == {"number": "7"}
+        assert session.execute(select(User.password_hash)).scalar() == "secret"
+    assert identity_cache.local_identities.get(TELEGRAM_ID) is None
+    assert redis.values == {}
+
+
+def test_unchanged_identity_commit_keeps_cache(redis):
+    engine = create_engine("sqlite://")
+    User.__table__.create(engine)
+    Pharmacist.__table__.create(engine)
+    user, pharmacist = make_identity()
+    with Session(engine) as session:
+        session.add_all([user, pharmacist])
+        session.commit()
+        snapshot = snapshot_identity(user, pharmacist)
+
+    identity_cache.local_identities.set(TELEGRAM_ID, snapshot)
+    with Session(engine) as session:
+        cached_user, cached_pharmacist = attach_identity(session, snapshot)
+        cached_pharmacist.is_online = True
+        session.commit()
+
+    assert identity_cache.local_identities.get(TELEGRAM_ID) == snapshot
+
+
+class RefreshingSession:
+    def __init__(self, session):
+        self.session = session
+        self.refreshed = []
+
+    async def refresh(self, obj, attribute_names=None):
+        self.refreshed.append(attribute_names)
+        self.session.refresh(obj, attribute_names)
+
+
+def test_personal_data_is_loaded_on_demand(redis):
+    engine = create_engine("sqlite://")
+    User.__table__.create(engine)
+    Pharmacist.__table__.create(engine)
+    user, pharmacist = make_identity()
+    with Session(engine) as session:
+        session.add_all([user, pharmacist])
+        session.commit()
+        snapshot = snapshot_identity(user, pharmacist)
+
+    with Session(engine) as session:
+        cached_user, _ = attach_identity(session, snapshot)
+        db = RefreshingSession(session)
+        asyncio.run(ensure_loaded(db, cached_user, "first_name", "last_name"))
+        asyncio.run(ensure_loaded(db, cached_user, "first_name", "last_name"))
+
+        assert (cached_user.first_name, cached_user.last_name) == ("Анна", "Климович")
+        assert db.refreshed == [["first_name", "last_name"]]
+        assert "phone" in inspect(cached_user).unloaded
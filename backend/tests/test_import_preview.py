@@ -0,0 +1,231 @@
+"""
+Tests for the CSV import dry-run: diff artifact encoding and preview/apply
+reuse of the stored diff.
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import tasks.import_preview as import_preview
+from tasks.import_preview import (
+    apply_pharmacy_csv_preview,
+    decode_diff,
+    encode_diff,
+    preview_pharmacy_csv,
+)
+from tasks.tasks_increment import staging_record, touch_record
+
+PHARMACY_UUID = uuid.uuid4()
+UPDATED_AT = datetime(2026, 10, 1, 12, 30)
+
+
+def make_product(i, **overrides):
+    product = {
+        "name": f"АСПИРИН {i}",
+        "form": "ТАБЛ.",
+        "manufacturer": "Байер",
+        "country": "Германия",
+        "serial": f"S{i}",
+        "price": 12.5,
+        "quantity": 3.0,
+        "total_price": 37.5,
+        "expiry_date": date(2030, 12, 31),
+        "category": "Лексредства",
+        "import_date": None,
+        "internal_code": "",
+        "wholesale_price": 10.0,
+        "retail_price": 12.5,
+        "distributor": "",
+        "internal_id": str(i),
+        "pharmacy_id": PHARMACY_UUID,
+        "updated_at": UPDATED_AT,
+        "content_hash": f"{i:032x}",
+        "payload_hash": f"{i + 1:032x}",
+    }
+    product.update(overrides)
+    return product
+
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+
+    async def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    async def hmget(self, key, fields):
+        return [self.hashes.get(key, {}).get(field) for field in fields]
+
+    async def delete(self, key):
+        self.hashes.pop(key, None)
+
+    def pipeline(self):
+        redis = self
+        ops = []
+
+        class Pipeline:
+            def delete(self, key):
+                ops.append(lambda: redis.hashes.pop(key, None))
+
+            def hset(self, key, mapping):
+                ops.append(lambda: redis.hashes.setdefault(key, {}).update(mapping))
+
+            def expire(self, key, ttl):
+                pass
+
+            async def execute(self):
+                for op in ops:
+                    op()
+
+        return Pipeline()
+
+
+class FakeConn:
+    def transaction(self, **kwargs):
+        @asynccontextmanager
+        async def transaction():
+            yield
+
+        return transaction()
+
+
+class FakePool:
+    @asynccontextmanager
+    async def acquire(self):
+        yield FakeConn()
+
+
+def install_fakes(monkeypatch, state, existing, csv_products):
+    calls = {"parsed": 0, "applied": [], "imported": 0}
+    pharmacy = SimpleNamespace(uuid=PHARMACY_UUID)
+
+    async def get_pharmacy(session_maker, pharmacy_name, pharmacy_number):
+        return pharmacy
+
+    async def get_or_create_pharmacy(session_maker, pharmacy_name, pharmacy_number, district):
+        return pharmacy, False
+
+    async def get_products_state(conn, pharmacy_uuid):
+        return state["value"]
+
+    async def get_existing(conn, pharmacy_uuid):
+        return existing
+
+    async def count_orders(conn, to_remove):
+        return len(to_remove) * 2
+
+    def process(lines, pharmacy_uuid):
+        calls["parsed"] += 1
+        products = [dict(p) for p in csv_products]
+        return products, {p["content_hash"]: p for p in products}, []
+
+    async def execute(conn, to_add, to_update, to_remove, pharmacy_uuid, unchanged=()):
+        calls["applied"].append((to_add, to_update, to_remove, unchanged))
+        return {"added": len(to_add), "updated": len(to_update),
+                "removed": len(to_remove), "cancelled_orders": 0}  # fmt: skip
+
+    async def import_csv(session_maker, pool, file_path, *args):
+        calls["imported"] += 1
+        return {"status": "success"}
+
+    @asynccontextmanager
+    async def lock(conn, pharmacy_uuid):
+        yield 0.0
+
+    for name, value in {
+        "get_pharmacy": get_pharmacy,
+        "get_or_create_pharmacy": get_or_create_pharmacy,
+        "get_products_state": get_products_state,
+        "get_existing_products_with_hashes": get_existing,
+        "count_orders_to_cancel": count_orders,
+        "process_csv_data_with_hashes": process,
+        "iter_csv_file_lines": lambda file_path: iter(()),
+        "execute_incremental_changes_async": execute,
+        "import_pharmacy_csv": import_csv,
+        "pharmacy_import_lock": lock,
+    }.items():
+        monkeypatch.setattr(import_preview, name, value)
+    return calls
+
+
+def test_diff_round_trip_produces_same_staging_rows():
+    to_add = [
+        make_product(1, uuid=uuid.uuid4()),
+        make_product(2, uuid=uuid.uuid4(), import_date=date(2026, 9, 1)),
+    ]
+    to_update = [make_product(3, existing_uuid=uuid.uuid4(), is_removed=True)]
+    to_remove = [uuid.uuid4(), uuid.uuid4()]
+    unchanged = [make_product(4, existing_uuid=uuid.uuid4(), import_date=date(2026, 9, 2))]
+
+    data = encode_diff(to_add, to_update, to_remove, unchanged)
+    added, updated, removed, kept = decode_diff(data, PHARMACY_UUID, UPDATED_AT)
+
+    assert isinstance(data, bytes)
+    assert removed == to_remove
+    assert [staging_record("u", p) for p in updated] == [
+        staging_record("u", p) for p in to_update
+    ]
+    assert [staging_record("a", p)[2:] for p in added] == [
+        staging_record("a", p)[2:] for p in to_add
+    ]
+    assert all(isinstance(p["uuid"], uuid.UUID) for p in added)
+    assert [touch_record(p) for p in kept] == [touch_record(p) for p in unchanged]
+
+
+def test_apply_reuses_preview_diff_without_reparsing(monkeypatch):
+    kept, changed = make_product(1), make_product(2)
+    removed_uuid = uuid.uuid4()
+    existing = {
+        kept["content_hash"]: {"uuid": uuid.uuid4(), "is_removed": False,
+                               "payload_hash": kept["payload_hash"]},
+        changed["content_hash"]: {"uuid": uuid.uuid4(), "is_removed": False,
+                                  "payload_hash": "old"},
+        "gone": {"uuid": removed_uuid, "is_removed": False, "payload_hash": "x"},
+    }  # fmt: skip
+    csv_products = [kept, changed, make_product(3)]
+    state = {"value": "3:42"}
+    calls = install_fakes(monkeypatch, state, existing, csv_products)
+    redis = FakeRedis()
+    args = (None, FakePool(), redis, "/tmp/f.csv", "novamedika", "7", "ab" * 32)
+
+    preview = asyncio.run(preview_pharmacy_csv(*args))
+    again = asyncio.run(preview_pharmacy_csv(*args))
+    result = asyncio.run(apply_pharmacy_csv_preview(*args))
+
+    assert preview["summary"] == {
+        "added": 1, "updated": 1, "removed": 1, "unchanged": 1,
+        "cancelled_orders": 2, "processed_rows": 3, "processing_errors": 0,
+    }  # fmt: skip
+    assert again["cached"] and again["summary"] == preview["summary"]
+    assert calls["parsed"] == 1
+    assert result["preview"] == "applied"
+    assert result["stats"]["unchanged"] == 1
+    (to_add, to_update, to_remove, unchanged), = calls["applied"]
+    assert [p["name"] for p in to_add] == ["АСПИРИН 3"]
+    assert [p["existing_uuid"] for p in to_update] == [existing[changed["content_hash"]]["uuid"]]
+    assert to_remove == [removed_uuid]
+    assert [p["existing_uuid"] for p in unchanged] == [existing[kept["content_hash"]]["uuid"]]
+    assert redis.hashes == {}
+
+
+def test_apply_reimports_when_products_changed_after_preview(monkeypatch):
+    state = {"value": "0:0"}
+    calls = install_fakes(monkeypatch, state, {}, [make_product(1)])
+    args = (None, FakePool(), FakeRedis(), "/tmp/f.csv", "novamedika", "7", "cd" * 32)
+
+    asyncio.run(preview_pharmacy_csv(*args))
+    state["value"] = "1:-5"
+    result = asyncio.run(apply_pharmacy_csv_preview(*args))
+
+    assert calls["applied"] == []
+    assert calls["imported"] == 1
+    assert result["preview"] == "stale"
@@ -0,0 +1,113 @@
+"""
+Tests for the Telegram notification dispatcher: non-blocking enqueue,
+per-chat spacing, retry-after handling and batching of identical texts.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from bot.services.notification_dispatcher import NotificationDispatcher, TokenBucket
+
+
+class FakeSender:
+    def __init__(self, delay=0.0, errors=None):
+        self.delay = delay
+        self.errors = errors or {}
+        self.sent = []
+
+    async def __call__(self, chat_id, text, **options):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        error = self.errors.pop(chat_id, None)
+        if error:
+            raise error
+        self.sent.append((chat_id, text, time.monotonic()))
+
+
+def retry_after(seconds):
+    return TelegramRetryAfter(
+        method=SendMessage(chat_id=1, text="x"),
+        message="Too Many Requests",
+        retry_after=seconds,
+    )
+
+
+def test_notify_returns_before_slow_sends_finish():
+    async def run():
+        sender = FakeSender(delay=0.2)
+        dispatcher = NotificationDispatcher(send=sender, rate=1000, concurrency=10)
+        dispatcher.start()
+        started = time.monotonic()
+        queued = await dispatcher.notify(range(10), "new question")
+        enqueue_time = time.monotonic() - started
+        await dispatcher.stop()
+        return queued, enqueue_time, time.monotonic() - started, sender
+
+    queued, enqueue_time, total_time, sender = asyncio.run(run())
+
+    assert queued == 10
+    assert enqueue_time < 0.05
+    # 10 отправок по 0.2 с идут параллельно, а не 2 секунды подряд
+    assert total_time < 1.0
+    assert sorted(chat_id for chat_id, _, _ in sender.sent) == list(range(10))
+
+
+def test_token_bucket_limits_rate():
+    async def run():
+        bucket = TokenBucket(rate=100, burst=1)
+        started = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.045
+
+
+def test_same_chat_is_spaced_and_identical_texts_are_batched():
+    async def run():
+        sender = FakeSender()
+        dispatcher = NotificationDispatcher(send=sender, rate=1000, chat_interval=0.05)
+        dispatcher.start()
+        first = await dispatcher.notify([1, 2, 2], "hello")
+        duplicate = await dispatcher.notify([1], "hello")
+        second = await dispatcher.notify([1], "another")
+        await dispatcher.stop()
+        return first, duplicate, second, sender
+
+    first, duplicate, second, sender = asyncio.run(run())
+
+    assert (first, duplicate, second) == (2, 0, 1)
+    to_chat_1 = [(text, at) for chat_id, text, at in sender.sent if chat_id == 1]
+    assert [text for text, _ in to_chat_1] == ["hello", "another"]
+    assert to_chat_1[1][1] - to_chat_1[0][1] >= 0.045
+
+
+def test_retry_after_pauses_and_resends_while_blocked_chat_is_dropped():
+    async def run():
+        sender = FakeSender(
+            errors={
+                1: retry_after(0),
+                2: TelegramForbiddenError(
+                    method=SendMessage(chat_id=2, text="x"), message="bot was blocked"
+                ),
+            }
+        )
+        dispatcher = NotificationDispatcher(send=sender, rate=1000, chat_interval=0)
+        dispatcher.start()
+        await dispatcher.notify([1, 2, 3], "hello")
+        await dispatcher.stop()
+        return dispatcher, sender
+
+    dispatcher, sender = asyncio.run(run())
+
+    assert sorted(chat_id for chat_id, _, _ in sender.sent) == [1, 3]
+    assert dispatcher.depth == 0
@@ -0,0 +1,79 @@
+"""
+Tests for opaque-cursor (keyset) pagination of search results and orders.
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from db.booking_models import BookingOrder
+from services.pagination import (
+    InvalidCursorError,
+    apply_orders_keyset,
+    decode_cursor,
+    encode_cursor,
+    split_orders_page,
+)
+from services.product_search import SearchFilters, execute_search
+
+
+def compile_sql(statement) -> str:
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+def test_cursor_round_trip_and_validation():
+    cursor = encode_cursor([-5, -0.0607927, 12.3, "abc"])
+
+    assert [str(v) for v in decode_cursor(cursor, 4)] == ["-5", "-0.0607927", "12.3", "abc"]
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor, 2)
+    with pytest.raises(InvalidCursorError):
+        decode_cursor("not-a-cursor", 4)
+
+
+def test_orders_keyset_replaces_offset_and_returns_next_cursor():
+    created_at = datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    orders = [
+        SimpleNamespace(uuid=uuid.uuid4(), created_at=created_at) for _ in range(3)
+    ]
+
+    page, next_cursor = split_orders_page(orders, 2)
+    query = apply_orders_keyset(select(BookingOrder), next_cursor, 2)
+    sql = compile_sql(query)
+
+    assert page == orders[:2]
+    assert "(booking_orders.created_at, booking_orders.uuid) <" in sql
+    assert "OFFSET" not in sql
+    assert split_orders_page(orders, None) == (orders, None)
+
+
+def test_search_cursor_switches_page_to_keyset():
+    statements = []
+
+    class Session:
+        async def execute(self, statement):
+            statements.append(compile_sql(statement))
+            return SimpleNamespace(
+                one=lambda: SimpleNamespace(
+                    total=3, current_page=1, items=[], next_key=[-0.1, 5.5, -2, "u"]
+                )
+            )
+
+    filters = SearchFilters(form="ТАБЛ.", manufacturer="Байер", country="Германия")
+    cursor = encode_cursor([-0.2, 1.5, -1, str(uuid.uuid4())])
+    response = asyncio.run(execute_search(Session(), "аспирин", filters, 1, 20, cursor))
+
+    assert "OFFSET" not in statements[0]
+    assert response["page"] is None
+    assert decode_cursor(response["next_cursor"], 4)[-1] == "u"
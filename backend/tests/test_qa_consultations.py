@@ -1,12 +1,18 @@
+import asyncio
 import os
 import sys
 import uuid
+from datetime import datetime
 from pathlib import Path
+from types import SimpleNamespace
 
 os.environ.setdefault("SECRET_KEY", "test-secret-key")
 sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
 
+from sqlalchemy.dialects import postgresql
+
 from auth.auth import get_current_user_jwt_or_tma
+from routers.pharmacist_dashboard import get_questions, questions_page_query
 from routers.qa import build_consultations_query, router
 
 
@@ -42,3 +48,35 @@ def test_consultation_routes_use_tma_aware_auth_dependency():
     ]:
         dependencies = routes[path]
         assert any(dep.call is get_current_user_jwt_or_tma for dep in dependencies)
+
+
+def test_dashboard_questions_page_counts_messages_without_loading_them():
+    sql = str(questions_page_query("pending", 3, 20).compile(dialect=postgresql.dialect()))
+
+    assert "count(*) OVER ()" in sql
+    assert "GROUP BY qa_dialog_messages.question_id" in sql
+    assert "qa_dialog_messages.uuid" not in sql
+    assert sql.count("FROM qa_questions") == 1
+
+
+def test_dashboard_questions_use_one_round_trip_per_page():
+    statements = []
+    row = SimpleNamespace(
+        uuid=uuid.uuid4(), text="Вопрос", status="pending", created_at=datetime(2026, 1, 1),
+        total=41, first_name="Анна", last_name=None, telegram_id=1, message_count=250,
+    )  # fmt: skip
+
+    class FakeSession:
+        async def execute(self, statement):
+            statements.append(statement)
+            return SimpleNamespace(all=lambda: [row])
+
+    response = asyncio.run(
+        get_questions(page=1, limit=20, status="new", db=FakeSession(), pharmacist=None)
+    )
+
+    assert len(statements) == 1
+    assert response.total == 41
+    assert response.pages == 3
+    assert response.questions[0].user_name == "Анна"
+    assert response.questions[0].message_count == 250
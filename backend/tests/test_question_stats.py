@@ -0,0 +1,83 @@
+"""
+Tests for the shared question stats service: single FILTER aggregate and
+the short-TTL Redis cache.
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from sqlalchemy.dialects import postgresql
+
+import services.question_stats as question_stats
+from services.question_stats import get_question_stats, question_stats_query
+
+ROW = SimpleNamespace(
+    total=10, pending=3, in_progress=2, answered=4, completed=1,
+    completed_today=1, avg_response_seconds=95.0,
+)  # fmt: skip
+
+
+class FakeSession:
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        return SimpleNamespace(one=lambda: ROW)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value
+
+
+def test_stats_are_one_filter_aggregate():
+    sql = str(question_stats_query(uuid.uuid4()).compile(dialect=postgresql.dialect()))
+
+    assert sql.count("FILTER (WHERE") == 6
+    assert sql.count("\nFROM qa_questions") == 1
+    assert "qa_questions.user_id =" in sql
+
+
+def test_global_stats_are_cached_and_user_stats_are_not(monkeypatch):
+    redis = FakeRedis()
+
+    async def get_redis_client():
+        return redis
+
+    monkeypatch.setattr(question_stats, "get_redis_client", get_redis_client)
+    db = FakeSession()
+
+    first = asyncio.run(get_question_stats(db))
+    second = asyncio.run(get_question_stats(db))
+    asyncio.run(get_question_stats(db, uuid.uuid4()))
+    asyncio.run(get_question_stats(db, uuid.uuid4()))
+
+    assert first == second
+    assert first.avg_response_time_minutes == 1.58
+    assert first.answer_rate == 0.4
+    assert len(db.statements) == 3
+
+
+def test_stats_fall_back_to_database_without_redis(monkeypatch):
+    async def get_redis_client():
+        raise ConnectionError("redis is down")
+
+    monkeypatch.setattr(question_stats, "get_redis_client", get_redis_client)
+
+    stats = asyncio.run(get_question_stats(FakeSession()))
+
+    assert stats.pending == 3
@@ -0,0 +1,114 @@
+"""
+Tests for the /search-fts/ result cache invalidation rules.
+
+Verifies that:
+1. Cache keys depend on the normalized query, filters and page.
+2. A pharmacy import makes entries of its city and of city-less searches
+   stale, while other cities keep hitting the cache.
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from services.product_search import SearchFilters
+from services.search_cache import (
+    GLOBAL_SCOPE,
+    build_cache_key,
+    bump_pharmacy_generation,
+    cache_scope,
+    get_cached_search,
+    store_cached_search,
+)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args))
+
+    async def execute(self):
+        return [await getattr(self.client, name)(*args) for name, args in self.calls]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.hashes = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+
+    async def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    async def hincrby(self, key, field, amount):
+        bucket = self.hashes.setdefault(key, {})
+        bucket[field] = int(bucket.get(field, 0)) + amount
+        return bucket[field]
+
+
+def test_cache_key_uses_normalized_query_and_filters():
+    filters = SearchFilters(city="Минск")
+
+    assert build_cache_key("  АСПИРИН ", filters, 1, 50) == build_cache_key(
+        "аспирин", filters, 1, 50
+    )
+    assert build_cache_key("аспирин", filters, 1, 50) != build_cache_key(
+        "аспирин", filters, 2, 50
+    )
+    assert build_cache_key("аспирин", filters, 1, 50) != build_cache_key(
+        "аспирин", SearchFilters(city="Гродно"), 1, 50
+    )
+
+
+def test_cache_scope_falls_back_to_global_for_patterns():
+    assert cache_scope(None) == GLOBAL_SCOPE
+    assert cache_scope("Минск%") == GLOBAL_SCOPE
+    assert cache_scope(" МИНСК ") == "минск"
+
+
+def test_pharmacy_import_invalidates_only_its_city():
+    async def scenario():
+        client = FakeRedis()
+        entries = {}
+        for city in ("Минск", "Гродно", None):
+            key = build_cache_key("аспирин", SearchFilters(city=city), 1, 50)
+            _, generation = await get_cached_search(client, key, cache_scope(city))
+            await store_cached_search(client, key, generation, {"city": city})
+            entries[city] = key
+
+        await bump_pharmacy_generation(client, "минск")
+
+        return {
+            city: (await get_cached_search(client, key, cache_scope(city)))[0]
+            for city, key in entries.items()
+        }
+
+    results = asyncio.run(scenario())
+
+    assert results["Минск"] is None
+    assert results[None] is None
+    assert results["Гродно"] == {"city": "Гродно"}
@@ -0,0 +1,94 @@
+"""
+Query-count tests for the /search-fts/ execution engine.
+
+A search must not issue separate statements for level counts, combinations,
+total and page: the whole response is served from one candidate set.
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from sqlalchemy.dialects import postgresql
+
+from services.product_search import SearchFilters, execute_search
+
+MAX_STATEMENTS_PER_SEARCH = 2
+
+
+class RecordingSession:
+    """Minimal AsyncSession stand-in that records every executed statement."""
+
+    def __init__(self, row):
+        self.row = row
+        self.statements = []
+
+    async def execute(self, statement, *args, **kwargs):
+        self.statements.append(str(statement.compile(dialect=postgresql.dialect())))
+        return SimpleNamespace(one=lambda: self.row)
+
+
+def run_search(row, q="аспирин", **filters):
+    session = RecordingSession(row)
+    response = asyncio.run(
+        execute_search(session, q, SearchFilters(**filters), page=1, size=20)
+    )
+    return session, response
+
+
+def test_tiered_search_issues_at_most_two_statements():
+    row = SimpleNamespace(
+        tier=1,
+        total=1,
+        current_page=1,
+        combinations=[{"name": "АСПИРИН", "count": 3}],
+        items=[{"uuid": "x"}],
+        next_key=None,
+    )
+
+    session, response = run_search(row, city="Минск", min_price=1.0)
+
+    assert len(session.statements) <= MAX_STATEMENTS_PER_SEARCH
+    assert session.statements[0].count("FROM products JOIN pharmacies") == 1
+    assert response["search_level"] == "exact"
+    assert response["total_found"] == 3
+
+
+def test_specific_combination_issues_at_most_two_statements():
+    row = SimpleNamespace(total=0, current_page=1, items=[], next_key=None)
+
+    session, response = run_search(
+        row, form="ТАБЛ.", manufacturer="Байер", country="Германия"
+    )
+
+    assert len(session.statements) <= MAX_STATEMENTS_PER_SEARCH
+    assert response["search_level"] == "specific_combination"
+
+
+def test_no_level_matched_returns_empty_response():
+    row = SimpleNamespace(
+        tier=None, total=0, current_page=1, combinations=[], items=[], next_key=None
+    )
+
+    session, response = run_search(row)
+
+    assert len(session.statements) == 1
+    assert response["search_level"] == "none"
+    assert response["items"] == []
+
+
+def test_combinations_read_product_groups_unless_price_filtered():
+    row = SimpleNamespace(
+        tier=2, total=0, current_page=1, combinations=[], items=[], next_key=None
+    )
+
+    session, _ = run_search(row, city="Минск")
+    assert "FROM product_groups" in session.statements[0]
+
+    session, _ = run_search(row, city="Минск", max_price=10.0)
+    assert "product_groups" not in session.statements[0]
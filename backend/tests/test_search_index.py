@@ -0,0 +1,20 @@
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from services.search_index import build_search_index_fields, normalize_search_text
+
+
+def test_normalize_search_text_matches_query_and_index_rules():
+    assert normalize_search_text("  ЁЖИК   Табл.\tП/О  ") == "ежик табл. п/о"
+    assert normalize_search_text(None) == ""
+
+
+def test_build_search_index_fields_tokens_are_unique_and_ordered():
+    fields = build_search_index_fields("НО-ШПА ТАБЛ. 40МГ №20 ТАБЛ")
+
+    assert fields["name_lower"] == "но-шпа табл. 40мг №20 табл"
+    assert fields["search_tokens"] == ["но", "шпа", "табл", "40мг", "20"]
@@ -0,0 +1,56 @@
+"""
+Tests for the in-memory /search/suggest prefix index.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from services.suggest_index import SuggestIndex
+
+NAMES = [
+    "АСПИРИН КАРДИО ТАБЛ. 100МГ №28",
+    "Аспирин табл. 500мг №10",
+    "НО-ШПА ТАБЛ. 40МГ №20",
+    "ПАРАЦЕТАМОЛ ТАБЛ. 500МГ №10",
+    "ИБУПРОФЕН КАПС. 200МГ №20",
+]
+
+
+def build_index():
+    index = SuggestIndex()
+    index.build(NAMES)
+    return index
+
+
+def test_prefix_matches_name_start_before_inner_words():
+    index = build_index()
+
+    assert index.suggest("асп", 10) == [NAMES[0], NAMES[1]]
+    assert index.suggest("кардио") == [NAMES[0]]
+    assert index.suggest("табл", 2) == [NAMES[0], NAMES[2]]
+    assert index.suggest("  ") == []
+
+
+def test_typo_falls_back_to_trigram_correction():
+    index = build_index()
+
+    assert index.suggest("ибупрафен") == [NAMES[4]]
+    assert index.suggest("аспирн кард") == [NAMES[0]]
+
+
+def test_incremental_updates_match_full_build():
+    index = build_index()
+    index.apply_update(
+        {"added": ["ЦИТРАМОН ТАБЛ. №10"], "removed": ["но-шпа табл. 40мг №20"]}
+    )
+
+    expected = SuggestIndex()
+    expected.build([n for n in NAMES if not n.startswith("НО-ШПА")] + ["ЦИТРАМОН ТАБЛ. №10"])
+
+    assert index.__dict__ == expected.__dict__
+    assert index.suggest("цитр") == ["ЦИТРАМОН ТАБЛ. №10"]
+    assert index.suggest("шпа") == []
@@ -0,0 +1,211 @@
+"""
+Tests for background Telegram update processing: per-chat ordering,
+parallelism across chats, dedup of redelivered update_ids and shutdown.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from aiogram.types import Update
+from prometheus_client import REGISTRY
+
+import bot.services.update_queue as update_queue_module
+from bot.services.update_queue import UpdateQueue, is_duplicate_update, update_chat_id
+
+
+def message_update(update_id, chat_id, text="hi"):
+    return Update(
+        update_id=update_id,
+        message={
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+            "text": text,
+        },
+    )
+
+
+def callback_update(update_id, chat_id, user_id):
+    return Update(
+        update_id=update_id,
+        callback_query={
+            "id": str(update_id),
+            "chat_instance": "1",
+            "data": "answer",
+            "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+            "message": {
+                "message_id": 1,
+                "date": 0,
+                "chat": {"id": chat_id, "type": "private"},
+                "text": "question",
+            },
+        },
+    )
+
+
+def test_chat_id_is_taken_from_message_callback_or_sender():
+    assert update_chat_id(message_update(1, 10)) == 10
+    assert update_chat_id(callback_update(2, 20, user_id=99)) == 20
+    inline_query = Update(
+        update_id=3,
+        inline_query={
+            "id": "q",
+            "query": "",
+            "offset": "",
+            "from": {"id": 30, "is_bot": False, "first_name": "User"},
+        },
+    )
+    assert update_chat_id(inline_query) == 30
+    assert update_chat_id(Update(update_id=4)) is None
+
+
+def test_updates_of_one_chat_run_in_order_while_other_chats_proceed():
+    async def run():
+        processed = []
+        running = set()
+        overlaps = []
+
+        async def process(update):
+            chat_id = update.message.chat.id
+            if chat_id in running:
+                overlaps.append(update.update_id)
+            running.add(chat_id)
+            # Первый чат медленный: его обновления не должны задерживать второй
+            await asyncio.sleep(0.1 if chat_id == 1 else 0.01)
+            running.discard(chat_id)
+            processed.append((chat_id, update.update_id, time.monotonic()))
+
+        queue = UpdateQueue(process=process, workers=4)
+        queue.start()
+        started = time.monotonic()
+        for update_id in range(1, 4):
+            queue.submit(message_update(update_id, chat_id=1))
+        for update_id in range(11, 14):
+            queue.submit(message_update(update_id, chat_id=2))
+        await queue.stop()
+        return processed, overlaps, started, queue
+
+    processed, overlaps, started, queue = asyncio.run(run())
+
+    assert overlaps == []
+    assert [u for chat, u, _ in processed if chat == 1] == [1, 2, 3]
+    assert [u for chat, u, _ in processed if chat == 2] == [11, 12, 13]
+    slow_first_done = next(at for chat, _, at in processed if chat == 1)
+    fast_last_done = [at for chat, _, at in processed if chat == 2][-1]
+    assert fast_last_done < slow_first_done
+    assert queue.depth == 0 and queue._chats == {}
+
+
+def test_failed_update_does_not_block_the_rest_of_its_chat():
+    async def run():
+        processed = []
+
+        async def process(update):
+            if update.update_id == 1:
+                raise ValueError("handler failed")
+            processed.append(update.update_id)
+
+        queue = UpdateQueue(process=process, workers=2)
+        queue.start()
+        queue.submit(message_update(1, chat_id=5))
+        queue.submit(message_update(2, chat_id=5))
+        await queue.stop()
+        return processed
+
+    assert asyncio.run(run()) == [2]
+
+
+def test_updates_left_at_shutdown_are_counted_as_dropped(monkeypatch):
+    monkeypatch.setattr(update_queue_module, "TELEGRAM_UPDATE_SHUTDOWN_TIMEOUT", 0.05)
+
+    async def run():
+        async def process(update):
+            await asyncio.sleep(10)
+
+        queue = UpdateQueue(process=process, workers=1)
+        queue.start()
+        for update_id in (1, 2, 3):
+            queue.submit(message_update(update_id, chat_id=1))
+        await asyncio.sleep(0)
+        unprocessed = queue.unprocessed()
+        await queue.stop()
+        return unprocessed, queue
+
+    def dropped():
+        return REGISTRY.get_sample_value("telegram_updates_total", {"outcome": "dropped"}) or 0
+
+    before = dropped()
+    unprocessed, queue = asyncio.run(run())
+
+    assert unprocessed == [1, 2, 3]
+    assert dropped() == before + 3
+    assert not queue.running
+
+
+def test_shutdown_budgets_fit_gunicorn_graceful_timeout():
+    from bot.services.notification_dispatcher import NOTIFY_SHUTDOWN_TIMEOUT
+    from services.audit_writer import AUDIT_SHUTDOWN_TIMEOUT
+
+    dockerfile = (Path(__file__).resolve().parents[1] / "Dockerfile").read_text()
+    command = dockerfile[dockerfile.index("CMD [") :]
+    graceful = float(command.split('"--graceful-timeout", "')[1].split('"')[0])
+    budgets = (
+        update_queue_module.TELEGRAM_UPDATE_SHUTDOWN_TIMEOUT
+        + AUDIT_SHUTDOWN_TIMEOUT
+        + NOTIFY_SHUTDOWN_TIMEOUT
+    )
+
+    assert budgets < graceful
+
+
+def test_queue_reports_full_at_its_size():
+    async def run():
+        queue = UpdateQueue(process=None, queue_size=2)
+        queue.submit(message_update(1, chat_id=1))
+        before = queue.full
+        queue.submit(message_update(2, chat_id=2))
+        return before, queue.full
+
+    assert asyncio.run(run()) == (False, True)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.keys = {}
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.keys:
+            return None
+        self.keys[key] = ex
+        return True
+
+
+def test_redelivered_update_ids_are_detected(monkeypatch):
+    redis = FakeRedis()
+
+    async def fake_client():
+        return redis
+
+    monkeypatch.setattr(update_queue_module, "get_redis_client", fake_client)
+
+    async def run():
+        return [await is_duplicate_update(update_id) for update_id in (7, 8, 7)]
+
+    assert asyncio.run(run()) == [False, False, True]
+    assert redis.keys["telegram:update:7"] == update_queue_module.TELEGRAM_UPDATE_DEDUP_TTL
+
+
+def test_dedup_fails_open_without_redis(monkeypatch):
+    async def broken_client():
+        raise ConnectionError("redis is down")
+
+    monkeypatch.setattr(update_queue_module, "get_redis_client", broken_client)
+
+    assert asyncio.run(is_duplicate_update(7)) is False
@@ -0,0 +1,58 @@
+"""
+Tests for the Celery worker runtime (persistent loop and shared resources).
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from tasks.worker_runtime import WorkerRuntime, task_resources, worker_runtime
+
+
+@pytest.fixture
+def runtime(monkeypatch):
+    loop = asyncio.new_event_loop()
+    monkeypatch.setattr(worker_runtime, "loop", loop)
+    monkeypatch.setattr(worker_runtime, "session_maker", "shared-sessions")
+    monkeypatch.setattr(worker_runtime, "pool", "shared-pool")
+    yield worker_runtime
+    loop.close()
+
+
+def test_tasks_share_loop_and_resources(runtime):
+    async def borrow():
+        async with task_resources() as resources:
+            return asyncio.get_running_loop(), resources
+
+    first_loop, resources = runtime.run(borrow())
+    second_loop, _ = runtime.run(borrow())
+
+    assert first_loop is second_loop is runtime.loop
+    assert resources == ("shared-sessions", "shared-pool")
+    assert not WorkerRuntime().active
+
+
+def test_interrupted_task_is_cancelled_and_cleaned_up(runtime):
+    cleaned_up = []
+
+    def interrupt():
+        raise SystemExit
+
+    async def slow_task():
+        try:
+            runtime.loop.call_soon(interrupt)
+            await asyncio.sleep(10)
+        finally:
+            cleaned_up.append(True)
+
+    with pytest.raises(SystemExit):
+        runtime.run(slow_task())
+
+    assert cleaned_up == [True]
+    assert runtime.run(asyncio.sleep(0, result="ok")) == "ok"
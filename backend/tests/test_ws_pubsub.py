@@ -0,0 +1,299 @@
+"""
+Tests for WebSocket events over Redis Streams + Pub/Sub: channel routing,
+registry-driven subscriptions and replay on reconnect.
+"""
+
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import services.ws_pubsub as ws_pubsub
+from services.ws_pubsub import (
+    PHARMACISTS_CHANNEL,
+    WebSocketEventBus,
+    consultation_channel,
+    event_channels,
+    stream_key,
+)
+from services.ws_registry import WebSocketConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000):
+        pass
+
+
+class FakePubSub:
+    def __init__(self):
+        self.commands = []
+
+    async def subscribe(self, *channels):
+        self.commands.append(("subscribe", sorted(channels)))
+
+    async def unsubscribe(self, *channels):
+        self.commands.append(("unsubscribe", sorted(channels)))
+
+
+class FakeScript:
+    def __init__(self, redis):
+        self.redis = redis
+
+    async def __call__(self, keys, args, client=None):
+        maxlen, ttl, payload, channel = args
+        event_id = self.redis.xadd(keys[0], {"event": payload})
+        self.redis.published.append((channel, f"{event_id} {payload}"))
+        return event_id
+
+
+class FakeRedis:
+    def __init__(self):
+        self.streams = {}
+        self.published = []
+        self.seq = 0
+
+    def register_script(self, source):
+        return FakeScript(self)
+
+    def xadd(self, stream, fields):
+        self.seq += 1
+        event_id = f"1000-{self.seq}"
+        self.streams.setdefault(stream, []).append((event_id, fields))
+        return event_id
+
+    async def xrange(self, stream, min="-", max="+", count=None):
+        entries = self.streams.get(stream, [])
+        if min.startswith("("):
+            after = ws_pubsub.stream_id(min[1:])
+            entries = [e for e in entries if ws_pubsub.stream_id(e[0]) > after]
+        return entries[:count]
+
+    async def xrevrange(self, stream, max="+", min="-", count=None):
+        return list(reversed(self.streams.get(stream, [])))[:count]
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def use_redis(monkeypatch, redis):
+    async def fake_client():
+        return redis
+
+    monkeypatch.setattr(ws_pubsub, "get_redis_client", fake_client)
+
+
+def test_events_are_routed_to_recipient_channels_and_streams(monkeypatch):
+    assert event_channels({"type": "message_update", "question_id": "q1"}) == [
+        PHARMACISTS_CHANNEL,
+        consultation_channel("q1"),
+    ]
+    assert event_channels({"type": "user_completion", "question_id": "q1"}) == [
+        consultation_channel("q1")
+    ]
+    assert event_channels({"type": "new_question"}) == [PHARMACISTS_CHANNEL]
+    assert event_channels({"type": "question_assigned", "question_id": "q1"}) == [
+        PHARMACISTS_CHANNEL
+    ]
+
+    redis = FakeRedis()
+    use_redis(monkeypatch, redis)
+    bus = WebSocketEventBus(WebSocketConnectionManager())
+    event = {"type": "message_update", "question_id": "q1", "message_data": {"text": "hi"}}
+    assert asyncio.run(bus.publish(event))
+
+    assert [channel for channel, _ in redis.published] == [
+        PHARMACISTS_CHANNEL,
+        consultation_channel("q1"),
+    ]
+    assert redis.published[1][1] == "1000-2 " + json.dumps(event)
+    assert set(redis.streams) == {
+        stream_key(PHARMACISTS_CHANNEL),
+        stream_key(consultation_channel("q1")),
+    }
+
+
+def test_publish_falls_back_to_local_sockets_without_redis(monkeypatch):
+    async def broken_client():
+        raise ConnectionError("redis is down")
+
+    monkeypatch.setattr(ws_pubsub, "get_redis_client", broken_client)
+
+    async def run():
+        manager = WebSocketConnectionManager()
+        bus = WebSocketEventBus(manager)
+        pharmacist = FakeWebSocket()
+        await manager.connect(pharmacist)
+        published = await bus.publish({"type": "question_assigned", "question_id": "q1"})
+        await settle()
+        return published, pharmacist
+
+    published, pharmacist = asyncio.run(run())
+
+    assert published is False
+    assert pharmacist.sent == [{"type": "question_assigned", "question_id": "q1"}]
+
+
+def test_registry_subscribes_only_while_sockets_are_open():
+    async def run():
+        manager = WebSocketConnectionManager()
+        bus = WebSocketEventBus(manager)
+        pubsub = FakePubSub()
+        sync = asyncio.create_task(bus._sync_subscriptions(pubsub))
+
+        pharmacist, user, second_tab = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        await manager.connect(pharmacist)
+        await manager.connect_user(user, "q1")
+        await settle()
+        await manager.connect_user(second_tab, "q1")
+        manager.disconnect_user(user, "q1")
+        await settle()
+        subscribed_while_open = set(bus.subscribed)
+
+        manager.disconnect_user(second_tab, "q1")
+        manager.disconnect(pharmacist)
+        await settle()
+        sync.cancel()
+        return pubsub.commands, subscribed_while_open, bus.subscribed
+
+    commands, subscribed_while_open, subscribed_after = asyncio.run(run())
+
+    assert commands == [
+        ("subscribe", sorted([PHARMACISTS_CHANNEL, consultation_channel("q1")])),
+        ("unsubscribe", sorted([PHARMACISTS_CHANNEL, consultation_channel("q1")])),
+    ]
+    assert subscribed_while_open == {PHARMACISTS_CHANNEL, consultation_channel("q1")}
+    assert subscribed_after == set()
+
+
+def test_received_events_reach_only_local_recipients_with_event_ids():
+    async def run():
+        manager = WebSocketConnectionManager()
+        bus = WebSocketEventBus(manager)
+        pharmacist, user, other_user = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        await manager.connect(pharmacist)
+        await manager.connect_user(user, "q1")
+        await manager.connect_user(other_user, "q2")
+
+        update = {"type": "message_update", "question_id": "q1", "message_data": {"text": "hi"}}
+        assigned = {"type": "question_assigned", "question_id": "q1"}
+        delivered = [
+            await bus.handle(consultation_channel("q1"), "1000-1 " + json.dumps(update)),
+            await bus.handle(PHARMACISTS_CHANNEL, "1000-2 " + json.dumps(assigned)),
+            await bus.handle(consultation_channel("q3"), "1000-1 " + json.dumps(update)),
+        ]
+        await settle()
+        return pharmacist, user, other_user, delivered
+
+    pharmacist, user, other_user, delivered = asyncio.run(run())
+
+    assert delivered == [1, 1, 0]
+    assert user.sent == [
+        {"type": "message_update", "question_id": "q1", "data": {"text": "hi"}, "event_id": "1000-1"}
+    ]
+    assert pharmacist.sent == [{"type": "question_assigned", "question_id": "q1", "event_id": "1000-2"}]
+    assert other_user.sent == []
+
+
+def test_reconnect_replays_only_missed_events_then_live_ones(monkeypatch):
+    redis = FakeRedis()
+    use_redis(monkeypatch, redis)
+    channel = consultation_channel("q1")
+
+    def message(text):
+        return {"type": "message_update", "question_id": "q1", "message_data": {"text": text}}
+
+    for text in ("seen", "missed"):
+        redis.xadd(stream_key(channel), {"event": json.dumps(message(text))})
+
+    async def run():
+        manager = WebSocketConnectionManager()
+        bus = WebSocketEventBus(manager)
+        sync = asyncio.create_task(bus._sync_subscriptions(FakePubSub()))
+        user = FakeWebSocket()
+        await manager.connect_user(user, "q1", replay=True)
+
+        # Живое событие пришло до конца replay и уже есть в стриме
+        racing = message("racing")
+        racing_id = redis.xadd(stream_key(channel), {"event": json.dumps(racing)})
+        await bus.handle(channel, f"{racing_id} {json.dumps(racing)}")
+        await bus.replay(user, last_event_id="1000-1")
+
+        live = message("live")
+        live_id = redis.xadd(stream_key(channel), {"event": json.dumps(live)})
+        await bus.handle(channel, f"{live_id} {json.dumps(live)}")
+        await settle()
+        sync.cancel()
+        return user
+
+    user = asyncio.run(run())
+
+    assert [(m["type"], m.get("data", {}).get("text"), m["event_id"]) for m in user.sent] == [
+        ("message_update", "missed", "1000-2"),
+        ("message_update", "racing", "1000-3"),
+        ("replay_complete", None, "1000-3"),
+        ("message_update", "live", "1000-4"),
+    ]
+
+
+def test_replay_resets_when_missed_events_were_trimmed(monkeypatch):
+    redis = FakeRedis()
+    use_redis(monkeypatch, redis)
+    stream = stream_key(PHARMACISTS_CHANNEL)
+    for _ in range(3):
+        redis.xadd(stream, {"event": json.dumps({"type": "question_assigned"})})
+    del redis.streams[stream][0]  # MAXLEN обрезал 1000-1
+
+    async def run():
+        manager = WebSocketConnectionManager()
+        bus = WebSocketEventBus(manager)
+        sync = asyncio.create_task(bus._sync_subscriptions(FakePubSub()))
+        pharmacist, fresh = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(pharmacist, replay=True)
+        await bus.replay(pharmacist, last_event_id="999-9")
+        await manager.connect(fresh, replay=True)
+        await bus.replay(fresh)
+        await settle()
+        sync.cancel()
+        return pharmacist, fresh
+
+    pharmacist, fresh = asyncio.run(run())
+
+    assert pharmacist.sent == [{"type": "replay_reset", "event_id": "1000-3"}]
+    assert fresh.sent == [{"type": "replay_complete", "event_id": "1000-3", "replayed": 0}]
+
+
+def test_replay_resets_when_subscription_does_not_happen_in_time(monkeypatch):
+    redis = FakeRedis()
+    use_redis(monkeypatch, redis)
+    monkeypatch.setattr(ws_pubsub, "WS_REPLAY_SUBSCRIBE_TIMEOUT", 0.05)
+    channel = consultation_channel("q1")
+    redis.xadd(stream_key(channel), {"event": json.dumps({"type": "message_update"})})
+
+    async def run():
+        manager = WebSocketConnectionManager()
+        bus = WebSocketEventBus(manager)
+        user = FakeWebSocket()
+        # Синхронизация подписок не запущена: SUBSCRIBE так и не выполнен
+        await manager.connect_user(user, "q1", replay=True)
+        await bus.replay(user, last_event_id="1000-1")
+        await settle()
+        return user
+
+    user = asyncio.run(run())
+
+    assert user.sent == [{"type": "replay_reset", "event_id": None}]
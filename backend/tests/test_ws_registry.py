@@ -0,0 +1,102 @@
+"""
+Tests for the WebSocket registry: role indexes, per-connection send queues
+and slow-consumer eviction.
+"""
+
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import services.ws_registry as ws_registry
+from services.ws_registry import WebSocketConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.sent = []
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_broadcasts_reach_only_their_role_index():
+    async def run():
+        manager = WebSocketConnectionManager()
+        pharmacist, user, other_user = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        await manager.connect(pharmacist)
+        await manager.connect_user(user, "q1")
+        await manager.connect_user(other_user, "q2")
+
+        await manager.broadcast_new_question({"uuid": "q3"})
+        delivered = await manager.broadcast_message_update("q1", {"text": "hi"})
+        await settle()
+        return manager, pharmacist, user, other_user, delivered
+
+    manager, pharmacist, user, other_user, delivered = asyncio.run(run())
+
+    assert [m["type"] for m in pharmacist.sent] == ["new_question", "message_update"]
+    assert user.sent == [{"type": "message_update", "question_id": "q1", "data": {"text": "hi"}}]
+    assert other_user.sent == []
+    assert delivered == 2
+    assert len(manager.active_connections) == 3
+
+
+def test_slow_consumer_is_evicted_without_stalling_others():
+    async def run():
+        manager = WebSocketConnectionManager(queue_size=2)
+        fast, slow = FakeWebSocket(), FakeWebSocket(delay=10)
+        await manager.connect(fast)
+        await manager.connect(slow)
+
+        for i in range(4):
+            await manager.broadcast({"type": "tick", "i": i})
+            await settle()
+        return manager, fast, slow
+
+    manager, fast, slow = asyncio.run(run())
+
+    assert [m["i"] for m in fast.sent] == [0, 1, 2, 3]
+    assert slow.close_code == ws_registry.WS_SLOW_CONSUMER_CLOSE_CODE
+    assert list(manager.pharmacist_connections) == [fast]
+
+
+def test_send_timeout_evicts_and_disconnect_cleans_indexes(monkeypatch):
+    monkeypatch.setattr(ws_registry, "WS_SEND_TIMEOUT", 0.01)
+
+    async def run():
+        manager = WebSocketConnectionManager()
+        stuck, user = FakeWebSocket(delay=1), FakeWebSocket()
+        await manager.connect_user(stuck, "q1")
+        await manager.connect_user(user, "q1")
+
+        await manager.broadcast_to_consultation("q1", {"type": "ping"})
+        await asyncio.sleep(0.05)
+        evicted = stuck.close_code
+        manager.disconnect_user(user, "q1")
+        return manager, evicted
+
+    manager, evicted = asyncio.run(run())
+
+    assert evicted == ws_registry.WS_SLOW_CONSUMER_CLOSE_CODE
+    assert manager.consultation_connections == {}
+    assert len(manager.active_connections) == 0
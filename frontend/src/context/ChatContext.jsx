@@ -32,6 +32,8 @@ export function ChatProvider({ children }) {
   );
   const pollingRef = useRef(null);
   const wsRef = useRef(null);
+  // event_id of the last received event — server replays the delta on reconnect
+  const lastEventIdRef = useRef(null);
   const wsReconnectRef = useRef(null);
   const wsConnectedRef = useRef(false);
 
@@ -82,6 +84,7 @@ export function ChatProvider({ children }) {
     }
 
     let mounted = true;
+    lastEventIdRef.current = null;
 
     const connectWs = () => {
       if (
@@ -96,8 +99,11 @@ export function ChatProvider({ children }) {
       // Anonymous users can also use WebSocket — user_chat_websocket requires no auth
       // The server endpoint /api/ws/chat/{consultation_id} accepts connections without token
       try {
+        const replayQuery = lastEventIdRef.current
+          ? `?last_event_id=${encodeURIComponent(lastEventIdRef.current)}`
+          : '';
         const ws = new WebSocket(
-          `${wsBaseUrl}/${currentConsultationId}`,
+          `${wsBaseUrl}/${currentConsultationId}${replayQuery}`,
         );
         wsRef.current = ws;
 
@@ -112,6 +118,18 @@ export function ChatProvider({ children }) {
         ws.onmessage = (event) => {
           try {
             const data = JSON.parse(event.data);
+            if (data.event_id) {
+              lastEventIdRef.current = data.event_id;
+            }
+
+            if (data.type === 'replay_reset') {
+              // Missed events are no longer available — reload the dialog
+              chatService
+                .fetchMessages(currentConsultationId, isAnonymous, false)
+                .then(setMessages)
+                .catch(() => {});
+            }
+
             if (data.type === 'message_update') {
               const msg = data.data;
               if (!msg || !msg.uuid) {
@@ -166,11 +166,21 @@ export default function QuestionsList({
       },
     );
 
+    // Missed events are no longer available for replay — reload the list
+    const unsubscribeReset = websocketService.on(
+      'replay_reset',
+      () => {
+        lastLoadRef.current = 0;
+        loadQuestions();
+      },
+    );
+
     return () => {
       unsubscribeNew();
       unsubscribeUpdate();
       unsubscribeAssigned();
       unsubscribeCompleted();
+      unsubscribeReset();
       if (newQuestionsTimerRef.current) {
         clearTimeout(newQuestionsTimerRef.current);
       }
@@ -36,6 +36,8 @@ class WebSocketService {
     this.reconnectAttempts = 0;
     this.eventHandlers = new Map();
     this.isConnected = false;
+    // event_id of the last received event — server replays the delta on reconnect
+    this.lastEventId = null;
   }
 
   /**
@@ -57,9 +59,13 @@ class WebSocketService {
     const token = localStorage.getItem(
       'pharmacist_session_token',
     );
-    return token
-      ? `${baseUrl}?token=${encodeURIComponent(token)}`
-      : baseUrl;
+    const params = new URLSearchParams();
+    if (token) params.set('token', token);
+    if (this.lastEventId) {
+      params.set('last_event_id', this.lastEventId);
+    }
+    const query = params.toString();
+    return query ? `${baseUrl}?${query}` : baseUrl;
   }
 
   /**
@@ -93,6 +99,9 @@ class WebSocketService {
         try {
           const data = JSON.parse(event.data);
           logger.debug('WebSocket message received:', data);
+          if (data?.event_id) {
+            this.lastEventId = data.event_id;
+          }
 
           const normalized =
             normalizeWebSocketMessage(data);
@@ -209,6 +218,7 @@ class WebSocketService {
       this.ws.close();
       this.ws = null;
       this.isConnected = false;
+      this.lastEventId = null;
       this.eventHandlers.clear();
       logger.info('WebSocket disconnected');
     }